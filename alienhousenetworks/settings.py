@@ -204,6 +204,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.PrecompressedStaticMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -253,6 +254,18 @@ except Exception:
         }
     }
 
+# Cache
+# Must be shared by all workers (file-based by default, Redis/Memcached in production
+# via CACHE_BACKEND/CACHE_LOCATION) so content-version bumps reach every process.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('CACHE_LOCATION', default=str(BASE_DIR / '.cache' / 'django')),
+    }
+}
+CONTENT_CACHE_ALIAS = 'default'
+CONTENT_CACHE_TIMEOUT = config('CONTENT_CACHE_TIMEOUT', default=60 * 60 * 24, cast=int)
+
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -271,11 +284,63 @@ USE_TZ = True
 # Static files
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'  # collectstatic destination
+# collectstatic writes .br/.gz siblings of compressible files (core.static_compression), using this many processes.
+STATIC_COMPRESSION_WORKERS = config('STATIC_COMPRESSION_WORKERS', default=0, cast=int) or None  # None: all cores
+# Serve STATIC_ROOT from Django, precompressed and with immutable caching, when no web server in front handles /static/.
+STATIC_SERVE = config('STATIC_SERVE', default=False, cast=bool)
 
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Optimized images are stored by content hash (core.storage), so identical files are kept once;
+# other uploads (resumes, videos) keep their upload_to directories and names.
+STORAGES = {
+    'default': {'BACKEND': config('MEDIA_STORAGE_BACKEND', default='django.core.files.storage.FileSystemStorage')},
+    'optimized_images': {'BACKEND': config('IMAGE_STORAGE_BACKEND', default='core.storage.ContentAddressedStorage')},
+    'staticfiles': {'BACKEND': 'core.storage.HashedStaticFilesStorage'},
+}
+
+# Image optimization
+# Uploads are queued for the `manage.py process_image_jobs` worker (installed as a systemd
+# service by deploy.sh). IMAGE_OPTIMIZATION_ASYNC=False optimizes them in the request
+# instead, right after the save (e.g. local development without the worker).
+IMAGE_OPTIMIZATION_ASYNC = config('IMAGE_OPTIMIZATION_ASYNC', default=True, cast=bool)
+IMAGE_OPTIMIZATION_QUALITY = config('IMAGE_OPTIMIZATION_QUALITY', default=80, cast=int)
+# Decode budget: larger uploads are downscaled to about this many pixels while decoding
+# (JPEGs via draft mode), bounding worker memory. Uploads over IMAGE_MAX_SOURCE_PIXELS
+# are rejected when the model is validated, before anything is decoded.
+IMAGE_MAX_PIXELS = config('IMAGE_MAX_PIXELS', default=12_000_000, cast=int)
+IMAGE_MAX_SOURCE_PIXELS = config('IMAGE_MAX_SOURCE_PIXELS', default=100_000_000, cast=int)
+# Widths (px) of the downscaled renditions generated for srcset; never upscaled.
+IMAGE_RENDITION_WIDTHS = (320, 640, 1280, 1920)
+# Formats generated for every optimized image, best first (WebP is always kept as the
+# <img src> fallback), and per-format Pillow save() options.
+IMAGE_OUTPUT_FORMATS = ('avif', 'webp')
+IMAGE_ENCODING_OPTIONS = {
+    'webp': {'quality': IMAGE_OPTIMIZATION_QUALITY},
+    'avif': {'quality': config('IMAGE_AVIF_QUALITY', default=55, cast=int), 'speed': 6},
+}
+
+# Geocoding (Location coordinates), run by `manage.py geocode_locations`.
+# GEOCODING_PROVIDER is the provider class; GEOCODING_OPTIONS are its arguments
+# (point `url` at a stub server in tests).
+GEOCODING_PROVIDER = config('GEOCODING_PROVIDER', default='core.geocoding.NominatimProvider')
+GEOCODING_OPTIONS = {
+    'url': config('GEOCODING_URL', default='https://nominatim.openstreetmap.org/search'),
+    'user_agent': config('GEOCODING_USER_AGENT', default='alienhousenetworks.com geocoder'),
+    'timeout': config('GEOCODING_TIMEOUT', default=5.0, cast=float),
+    'min_interval': config('GEOCODING_MIN_INTERVAL', default=1.0, cast=float),  # Nominatim: max 1 request/second
+}
+
+# Site search (core/site_search.py): where the in-memory index is persisted so
+# workers can load it at startup. Must be on storage shared by all workers.
+SITE_SEARCH_INDEX_PATH = config('SITE_SEARCH_INDEX_PATH', default=str(BASE_DIR / '.cache' / 'site_search.idx'))
+
+# LMS dashboard: read the header stats from the per-status rollup table
+# (EnrollmentStatusTotal) instead of aggregating the enrollments table.
+LMS_STATS_ROLLUP = config('LMS_STATS_ROLLUP', default=True, cast=bool)
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -283,3 +348,13 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 RAZORPAY_KEY_ID = config('RAZORPAY_KEY_ID', default='rzp_test_dummykeyid')
 RAZORPAY_KEY_SECRET = config('RAZORPAY_KEY_SECRET', default='dummypaymentsecret')
 
+# Payment gateway for training enrollments (core/payments.py). PAYMENT_GATEWAY
+# is the gateway class (core.payments.StubGateway for tests and offline
+# development: no network); PAYMENT_GATEWAY_OPTIONS are its arguments.
+PAYMENT_GATEWAY = config('PAYMENT_GATEWAY', default='core.payments.RazorpayGateway')
+PAYMENT_GATEWAY_OPTIONS = {
+    'connect_timeout': config('PAYMENT_CONNECT_TIMEOUT', default=3.05, cast=float),
+    'read_timeout': config('PAYMENT_READ_TIMEOUT', default=10.0, cast=float),
+    'retries': config('PAYMENT_RETRIES', default=2, cast=int),  # connection failures only
+}
+
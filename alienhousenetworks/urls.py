@@ -15,9 +15,10 @@ class FaviconRedirectView(RedirectView):
         return '/static/favicon.ico'
 
 urlpatterns = [
+    # Before admin/, whose catch-all would otherwise 404 the LMS dashboard URLs.
+    path('', include('core.urls')),
     path('admin/', admin.site.urls),
     path('favicon.ico', FaviconRedirectView.as_view()),
-    path('', include('core.urls')),
     path('game/', include('game.urls')),
 ]
 
@@ -1,4 +1,8 @@
+import csv
+from itertools import chain
+
 from django.contrib import admin
+from django.http import StreamingHttpResponse
 from django.utils.html import format_html
 from django.db import models
 from .models import (
@@ -6,14 +10,14 @@ from .models import (
     ServiceModule, TeamMemberPortfolio, ClientTicker, TacticalAdvantage,
     Project, LabExperiment,
     Service, SubService, BusinessTeamMember, Testimonial,
-    Location, ContactMessage, ContactInfo,
+    Location, GeocodeResult, ContactMessage, ContactInfo,
     ClientLogo, AboutUs,
     CompanyPage, PageSection, CTA,
     AboutUsPage, AboutUsSection, AboutUsGalleryImage,
     WhatsNewItem, CustomerStory, EventItem,
     JobPost, JobApplication, JobField,
     TrainingField, TrainingSubField, TrainingPackage, ReferralCode, TrainingEnrollment,
-    TrainingIntroSection, SalesPerson
+    TrainingIntroSection, SalesPerson, ImageOptimizationJob
 )
 
 # ============================================================
@@ -35,6 +39,65 @@ class ImagePreviewMixin:
         return "-"
     image_preview.short_description = "Preview"
 
+
+class _Echo:
+    """
+    Write-only file object that hands each CSV row straight back to the caller,
+    so rows can be streamed instead of collected in a buffer.
+    """
+    def write(self, value):
+        return value
+
+
+class CSVExportMixin:
+    """
+    "Export selected to CSV" action that streams rows as they are read.
+
+    The queryset is read in chunks with iterator(), so memory stays flat no
+    matter how many rows are selected, and foreign keys are joined up front via
+    select_related instead of being loaded one query per row. Set
+    `export_select_related` when a related object's __str__ follows further
+    relations.
+    """
+    export_fields = None  # Default: every concrete field.
+    export_select_related = None  # Default: every exported foreign key.
+    export_chunk_size = 2000
+    actions = ['export_as_csv']
+
+    def get_export_fields(self):
+        meta = self.model._meta
+        if self.export_fields:
+            return [meta.get_field(name) for name in self.export_fields]
+        return [field for field in meta.concrete_fields]
+
+    def export_value(self, obj, field):
+        value = getattr(obj, field.name)
+        if value is None:
+            return ''
+        value = str(value)
+        # Keep spreadsheet apps from evaluating user-submitted text as a formula.
+        if value[:1] in ('=', '+', '-', '@', '\t', '\r') and field.get_internal_type() in ('CharField', 'TextField', 'EmailField'):
+            value = "'" + value
+        return value
+
+    @admin.action(description="Export selected to CSV")
+    def export_as_csv(self, request, queryset):
+        fields = self.get_export_fields()
+        related = self.export_select_related
+        if related is None:
+            related = [field.name for field in fields if field.many_to_one or field.one_to_one]
+        rows = queryset.select_related(*related).iterator(chunk_size=self.export_chunk_size)
+
+        writer = csv.writer(_Echo())
+        header = [field.name for field in fields]
+        lines = chain(
+            [writer.writerow(header)],
+            (writer.writerow([self.export_value(obj, field) for field in fields]) for obj in rows),
+        )
+        response = StreamingHttpResponse(lines, content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{self.model._meta.model_name}.csv"'
+        return response
+
 # ============================================================
 # INLINES
 # ============================================================
@@ -217,7 +280,7 @@ class LocationAdmin(admin.ModelAdmin):
             'fields': ('name', 'address', 'is_active')
         }),
         ("Geography", {
-            'description': "Coordinates run via API or you can manually enter them. Set Google Maps URL.",
+            'description': "Coordinates are filled in by `manage.py geocode_locations` (or instantly if the address was geocoded before), or you can manually enter them. Set Google Maps URL.",
             'fields': ('latitude', 'longitude', 'google_map_link')
         }),
         ("Advanced", {
@@ -226,8 +289,15 @@ class LocationAdmin(admin.ModelAdmin):
         }),
     )
 
+@admin.register(GeocodeResult)
+class GeocodeResultAdmin(admin.ModelAdmin):
+    list_display = ('query', 'latitude', 'longitude', 'provider', 'updated_at')
+    search_fields = ('query', 'display_name')
+    list_filter = ('provider',)
+    readonly_fields = ('created_at', 'updated_at')
+
 @admin.register(ContactMessage)
-class ContactMessageAdmin(admin.ModelAdmin):
+class ContactMessageAdmin(CSVExportMixin, admin.ModelAdmin):
     list_display = ('name', 'email', 'created_at', 'location')
     readonly_fields = ('name', 'email', 'phone', 'message', 'user_lat', 'user_lon', 'distance_km', 'location', 'created_at')
     list_filter = ('location', 'created_at')
@@ -537,9 +607,6 @@ class CTAAdmin(admin.ModelAdmin):
 # 9. JOB BOARD ADMIN
 # ============================================================
 
-import csv
-from django.http import HttpResponse
-
 @admin.register(JobField)
 class JobFieldAdmin(admin.ModelAdmin):
     list_display = ('name', 'is_active')
@@ -569,12 +636,11 @@ class JobPostAdmin(admin.ModelAdmin):
     )
 
 @admin.register(JobApplication)
-class JobApplicationAdmin(admin.ModelAdmin):
+class JobApplicationAdmin(CSVExportMixin, admin.ModelAdmin):
     list_display = ('full_name', 'job', 'email', 'phone', 'applied_at', 'download_resume')
     list_filter = ('job', 'applied_at')
     search_fields = ('full_name', 'email', 'phone', 'job__title')
     readonly_fields = ('applied_at',)
-    actions = ["export_as_csv"]
 
     def download_resume(self, obj):
         if obj.resume:
@@ -582,22 +648,6 @@ class JobApplicationAdmin(admin.ModelAdmin):
         return "No Resume"
     download_resume.short_description = "Resume"
 
-    def export_as_csv(self, request, queryset):
-        meta = self.model._meta
-        field_names = [field.name for field in meta.fields]
-
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename={}.csv'.format(meta)
-        writer = csv.writer(response)
-
-        writer.writerow(field_names)
-        for obj in queryset:
-            row = writer.writerow([getattr(obj, field) for field in field_names])
-
-        return response
-
-    export_as_csv.short_description = "Export selected applications to CSV"
-
 
 # ============================================================
 # 10. INDUSTRY TRAINING SYSTEM ADMIN
@@ -653,7 +703,7 @@ class SalesPersonAdmin(admin.ModelAdmin):
     )
 
 @admin.register(ReferralCode)
-class ReferralCodeAdmin(admin.ModelAdmin):
+class ReferralCodeAdmin(CSVExportMixin, admin.ModelAdmin):
     list_display = ('code', 'sales_person', 'discount_percentage', 'commission_percentage', 'is_active', 'usage_count')
     list_filter = ('is_active', 'sales_person')
     search_fields = ('code', 'sales_person__name', 'sales_person__email')
@@ -675,11 +725,13 @@ class ReferralCodeAdmin(admin.ModelAdmin):
     )
     
 @admin.register(TrainingEnrollment)
-class TrainingEnrollmentAdmin(admin.ModelAdmin):
+class TrainingEnrollmentAdmin(CSVExportMixin, admin.ModelAdmin):
     list_display = ('full_name', 'email', 'package', 'referral_code', 'final_price', 'payment_status', 'enrollment_date')
     list_filter = ('payment_status', 'field', 'sub_field', 'package', 'enrollment_date')
     search_fields = ('full_name', 'email', 'phone', 'college_name', 'referral_code__code')
     readonly_fields = ('enrollment_date', 'original_price', 'discount_applied', 'final_price')
+    # SubField and Package names include their parent's name.
+    export_select_related = ('field', 'sub_field__field', 'package__sub_field', 'referral_code')
     
     fieldsets = (
         ("👤 Student Personal Information", {
@@ -730,3 +782,26 @@ class TrainingIntroSectionAdmin(admin.ModelAdmin, ImagePreviewMixin):
     def has_add_permission(self, request):
         return not TrainingIntroSection.objects.exists()
 
+
+# ============================================================
+# MEDIA PROCESSING
+# ============================================================
+
+@admin.register(ImageOptimizationJob)
+class ImageOptimizationJobAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'source_name', 'status', 'attempts', 'source_size', 'optimized_size', 'batch', 'created_at', 'updated_at')
+    list_filter = ('status', 'content_type', 'batch')
+    search_fields = ('source_name', 'error')
+    readonly_fields = (
+        'content_type', 'object_id', 'field_name', 'source_name', 'batch', 'attempts', 'error',
+        'source_size', 'optimized_size', 'created_at', 'updated_at',
+    )
+    actions = ['retry_jobs']
+
+    def has_add_permission(self, request):
+        return False # Jobs are queued automatically when images are uploaded
+
+    @admin.action(description="Retry selected jobs")
+    def retry_jobs(self, request, queryset):
+        count = queryset.exclude(status=ImageOptimizationJob.PENDING).update(status=ImageOptimizationJob.PENDING, attempts=0, error='')
+        self.message_user(request, f"{count} job(s) queued for another attempt.")
@@ -0,0 +1,161 @@
+"""
+Versioned content cache.
+
+Every core model gets a "content version" counter in the shared cache backend.
+The counter is bumped by post_save/post_delete signals (see core/signals.py), so
+a snapshot keyed on the versions of the models it reads is invalidated the
+moment any of them change — no explicit purging, no stale reads.
+
+Note: queryset.update() / bulk_create() / bulk_update() do not send signals.
+Code that uses them must call bump_content_version() itself.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.template.response import TemplateResponse
+from django.utils.cache import patch_vary_headers
+
+VERSION_KEY_PREFIX = 'content-version'
+SNAPSHOT_KEY_PREFIX = 'snapshot'
+
+
+def get_cache():
+    return caches[getattr(settings, 'CONTENT_CACHE_ALIAS', 'default')]
+
+
+def _timeout(timeout):
+    if timeout is None:
+        return getattr(settings, 'CONTENT_CACHE_TIMEOUT', 60 * 60 * 24)
+    return timeout
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def _version_key(model):
+    return f'{VERSION_KEY_PREFIX}:{_label(model)}'
+
+
+def content_versions(models):
+    """
+    Returns {model_label: version} for the given models in one cache round trip.
+    Missing counters are seeded from the clock so that a counter evicted from
+    the cache can never fall back to a value an old snapshot was stored under.
+    """
+    cache = get_cache()
+    keys = {_version_key(m): _label(m) for m in models}
+    found = cache.get_many(keys.keys())
+
+    versions = {}
+    for key, label in keys.items():
+        version = found.get(key)
+        if version is None:
+            cache.add(key, time.time_ns(), timeout=None)
+            version = cache.get(key)
+        versions[label] = version
+    return versions
+
+
+def content_version(models):
+    """
+    A short, stable token that changes whenever any of the given models change.
+    """
+    versions = content_versions(models)
+    raw = ';'.join(f'{label}={versions[label]}' for label in sorted(versions))
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+def _bump(model):
+    cache = get_cache()
+    key = _version_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Counter was never seeded (or was evicted); start a fresh one.
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def bump_content_version(model):
+    """
+    Invalidates every snapshot that depends on `model`.
+    Deferred until the surrounding transaction commits so that a concurrent
+    request cannot rebuild a snapshot from not-yet-committed data.
+    """
+    transaction.on_commit(lambda: _bump(model))
+
+
+def cached_snapshot(name, models, builder, timeout=None):
+    """
+    Returns the cached result of `builder()` for the current content version of
+    `models`, building and storing it on a miss.
+    The result must be picklable (model instances and evaluated lists are fine;
+    evaluate querysets with list() inside the builder).
+    """
+    cache = get_cache()
+    key = f'{SNAPSHOT_KEY_PREFIX}:{name}:{content_version(models)}'
+
+    data = cache.get(key)
+    if data is None:
+        data = builder()
+        cache.set(key, data, _timeout(timeout))
+    return data
+
+
+# ------------------------------------------------------------
+# Whole-page cache for anonymous visitors
+# ------------------------------------------------------------
+
+# Rendered into the cached HTML in place of the CSRF token and swapped for the
+# visitor's own token on every response ("hole punching").
+CSRF_TOKEN_PLACEHOLDER = 'csrf-token-placeholder-3b9d2f7a'
+
+
+def _is_page_cacheable(request):
+    return (
+        request.method in ('GET', 'HEAD')
+        and not request.GET
+        and not request.user.is_authenticated
+    )
+
+
+def cache_anonymous_page(name, models, timeout=None):
+    """
+    Caches the rendered HTML of a view for anonymous GET requests, keyed on the
+    content version of `models` (so any admin edit invalidates it).
+    The view must return a TemplateResponse: its context gets the CSRF
+    placeholder before rendering, and the per-request token is injected on
+    every hit, so forms on the page keep working.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not _is_page_cacheable(request):
+                return view(request, *args, **kwargs)
+
+            cache = get_cache()
+            # Host/scheme are part of the key because the page renders absolute URLs.
+            key = f'page:{name}:{request.scheme}:{request.get_host()}:{content_version(models)}'
+
+            cached = cache.get(key)
+            if cached is None:
+                response = view(request, *args, **kwargs)
+                if not isinstance(response, TemplateResponse) or response.status_code != 200:
+                    return response
+                response.context_data = {**(response.context_data or {}), 'csrf_token': CSRF_TOKEN_PLACEHOLDER}
+                response.render()
+                cached = {'content': response.content, 'content_type': response['Content-Type']}
+                cache.set(key, cached, _timeout(timeout))
+
+            content = cached['content'].replace(CSRF_TOKEN_PLACEHOLDER.encode(), get_token(request).encode())
+            response = HttpResponse(content, content_type=cached['content_type'])
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapper
+    return decorator
@@ -1,27 +1,46 @@
-from .models import Service, SiteConfiguration, SiteSettings, FooterLink, ContactInfo, CompanyPage
+from .models import Service, SubService, SiteConfiguration, SiteSettings, FooterLink, ContactInfo, CompanyPage
 from .forms import ContactForm
+from .cache import cached_snapshot
 
-def global_site_data(request):
-    config = SiteConfiguration.objects.first()
-    
+# Every model read by the header/footer. Saving or deleting any of them
+# bumps its content version and invalidates the cached snapshot.
+SITE_CHROME_MODELS = (SiteConfiguration, Service, SubService, SiteSettings, FooterLink, ContactInfo, CompanyPage)
+
+
+def _build_site_chrome():
     # SYSTEM UPGRADE: Use prefetch_related to get sub_services efficiently
     # This allows us to loop through them in the HTML without extra database hits
-    all_services = Service.objects.filter(is_active=True).prefetch_related('sub_services')
-    settings = SiteSettings.objects.first()
-    services_links = FooterLink.objects.filter(category='services')
-    company_links = FooterLink.objects.filter(category='company')
-    social_links = FooterLink.objects.filter(category='social')
-    contacts = ContactInfo.objects.all()
-    company_pages = CompanyPage.objects.filter(is_active=True)
+    # (the prefetched rows are pickled along with each Service in the snapshot)
+    footer_links = list(FooterLink.objects.all())
+
+    return {
+        'config': SiteConfiguration.objects.first(),
+        'all_services': list(Service.objects.filter(is_active=True).prefetch_related('sub_services')),
+        'settings': SiteSettings.objects.first(),
+        'services_links': [link for link in footer_links if link.category == 'services'],
+        'company_links': [link for link in footer_links if link.category == 'company'],
+        'social_links': [link for link in footer_links if link.category == 'social'],
+        'contacts': list(ContactInfo.objects.all()),
+        'company_pages': list(CompanyPage.objects.filter(is_active=True)),
+    }
+
+
+def get_site_chrome():
+    # Cache hit = zero queries; the snapshot is rebuilt only after a content change.
+    return cached_snapshot('site-chrome', SITE_CHROME_MODELS, _build_site_chrome)
+
+
+def site_configuration():
+    """
+    The SiteConfiguration row (or None) from the site chrome snapshot.
+    """
+    return get_site_chrome()['config']
+
+
+def global_site_data(request):
+    site_chrome = get_site_chrome()
 
     return {
-        'config': config,
-        'all_services': all_services,
-        'settings': settings,
-        'services_links': services_links,
-        'company_links': company_links,
-        'social_links': social_links,
-        'contacts': contacts,
-        'company_pages': company_pages,
+        **site_chrome,
         'global_contact_form': ContactForm(),
     }
@@ -0,0 +1,111 @@
+"""
+Training enrollment statistics for the LMS dashboard.
+
+`enrollment_stats()` computes the header figures for any (searched/filtered)
+enrollment queryset in one conditional-aggregate query. For the unfiltered and
+status-filtered views the figures come from EnrollmentStatusTotal instead: one
+row per payment status, kept current by the TrainingEnrollment signals in
+core/signals.py, so reading them costs the same however many enrollments
+exist.
+
+Note: queryset.update() / bulk_create() / bulk_update() do not send signals.
+Code that uses them on TrainingEnrollment must call rebuild_rollup() itself
+(or run `manage.py rebuild_enrollment_stats`).
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+
+COMPLETED = 'COMPLETED'
+PENDING = 'PENDING'
+
+
+def _stats(enrolled, paid, pending, revenue):
+    return {
+        'total_enrolled': enrolled,
+        'total_paid': paid,
+        'total_pending': pending,
+        'total_revenue': revenue or Decimal('0.00'),
+    }
+
+
+def enrollment_stats(queryset):
+    """
+    Dashboard header figures for `queryset`, in a single query.
+    """
+    totals = queryset.aggregate(
+        enrolled=Count('pk'),
+        paid=Count('pk', filter=Q(payment_status=COMPLETED)),
+        pending=Count('pk', filter=Q(payment_status=PENDING)),
+        revenue=Sum('final_price', filter=Q(payment_status=COMPLETED)),
+    )
+    return _stats(totals['enrolled'], totals['paid'], totals['pending'], totals['revenue'])
+
+
+def rebuild_rollup():
+    """
+    Recomputes EnrollmentStatusTotal from the enrollments table.
+    """
+    from .models import EnrollmentStatusTotal, TrainingEnrollment
+
+    totals = {
+        row['payment_status']: row
+        for row in TrainingEnrollment.objects.order_by().values('payment_status').annotate(
+            count=Count('pk'), revenue=Sum('final_price'),
+        )
+    }
+    statuses = {status for status, label in TrainingEnrollment.PAYMENT_STATUS_CHOICES} | totals.keys()
+    with transaction.atomic():
+        for status in statuses:
+            row = totals.get(status, {})
+            EnrollmentStatusTotal.objects.update_or_create(
+                payment_status=status,
+                defaults={'count': row.get('count', 0), 'revenue': row.get('revenue') or 0},
+            )
+        EnrollmentStatusTotal.objects.exclude(payment_status__in=statuses).delete()
+
+
+def rollup_stats(status=None):
+    """
+    Dashboard header figures for all enrollments, or only those with payment
+    status `status`, read from the rollup table. Built on first use.
+    """
+    from .models import EnrollmentStatusTotal, TrainingEnrollment
+
+    rows = {row.payment_status: row for row in EnrollmentStatusTotal.objects.all()}
+    if any(choice not in rows for choice, label in TrainingEnrollment.PAYMENT_STATUS_CHOICES):
+        rebuild_rollup()
+        rows = {row.payment_status: row for row in EnrollmentStatusTotal.objects.all()}
+
+    if status:
+        rows = {status: rows[status]} if status in rows else {}
+    count = {key: row.count for key, row in rows.items()}
+    return _stats(
+        sum(count.values()), count.get(COMPLETED, 0), count.get(PENDING, 0),
+        rows[COMPLETED].revenue if COMPLETED in rows else None,
+    )
+
+
+def apply_rollup_change(old, new):
+    """
+    Moves one enrollment between rollup rows. `old` and `new` are
+    (payment_status, final_price) before and after the change, None for a
+    created or deleted enrollment. Rows that do not exist yet are left for
+    rollup_stats() to build.
+    """
+    from .models import EnrollmentStatusTotal
+
+    if old == new:
+        return
+    deltas = {}
+    for state, sign in ((old, -1), (new, 1)):
+        if state is not None:
+            status, price = state
+            count, revenue = deltas.get(status, (0, 0))
+            deltas[status] = (count + sign, revenue + sign * Decimal(str(price or 0)))
+    for status, (count, revenue) in deltas.items():
+        if count or revenue:
+            EnrollmentStatusTotal.objects.filter(payment_status=status).update(
+                count=F('count') + count, revenue=F('revenue') + revenue,
+            )
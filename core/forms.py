@@ -30,8 +30,11 @@ class JobApplicationForm(forms.ModelForm):
 class ContactForm(forms.ModelForm):
     class Meta:
         model = ContactMessage
-        fields = ['name', 'phone', 'email', 'company', 'message']
+        fields = ['name', 'phone', 'email', 'company', 'message', 'user_lat', 'user_lon']
         widgets = {
+            # Filled in only when the visitor clicks "Use my location"; used to pick the closest office.
+            'user_lat': forms.HiddenInput(),
+            'user_lon': forms.HiddenInput(),
             'name': forms.TextInput(attrs={
                 'class': 'w-full bg-black/50 border border-alien/20 rounded-none px-4 py-3 text-white placeholder-gray-600 focus:outline-none focus:border-alien focus:ring-1 focus:ring-alien transition-all font-mono text-sm',
                 'placeholder': 'NAME'
@@ -54,6 +57,18 @@ class ContactForm(forms.ModelForm):
             }),
         }
 
+    def clean_user_lat(self):
+        lat = self.cleaned_data.get('user_lat')
+        if lat is not None and not -90 <= lat <= 90:
+            raise forms.ValidationError("Latitude must be between -90 and 90.")
+        return lat
+
+    def clean_user_lon(self):
+        lon = self.cleaned_data.get('user_lon')
+        if lon is not None and not -180 <= lon <= 180:
+            raise forms.ValidationError("Longitude must be between -180 and 180.")
+        return lon
+
 from .models import TrainingEnrollment, ReferralCode
 
 class TrainingEnrollmentForm(forms.ModelForm):
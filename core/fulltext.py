@@ -0,0 +1,402 @@
+"""
+Full-text search for job posts and training enrollments.
+
+Each entry in SEARCH_INDEXES gets a database-side index that the database
+itself keeps current, so saves, queryset.update() and bulk_create() are all
+covered without signals:
+
+- PostgreSQL: a `search_vector` tsvector column with a GIN index, filled in
+  by a row trigger, plus pg_trgm GIN indexes on the `trigram` fields so
+  substring searches (parts of an email or phone number) are index scans
+  too. A trigger rather than a generated column, because PostgreSQL refuses
+  to change the type of a column a generated column reads, which would make
+  any later AlterField on an indexed field fail migrate.
+- SQLite: an external-content FTS5 table kept in sync by triggers.
+- Any other database: icontains over the fields, unranked.
+
+ensure_search_schema() creates the indexes after every migrate (see
+core/signals.py), converting a generated column left by an earlier version.
+`manage.py rebuild_search_index` drops and rebuilds them (after changing
+SEARCH_INDEXES). An index the database refuses (no privilege to alter the table or create the
+pg_trgm extension, SQLite built without FTS5, ...) is logged and skipped
+rather than failing migrate; searches on it fall back to icontains.
+
+search() returns matches ranked best first, annotated with `search_rank` and
+`<field>_highlight` strings in which matched terms are wrapped in
+HIGHLIGHT_START/HIGHLIGHT_END (render them with the `highlight_marks`
+filter from search_tags). search_filter() only narrows a queryset, keeping
+its ordering.
+"""
+import logging
+import re
+
+from django.apps import apps
+from django.db import DatabaseError, connections, transaction
+from django.db.models import BooleanField, F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+# Private-use characters: never in real text, safe in SQL string parameters.
+HIGHLIGHT_START = '\ue000'
+HIGHLIGHT_END = '\ue001'
+
+SEARCH_INDEXES = {
+    'jobs': {
+        'model': 'core.JobPost',
+        # Field -> weight (A highest).
+        'fields': {'title': 'A', 'location': 'B', 'description': 'C'},
+        'config': 'english',  # PostgreSQL text search configuration
+        'tokenize': 'porter unicode61',  # FTS5 tokenizer
+        'trigram': (),
+    },
+    'enrollments': {
+        'model': 'core.TrainingEnrollment',
+        'fields': {'full_name': 'A', 'email': 'A', 'phone': 'A'},
+        'config': 'simple',
+        # Substring matching (any 3+ characters of an email or phone number).
+        'tokenize': 'trigram',
+        'trigram': ('full_name', 'email', 'phone'),
+    },
+}
+
+logger = logging.getLogger(__name__)
+
+SEARCH_VECTOR_COLUMN = 'search_vector'
+BM25_WEIGHTS = {'A': 10.0, 'B': 4.0, 'C': 2.0, 'D': 1.0}
+SNIPPET_WORDS = 24
+MAX_TERMS = 8
+
+# (database alias, model label) -> which parts of its index exist; looked up
+# once per process (see _index_features()).
+_features = {}
+
+
+def _spec(index):
+    spec = SEARCH_INDEXES[index]
+    return spec, apps.get_model(spec['model'])
+
+
+def _fts_table(model):
+    return f'{model._meta.db_table}_fts'
+
+
+def _terms(query):
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+# ------------------------------------------------------------
+# Schema
+# ------------------------------------------------------------
+
+def _postgres_catalog(cursor, table):
+    """
+    {'column': `table` has the search vector column, 'generated': it is a
+    generated column, 'trigger': the trigger filling it exists, 'indexes':
+    the names of the table's indexes, 'trigram': pg_trgm is installed}.
+    """
+    cursor.execute(
+        'SELECT EXISTS (SELECT 1 FROM information_schema.columns '
+        'WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s), '
+        'EXISTS (SELECT 1 FROM information_schema.columns '
+        "WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s AND is_generated = 'ALWAYS'), "
+        'EXISTS (SELECT 1 FROM information_schema.triggers '
+        'WHERE event_object_schema = current_schema() AND event_object_table = %s AND trigger_name = %s), '
+        "EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')",
+        [table, SEARCH_VECTOR_COLUMN, table, SEARCH_VECTOR_COLUMN, table, _postgres_trigger(table)],
+    )
+    catalog = dict(zip(('column', 'generated', 'trigger', 'trigram'), cursor.fetchone()))
+    cursor.execute('SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s', [table])
+    catalog['indexes'] = {name for (name,) in cursor.fetchall()}
+    return catalog
+
+
+def _postgres_trigger(table):
+    # Also the name of the trigger's function.
+    return f'{table}_search_vector_update'
+
+
+def _postgres_vector(qn, spec, row=''):
+    return ' || '.join(
+        f"setweight(to_tsvector('{spec['config']}'::regconfig, coalesce({row}{qn(field)}, '')), '{weight}')"
+        for field, weight in spec['fields'].items()
+    )
+
+
+# DDL only runs for what the catalog says is missing, so a migrate with the
+# indexes in place needs no privileges beyond reading the catalog.
+def _postgres_schema(cursor, qn, spec, model, rebuild):
+    table = model._meta.db_table
+    trigger = _postgres_trigger(table)
+    if rebuild:
+        # Drops the trigger and the column's GIN index with them.
+        cursor.execute(f'DROP FUNCTION IF EXISTS {qn(trigger)}() CASCADE')
+        cursor.execute(f'ALTER TABLE {qn(table)} DROP COLUMN IF EXISTS {qn(SEARCH_VECTOR_COLUMN)}')
+    catalog = _postgres_catalog(cursor, table)
+    if not catalog['column']:
+        cursor.execute(f'ALTER TABLE {qn(table)} ADD COLUMN IF NOT EXISTS {qn(SEARCH_VECTOR_COLUMN)} tsvector')
+    elif catalog['generated']:
+        # Left by an earlier version; keeps the computed values.
+        cursor.execute(f'ALTER TABLE {qn(table)} ALTER COLUMN {qn(SEARCH_VECTOR_COLUMN)} DROP EXPRESSION')
+    if not catalog['trigger']:
+        # No `UPDATE OF <columns>`: a trigger naming columns would block
+        # altering their type just like a generated column does.
+        new = ', '.join(f'NEW.{qn(field)}' for field in spec['fields'])
+        old = ', '.join(f'OLD.{qn(field)}' for field in spec['fields'])
+        cursor.execute(
+            f'CREATE OR REPLACE FUNCTION {qn(trigger)}() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN '
+            f"IF TG_OP = 'INSERT' OR ROW({new}) IS DISTINCT FROM ROW({old}) THEN "
+            f'NEW.{qn(SEARCH_VECTOR_COLUMN)} := {_postgres_vector(qn, spec, "NEW.")}; '
+            f'END IF; RETURN NEW; END $$'
+        )
+        cursor.execute(
+            f'CREATE TRIGGER {qn(trigger)} BEFORE INSERT OR UPDATE ON {qn(table)} '
+            f'FOR EACH ROW EXECUTE FUNCTION {qn(trigger)}()'
+        )
+        if not catalog['generated']:
+            # Rows written without the trigger (or before the column existed).
+            cursor.execute(f'UPDATE {qn(table)} SET {qn(SEARCH_VECTOR_COLUMN)} = {_postgres_vector(qn, spec)}')
+    if f'{table}_search_gin' not in catalog['indexes']:
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {qn(table + "_search_gin")} ON {qn(table)} USING gin ({qn(SEARCH_VECTOR_COLUMN)})'
+        )
+
+
+def _postgres_trigram_schema(cursor, qn, spec, model, rebuild):
+    # Separate from _postgres_schema() so that a server without pg_trgm (or a
+    # role that may not create it) still gets the tsvector index.
+    if not spec['trigram']:
+        return
+    table = model._meta.db_table
+    catalog = _postgres_catalog(cursor, table)
+    if not catalog['trigram']:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for field in spec['trigram']:
+        if f'{table}_{field}_trgm' not in catalog['indexes']:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {qn(f"{table}_{field}_trgm")} ON {qn(table)} USING gin ({qn(field)} gin_trgm_ops)'
+            )
+
+
+def _sqlite_schema(cursor, qn, spec, model, rebuild):
+    table, fts = model._meta.db_table, _fts_table(model)
+    fields = list(spec['fields'])
+    columns = ', '.join(qn(field) for field in fields)
+    new_values = ', '.join(f'new.{qn(field)}' for field in fields)
+    old_values = ', '.join(f'old.{qn(field)}' for field in fields)
+    triggers = {
+        f'{fts}_ai': f'AFTER INSERT ON {qn(table)} BEGIN '
+                     f'INSERT INTO {qn(fts)}(rowid, {columns}) VALUES (new.id, {new_values}); END',
+        f'{fts}_ad': f'AFTER DELETE ON {qn(table)} BEGIN '
+                     f"INSERT INTO {qn(fts)}({qn(fts)}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); END",
+        f'{fts}_au': f'AFTER UPDATE OF {columns} ON {qn(table)} BEGIN '
+                     f"INSERT INTO {qn(fts)}({qn(fts)}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); "
+                     f'INSERT INTO {qn(fts)}(rowid, {columns}) VALUES (new.id, {new_values}); END',
+    }
+
+    if rebuild:
+        for name in triggers:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {qn(name)}')
+        cursor.execute(f'DROP TABLE IF EXISTS {qn(fts)}')
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE name = %s OR (type = 'trigger' AND tbl_name = %s)", [fts, table],
+    )
+    existing = {name for (name,) in cursor.fetchall()}
+    if fts in existing and existing.issuperset(triggers):
+        return
+
+    # Django recreates a SQLite table (dropping its triggers) when altering a
+    # column, so a missing trigger means the index may have missed changes.
+    cursor.execute(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {qn(fts)} USING fts5('
+        f"{columns}, content={qn(table)}, content_rowid='id', tokenize='{spec['tokenize']}')"
+    )
+    for name, body in triggers.items():
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {qn(name)} {body}')
+    cursor.execute(f"INSERT INTO {qn(fts)}({qn(fts)}) VALUES ('rebuild')")
+
+
+def ensure_search_schema(using='default', rebuild=False):
+    """
+    Creates any missing search index (rebuild=True: drops and recreates all).
+    Returns {index: [errors]} for the indexes the database refused (logged;
+    searches on them fall back to icontains), or None if the database has no
+    full-text support here.
+    """
+    connection = connections[using]
+    steps = {
+        'postgresql': (_postgres_schema, _postgres_trigram_schema),
+        'sqlite': (_sqlite_schema,),
+    }.get(connection.vendor)
+    if steps is None:
+        return None
+    errors = {}
+    try:
+        for index in SEARCH_INDEXES:
+            spec, model = _spec(index)
+            for step in steps:
+                try:
+                    # A savepoint per step: on PostgreSQL a failed statement
+                    # would otherwise abort the whole transaction.
+                    with transaction.atomic(using=using), connection.cursor() as cursor:
+                        step(cursor, connection.ops.quote_name, spec, model, rebuild)
+                except DatabaseError as e:
+                    errors.setdefault(index, []).append(str(e))
+                    logger.warning(
+                        "Could not create the '%s' search index (%s): %s. Searches on it fall back to slower queries.",
+                        index, step.__name__, e,
+                    )
+    finally:
+        _forget_features(using)
+    return errors
+
+
+# ------------------------------------------------------------
+# Queries
+# ------------------------------------------------------------
+
+def _forget_features(using):
+    for key in [key for key in _features if key[0] == using]:
+        del _features[key]
+
+
+def _index_features(connection, spec, model):
+    """
+    {'vector': the full-text index exists, 'trigram': pg_trgm is installed}
+    for `model` on `connection`.
+    """
+    key = (connection.alias, spec['model'])
+    if key not in _features:
+        features = {'vector': False, 'trigram': False}
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                catalog = _postgres_catalog(cursor, model._meta.db_table)
+                current = catalog['column'] and (catalog['trigger'] or catalog['generated'])
+                features = {'vector': current, 'trigram': catalog['trigram']}
+            elif connection.vendor == 'sqlite':
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [_fts_table(model)])
+                features['vector'] = cursor.fetchone() is not None
+        _features[key] = features
+    return _features[key]
+
+
+def _fallback_match(spec, query):
+    condition = Q()
+    for field in spec['fields']:
+        condition |= Q(**{f'{field}__icontains': query})
+    return condition
+
+
+def _postgres_parts(spec, model, qn, query, trigram=True):
+    """
+    {'match': (sql, params), 'rank': (sql, params), 'highlight': f(field, snippet) -> (sql, params)}
+    Without pg_trgm (`trigram` False), substring matches are not ranked.
+    """
+    column = f'{qn(model._meta.db_table)}.{qn(SEARCH_VECTOR_COLUMN)}'
+    tsquery = ' & '.join(f'{term}:*' for term in _terms(query))
+    ts = f"to_tsquery('{spec['config']}'::regconfig, %s)"
+
+    match, params = [f'{column} @@ {ts}'], [tsquery]
+    rank, rank_params = [f'ts_rank_cd({column}, {ts})'], [tsquery]
+    pattern = '%' + re.sub(r'([\\%_])', r'\\\1', query) + '%'
+    for field in spec['trigram']:
+        qualified = f'{qn(model._meta.db_table)}.{qn(field)}'
+        match.append(f'{qualified} ILIKE %s')
+        params.append(pattern)
+        if trigram:
+            rank.append(f'word_similarity(%s, {qualified})')
+            rank_params.append(query)
+
+    def highlight(field, snippet):
+        options = f'StartSel="{HIGHLIGHT_START}", StopSel="{HIGHLIGHT_END}", '
+        options += f'MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 2}, MaxFragments=2' if snippet else 'HighlightAll=true'
+        sql = f"ts_headline('{spec['config']}'::regconfig, coalesce({qn(model._meta.db_table)}.{qn(field)}, ''), {ts}, %s)"
+        return sql, [tsquery, options]
+
+    return {
+        'match': ('(' + ' OR '.join(match) + ')', params),
+        'rank': ('GREATEST(' + ', '.join(rank) + ')' if len(rank) > 1 else rank[0], rank_params),
+        'highlight': highlight,
+    }
+
+
+def _sqlite_parts(spec, model, qn, query):
+    """
+    Same shape as _postgres_parts(), against the FTS5 table.
+    """
+    fts = qn(_fts_table(model))
+    if spec['tokenize'] == 'trigram':
+        expression = '"' + query.replace('"', '""') + '"'
+    else:
+        expression = ' '.join(f'"{term}"*' for term in _terms(query))
+    row = f'{fts}.rowid = {qn(model._meta.db_table)}.{qn("id")}'
+    weights = ', '.join(str(BM25_WEIGHTS[weight]) for weight in spec['fields'].values())
+    fields = list(spec['fields'])
+
+    def highlight(field, snippet):
+        column = fields.index(field)
+        function = f"snippet({fts}, {column}, %s, %s, '…', {SNIPPET_WORDS})" if snippet else f'highlight({fts}, {column}, %s, %s)'
+        sql = f'(SELECT {function} FROM {fts} WHERE {fts} MATCH %s AND {row})'
+        return sql, [HIGHLIGHT_START, HIGHLIGHT_END, expression]
+
+    return {
+        'match': (f'SELECT rowid FROM {fts} WHERE {fts} MATCH %s', [expression]),
+        # bm25() is lower for better matches.
+        'rank': (f'(SELECT -bm25({fts}, {weights}) FROM {fts} WHERE {fts} MATCH %s AND {row})', [expression]),
+        'highlight': highlight,
+    }
+
+
+def _query_parts(queryset, spec, model, query):
+    connection = connections[queryset.db]
+    if not _terms(query):
+        return None
+    features = _index_features(connection, spec, model)
+    if not features['vector']:
+        return None
+    if connection.vendor == 'postgresql':
+        return _postgres_parts(spec, model, connection.ops.quote_name, query, features['trigram'])
+    # The trigram tokenizer only matches 3+ character strings.
+    if not (spec['tokenize'] == 'trigram' and len(query) < 3):
+        return _sqlite_parts(spec, model, connection.ops.quote_name, query)
+    return None
+
+
+def _match(queryset, spec, model, query, parts):
+    if parts is None:
+        return queryset.filter(_fallback_match(spec, query)) if _terms(query) else queryset.none()
+    if connections[queryset.db].vendor == 'sqlite':
+        return queryset.filter(pk__in=RawSQL(*parts['match']))
+    return queryset.filter(RawSQL(*parts['match'], output_field=BooleanField()))
+
+
+def search_filter(queryset, index, query):
+    """
+    `queryset` narrowed to rows matching `query`, in its original order.
+    """
+    spec, model = _spec(index)
+    query = query.strip()
+    return _match(queryset, spec, model, query, _query_parts(queryset, spec, model, query))
+
+
+def search(queryset, index, query, highlight=(), snippet=()):
+    """
+    Rows of `queryset` matching `query`, best match first, annotated with
+    `search_rank` and, for each field in `highlight` (whole value) and
+    `snippet` (matching fragments of long text), `<field>_highlight`.
+    """
+    spec, model = _spec(index)
+    query = query.strip()
+    parts = _query_parts(queryset, spec, model, query)
+    queryset = _match(queryset, spec, model, query, parts)
+
+    annotations = {}
+    if parts is None:
+        annotations['search_rank'] = Value(0.0, output_field=FloatField())
+        for field in (*highlight, *snippet):
+            annotations[f'{field}_highlight'] = F(field)
+    else:
+        annotations['search_rank'] = RawSQL(*parts['rank'], output_field=FloatField())
+        for field in highlight:
+            annotations[f'{field}_highlight'] = RawSQL(*parts['highlight'](field, False))
+        for field in snippet:
+            annotations[f'{field}_highlight'] = RawSQL(*parts['highlight'](field, True))
+    return queryset.annotate(**annotations).order_by('-search_rank', *queryset.query.order_by)
@@ -0,0 +1,89 @@
+"""
+Nearest-office lookup.
+
+All active, geocoded Location coordinates are kept in one cached index
+(rebuilt whenever a Location changes, see core/cache.py), and distances to
+every office are computed in one vectorized haversine pass instead of a
+geopy geodesic call per row. Haversine is within ~0.5% of the geodesic
+distance, which is plenty to rank offices.
+"""
+import math
+
+try:
+    import numpy as np
+except ImportError:  # Optional: fall back to a pure-Python loop.
+    np = None
+
+from .cache import cached_snapshot
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+class LocationIndex:
+    """
+    Location ids and coordinates (in radians) in parallel arrays.
+    """
+
+    def __init__(self, rows):
+        rows = list(rows)
+        self.ids = [pk for pk, lat, lon in rows]
+        lats = [math.radians(lat) for pk, lat, lon in rows]
+        lons = [math.radians(lon) for pk, lat, lon in rows]
+        if np is not None:
+            self.lats, self.lons = np.array(lats), np.array(lons)
+        else:
+            self.lats, self.lons = lats, lons
+
+    def __len__(self):
+        return len(self.ids)
+
+    def distances_km(self, lat, lon):
+        """
+        Great-circle distance from (lat, lon), in degrees, to every indexed location.
+        """
+        lat, lon = math.radians(lat), math.radians(lon)
+        if np is not None:
+            a = np.sin((self.lats - lat) / 2) ** 2 + math.cos(lat) * np.cos(self.lats) * np.sin((self.lons - lon) / 2) ** 2
+            return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        cos_lat = math.cos(lat)
+        return [
+            2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0,
+                math.sin((other_lat - lat) / 2) ** 2
+                + cos_lat * math.cos(other_lat) * math.sin((other_lon - lon) / 2) ** 2
+            )))
+            for other_lat, other_lon in zip(self.lats, self.lons)
+        ]
+
+    def nearest(self, lat, lon, k=1):
+        """
+        [(location_id, distance_km), ...] for the k closest locations, closest first.
+        """
+        if not self.ids or k < 1:
+            return []
+        distances = self.distances_km(lat, lon)
+        if np is not None:
+            k = min(k, len(self.ids))
+            order = np.argpartition(distances, k - 1)[:k]
+            order = order[np.argsort(distances[order])]
+            return [(self.ids[i], round(float(distances[i]), 2)) for i in order]
+        order = sorted(range(len(self.ids)), key=distances.__getitem__)[:k]
+        return [(self.ids[i], round(distances[i], 2)) for i in order]
+
+
+def location_index():
+    from .models import Location
+
+    def build():
+        return LocationIndex(
+            Location.objects.filter(is_active=True, latitude__isnull=False, longitude__isnull=False)
+            .order_by('pk').values_list('pk', 'latitude', 'longitude')
+        )
+
+    return cached_snapshot('location-index', (Location,), build)
+
+
+def nearest_locations(lat, lon, k=1):
+    """
+    [(location_id, distance_km), ...] for the k active offices closest to (lat, lon).
+    """
+    return location_index().nearest(lat, lon, k)
@@ -0,0 +1,136 @@
+"""
+Address geocoding.
+
+Lookups go through a persistent cache table (GeocodeResult, keyed by the
+normalized address), so each distinct address hits the provider once. The
+provider is pluggable: GEOCODING_PROVIDER names the class and
+GEOCODING_OPTIONS its keyword arguments, so tests can point the default
+Nominatim provider at a local stub server (`url`) or swap it entirely.
+Network lookups only happen in `manage.py geocode_locations`, never while
+saving a model.
+"""
+import re
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class GeocodingError(Exception):
+    """
+    The provider could not be reached or answered with an error; not cached.
+    """
+
+
+def normalize_address(address):
+    """
+    Cache key for an address: case-folded, punctuation spacing and runs of
+    whitespace collapsed, so trivially different spellings share an entry.
+    """
+    address = re.sub(r'\s*([,;])\s*', r'\1 ', address.casefold())
+    return re.sub(r'\s+', ' ', address).strip(' ,;')
+
+
+class NominatimProvider:
+    """
+    OpenStreetMap Nominatim search API over one pooled HTTP session, with
+    timeouts, retries on 429/5xx and a minimum interval between requests
+    (Nominatim's usage policy allows at most one per second).
+    """
+    name = 'nominatim'
+
+    def __init__(self, url='https://nominatim.openstreetmap.org/search', user_agent='alienhousenetworks',
+                 timeout=5.0, min_interval=1.0, retries=2):
+        self.url = url
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._last_request = 0.0
+
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = user_agent
+        retry = Retry(total=retries, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=('GET',))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _throttle(self):
+        with self._lock:
+            wait = self._last_request + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._last_request = time.monotonic()
+
+    def geocode(self, address):
+        """
+        Returns (latitude, longitude, display_name), or None if nothing matched.
+        """
+        self._throttle()
+        try:
+            response = self.session.get(
+                self.url, params={'q': address, 'format': 'json', 'limit': 1}, timeout=self.timeout,
+            )
+            response.raise_for_status()
+            results = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise GeocodingError(f"{self.name}: {e}") from e
+
+        if not results:
+            return None
+        return float(results[0]['lat']), float(results[0]['lon']), results[0].get('display_name', '')
+
+
+_provider = None
+
+
+def get_provider():
+    """
+    The configured provider, built once per process so its HTTP session (and
+    connection pool) is reused across lookups.
+    """
+    global _provider
+    if _provider is None:
+        provider_class = import_string(getattr(settings, 'GEOCODING_PROVIDER', 'core.geocoding.NominatimProvider'))
+        _provider = provider_class(**getattr(settings, 'GEOCODING_OPTIONS', {}))
+    return _provider
+
+
+def cached_geocode(address):
+    """
+    (latitude, longitude) from the cache table only, never the network.
+    None if the address is unknown or was not found.
+    """
+    from .models import GeocodeResult
+
+    entry = GeocodeResult.objects.filter(query=normalize_address(address), latitude__isnull=False).first()
+    return (entry.latitude, entry.longitude) if entry else None
+
+
+def geocode(address, refresh=False, provider=None):
+    """
+    (latitude, longitude) for `address`, or None if the provider found nothing.
+    Answers (including "not found") are cached; pass refresh=True to ask the
+    provider again. Raises GeocodingError if the provider fails.
+    """
+    from .models import GeocodeResult
+
+    query = normalize_address(address)
+    if not query:
+        return None
+    if not refresh:
+        entry = GeocodeResult.objects.filter(query=query).first()
+        if entry:
+            return (entry.latitude, entry.longitude) if entry.found else None
+
+    provider = provider or get_provider()
+    result = provider.geocode(address)
+    latitude, longitude, display_name = result if result else (None, None, '')
+    GeocodeResult.objects.update_or_create(
+        query=query,
+        defaults={'latitude': latitude, 'longitude': longitude, 'display_name': display_name, 'provider': provider.name},
+    )
+    return (latitude, longitude) if result else None
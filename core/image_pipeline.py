@@ -0,0 +1,519 @@
+"""
+Out-of-band image optimization.
+
+Models save immediately with the original upload. OptimizedImageMixin records an
+ImageOptimizationJob for each newly uploaded image, and `manage.py process_image_jobs`
+encodes the jobs in a process pool and swaps each field over to the optimized file.
+Each job also produces a ladder of narrower renditions (IMAGE_RENDITION_WIDTHS) in
+every output format (IMAGE_OUTPUT_FORMATS, e.g. AVIF + WebP), recorded in
+ImageRendition and emitted by the {% srcset %} / {% picture_sources %} template tags.
+Intrinsic size and a placeholder (dominant colour, LQIP) go to ImageMetadata,
+read by {% image_meta %} / {% placeholder_style %}.
+Files that predate the pipeline are queued by `manage.py backfill_images`.
+"""
+import hashlib
+import logging
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import ContentFile
+from django.db import models, transaction
+from django.db.models import Case, CharField, F, Value, When
+from django.utils import timezone
+
+from .cache import bump_content_version, cached_snapshot
+from .utils import (
+    PRIMARY_FORMAT, ENCODING_PROFILES, ImageTooLarge, content_hash, encode_image_variants, is_fresh_upload,
+    resolve_profiles, variant_name,
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+
+DEFAULT_RENDITION_WIDTHS = (320, 640, 1280, 1920)
+
+
+def rendition_widths():
+    return tuple(getattr(settings, 'IMAGE_RENDITION_WIDTHS', DEFAULT_RENDITION_WIDTHS))
+
+
+def output_profiles():
+    """
+    Encoding profiles for IMAGE_OUTPUT_FORMATS; the primary format is always included.
+    """
+    formats = list(getattr(settings, 'IMAGE_OUTPUT_FORMATS', (PRIMARY_FORMAT,)))
+    if PRIMARY_FORMAT not in formats:
+        formats.append(PRIMARY_FORMAT)
+    options = dict(getattr(settings, 'IMAGE_ENCODING_OPTIONS', {}))
+    options.setdefault(PRIMARY_FORMAT, {'quality': getattr(settings, 'IMAGE_OPTIMIZATION_QUALITY', 80)})
+    return resolve_profiles(formats, options)
+
+
+def decode_limits():
+    """
+    Keyword arguments for encode_image_variants bounding decode memory.
+    """
+    return {
+        'max_pixels': getattr(settings, 'IMAGE_MAX_PIXELS', None),
+        'max_source_pixels': getattr(settings, 'IMAGE_MAX_SOURCE_PIXELS', None),
+    }
+
+
+def fresh_image_uploads(instance, field_names):
+    """
+    Names of the fields on `instance` that hold a new upload.
+    Must be called before the model is saved (saving commits the upload).
+    """
+    return [name for name in field_names if is_fresh_upload(getattr(instance, name))]
+
+
+def reuse_optimized_images(instance, field_names):
+    """
+    Points every upload in `field_names` whose bytes match the source of an
+    image optimized before (e.g. the same photo uploaded to another model) at
+    that image, so nothing is stored or encoded again. Returns the fields that
+    still need a job. Must be called before the model is saved.
+    """
+    from .models import ImageMetadata
+
+    remaining = []
+    for name in field_names:
+        field_file = getattr(instance, name)
+        existing = (
+            ImageMetadata.objects.filter(source_hash=content_hash(field_file))
+            .values_list('source_name', flat=True).first()
+        )
+        if existing and field_file.storage.exists(existing):
+            setattr(instance, name, existing)
+        else:
+            remaining.append(name)
+    return remaining
+
+
+def queue_image_optimization(instance, field_names):
+    from .models import ImageOptimizationJob
+
+    content_type = ContentType.objects.get_for_model(instance)
+    jobs = ImageOptimizationJob.objects.bulk_create([
+        ImageOptimizationJob(
+            content_type=content_type,
+            object_id=instance.pk,
+            field_name=name,
+            source_name=getattr(instance, name).name,
+        )
+        for name in field_names
+    ])
+
+    if not getattr(settings, 'IMAGE_OPTIMIZATION_ASYNC', True):
+        # No worker running (e.g. local development): optimize right after commit.
+        job_ids = [job.pk for job in jobs]
+        transaction.on_commit(lambda: process_jobs(claim_jobs(ids=job_ids)))
+    return jobs
+
+
+def image_fields(app_label='core', field_class=models.ImageField):
+    """
+    (model, field_name) for every ImageField (or other `field_class`) on the
+    app's concrete models (every installed app's if `app_label` is None).
+    """
+    candidates = apps.get_app_config(app_label).get_models() if app_label else apps.get_models()
+    return [
+        (model, field.name)
+        for model in candidates
+        for field in model._meta.concrete_fields
+        if isinstance(field, field_class)
+    ]
+
+
+def queue_backfill(batch, force=False, chunk_size=1000):
+    """
+    Queues a job, tagged `batch`, for every stored image that is not yet
+    optimized (not in the primary format, or missing renditions/metadata), or
+    for every stored image if `force`. Rows that already have a job in `batch`
+    are skipped, so re-running with the same batch resumes an interrupted
+    backfill instead of starting over. Returns the number of jobs queued.
+    """
+    from .models import ImageMetadata, ImageOptimizationJob
+
+    primary_extension = ENCODING_PROFILES[PRIMARY_FORMAT]['extension']
+    processed = set(ImageMetadata.objects.values_list('source_name', flat=True))
+    queued = 0
+    for model, field_name in image_fields():
+        content_type = ContentType.objects.get_for_model(model)
+        done = set(
+            ImageOptimizationJob.objects.filter(content_type=content_type, field_name=field_name, batch=batch)
+            .values_list('object_id', flat=True)
+        )
+        rows = (
+            model.objects.exclude(**{f'{field_name}__isnull': True}).exclude(**{field_name: ''})
+            .order_by('pk').values_list('pk', field_name)
+        )
+        jobs = [
+            ImageOptimizationJob(
+                content_type=content_type, object_id=pk, field_name=field_name, source_name=name, batch=batch,
+            )
+            for pk, name in rows.iterator(chunk_size=chunk_size)
+            if pk not in done and (force or not name.endswith(primary_extension) or name not in processed)
+        ]
+        ImageOptimizationJob.objects.bulk_create(jobs, batch_size=chunk_size)
+        queued += len(jobs)
+    return queued
+
+
+def claim_jobs(limit=None, ids=None, batch=None):
+    """
+    Atomically moves up to `limit` pending jobs (optionally only those with the
+    given `ids` or backfill `batch`) to PROCESSING and returns them.
+    Rows locked by another worker are skipped (on databases that support it).
+    """
+    from .models import ImageOptimizationJob
+
+    with transaction.atomic():
+        pending = (
+            ImageOptimizationJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=ImageOptimizationJob.PENDING)
+            .order_by('created_at')
+        )
+        if ids is not None:
+            pending = pending.filter(pk__in=ids)
+        if batch is not None:
+            pending = pending.filter(batch=batch)
+        jobs = list(pending[:limit] if limit else pending)
+
+        ImageOptimizationJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=ImageOptimizationJob.PROCESSING,
+            attempts=F('attempts') + 1,
+            updated_at=timezone.now(),
+        )
+    for job in jobs:
+        job.status = ImageOptimizationJob.PROCESSING
+        job.attempts += 1
+    return jobs
+
+
+def requeue_stale_jobs(older_than):
+    """
+    Returns jobs stuck in PROCESSING (worker died mid-batch) to the queue,
+    or fails them once they have used up their attempts.
+    """
+    from .models import ImageOptimizationJob
+
+    stale = ImageOptimizationJob.objects.filter(
+        status=ImageOptimizationJob.PROCESSING,
+        updated_at__lt=timezone.now() - older_than,
+    )
+    failed = stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status=ImageOptimizationJob.FAILED, error='Worker did not finish the job.', updated_at=timezone.now(),
+    )
+    requeued = stale.update(status=ImageOptimizationJob.PENDING, updated_at=timezone.now())
+    return requeued, failed
+
+
+def _finish(job, status, error=''):
+    job.status = status
+    job.error = error
+    job.save(update_fields=['status', 'error', 'updated_at'])
+
+
+def _load_source(job):
+    """
+    Returns (instance, bytes) for a claimed job, or None if the job no longer
+    applies (row deleted, or the field now holds a different file).
+    """
+    from .models import ImageOptimizationJob
+
+    model = job.content_type.model_class()
+    instance = model.objects.filter(pk=job.object_id).first()
+    field_file = getattr(instance, job.field_name, None) if instance else None
+
+    if not field_file or field_file.name != job.source_name:
+        _finish(job, ImageOptimizationJob.SKIPPED, 'Superseded: the image was replaced or deleted.')
+        return None
+
+    with field_file.storage.open(field_file.name, 'rb') as fh:
+        return instance, fh.read()
+
+
+def _store_variants(storage, source_name, result):
+    """
+    Saves every encoded variant and returns (primary_name, unsaved ImageRendition rows).
+    The full-size primary-format file becomes the new value of the ImageField;
+    everything else is stored next to it.
+    """
+    from .models import ImageRendition
+
+    def is_primary(variant):
+        return variant['format'] == PRIMARY_FORMAT and variant['width'] == result['width']
+
+    variants = sorted(result['variants'], key=lambda v: not is_primary(v))
+    primary_name = None
+    rows = []
+    for variant in variants:
+        extension = ENCODING_PROFILES[variant['format']]['extension']
+        if primary_name is None:
+            name = storage.save(variant_name(source_name, extension), ContentFile(variant['data']))
+            primary_name = name
+        else:
+            width = None if variant['width'] == result['width'] else variant['width']
+            name = storage.save(variant_name(primary_name, extension, width), ContentFile(variant['data']))
+        rows.append(ImageRendition(
+            source_name=primary_name, name=name, format=variant['format'],
+            width=variant['width'], height=variant['height'], file_size=len(variant['data']),
+        ))
+    return primary_name, rows
+
+
+def _apply_results(encoded):
+    """
+    Stores the optimized files and renditions for a set of encoded jobs, then
+    swaps each field over to its new file, but only if the field still points at
+    the file the job was created for, so a newer upload is never overwritten.
+    The swap is one locked read and one UPDATE per model field, not a save() per row.
+    """
+    from .models import ImageOptimizationJob
+
+    groups = {}
+    for job, instance, source_size, result in encoded:
+        storage = getattr(instance, job.field_name).storage
+        try:
+            if 'existing_name' in result:
+                # Same source bytes as an image optimized before: point at it.
+                new_name, renditions = result['existing_name'], []
+                job.optimized_size = storage.size(new_name)
+            else:
+                new_name, renditions = _store_variants(storage, job.source_name, result)
+                job.optimized_size = next(r.file_size for r in renditions if r.name == new_name)
+        except Exception as e:
+            logger.error(f"Error storing optimized image for job {job.pk}: {e}")
+            _retry_or_fail(job, str(e))
+            continue
+        job.source_size = source_size
+        groups.setdefault((type(instance), job.field_name), []).append(
+            (job, instance.pk, storage, new_name, renditions, result)
+        )
+
+    completed = []
+    for (model, field_name), items in groups.items():
+        try:
+            swapped, stale_files = _swap_fields(model, field_name, items)
+        except Exception as e:
+            logger.error(f"Error swapping optimized {model.__name__}.{field_name} images: {e}")
+            swapped, stale_files = set(), []
+            for job, pk, storage, new_name, renditions, result in items:
+                _retry_or_fail(job, str(e))
+
+        unused = list(stale_files)
+        for job, pk, storage, new_name, renditions, result in items:
+            if job.pk in swapped:
+                if new_name != job.source_name:
+                    unused.append(job.source_name)
+                completed.append(job)
+                continue
+            unused.extend(rendition.name for rendition in renditions)
+            if job.status == ImageOptimizationJob.PROCESSING:
+                _finish(job, ImageOptimizationJob.SKIPPED, 'Superseded: the image was replaced while optimizing.')
+        delete_unreferenced(items[0][2], unused)
+
+    now = timezone.now()
+    for job in completed:
+        job.status, job.error, job.updated_at = ImageOptimizationJob.COMPLETED, '', now
+    ImageOptimizationJob.objects.bulk_update(
+        completed, ['status', 'error', 'source_size', 'optimized_size', 'updated_at'], batch_size=500,
+    )
+
+
+def _swap_fields(model, field_name, items):
+    """
+    Points `field_name` at the new file for every row whose field still holds
+    the job's source file, and records renditions and metadata for them.
+    Returns the pks of the swapped jobs and the rendition files of replaced
+    images that no row uses any more (when re-optimizing), for the caller to delete.
+    """
+    from .models import ImageMetadata, ImageRendition
+
+    with transaction.atomic():
+        current = dict(
+            model.objects.select_for_update()
+            .filter(pk__in=[pk for job, pk, *rest in items])
+            .values_list('pk', field_name)
+        )
+        matched = [item for item in items if current.get(item[1]) == item[0].source_name]
+        if not matched:
+            return set(), []
+
+        # .update() rather than save(): no re-queueing, no auto_now churn.
+        model.objects.filter(pk__in=[pk for job, pk, *rest in matched]).update(**{
+            field_name: Case(
+                *[When(pk=pk, then=Value(new_name)) for job, pk, storage, new_name, *rest in matched],
+                output_field=CharField(),
+            )
+        })
+
+        # Files can be shared (content-addressed storage), so only forget
+        # replaced images that no field points at any more.
+        old_names = {job.source_name for job, *rest in matched}
+        orphaned = old_names - field_references(old_names)
+        stale = ImageRendition.objects.filter(source_name__in=orphaned)
+        stale_files = list(stale.values_list('name', flat=True))
+        stale.delete()
+        ImageMetadata.objects.filter(source_name__in=orphaned).delete()
+
+        encoded = [item for item in matched if 'existing_name' not in item[5]]
+        new_names = [new_name for job, pk, storage, new_name, *rest in encoded]
+        ImageRendition.objects.filter(source_name__in=new_names).delete()
+        ImageRendition.objects.bulk_create(
+            [r for *rest, renditions, result in encoded for r in renditions], ignore_conflicts=True,
+        )
+        ImageMetadata.objects.filter(source_name__in=new_names).delete()
+        ImageMetadata.objects.bulk_create([
+            ImageMetadata(
+                source_name=new_name, source_hash=result['source_hash'],
+                width=result['width'], height=result['height'], **result['placeholder'],
+            )
+            for job, pk, storage, new_name, renditions, result in encoded
+        ], ignore_conflicts=True)
+
+    # Bulk writes send no signals, so invalidate by hand.
+    bump_content_version(model)
+    bump_content_version(ImageRendition)
+    bump_content_version(ImageMetadata)
+    return {job.pk for job, *rest in matched}, stale_files
+
+
+def field_references(names):
+    """
+    The subset of storage `names` that some file field row still points at.
+    """
+    names = set(names)
+    found = set()
+    if names:
+        for model, field_name in image_fields(None, models.FileField):
+            found.update(model.objects.filter(**{f'{field_name}__in': names}).values_list(field_name, flat=True))
+    return found
+
+
+def delete_unreferenced(storage, names):
+    """
+    Deletes the files in `names` that no file field row or rendition uses.
+    Needed because content-addressed storage shares one file between identical images.
+    """
+    from .models import ImageRendition
+
+    names = set(names)
+    if not names:
+        return
+    in_use = field_references(names)
+    in_use.update(ImageRendition.objects.filter(name__in=names).values_list('name', flat=True))
+    for name in names - in_use:
+        storage.delete(name)
+
+
+def process_jobs(jobs, executor=None):
+    """
+    Optimizes claimed jobs, in `executor` (a process pool) if given, and
+    returns a {status: count} summary. Sources whose bytes were optimized
+    before (same SHA-256) reuse that result instead of being encoded again.
+    """
+    from .models import ImageMetadata, ImageOptimizationJob
+
+    profiles = output_profiles()
+    widths = rendition_widths()
+    limits = decode_limits()
+    loaded = []
+    for job in jobs:
+        try:
+            source = _load_source(job)
+        except Exception as e:
+            logger.error(f"Error reading image for job {job.pk}: {e}")
+            _retry_or_fail(job, str(e))
+            continue
+        if source:
+            instance, data = source
+            loaded.append((job, instance, data, hashlib.sha256(data).hexdigest()))
+
+    known = dict(
+        ImageMetadata.objects.filter(source_hash__in={digest for *rest, digest in loaded})
+        .values_list('source_hash', 'source_name')
+    )
+    work = []
+    for job, instance, data, digest in loaded:
+        existing = known.get(digest)
+        if existing and getattr(instance, job.field_name).storage.exists(existing):
+            work.append((job, instance, data, digest, {'existing_name': existing}))
+            continue
+        result = executor.submit(encode_image_variants, data, profiles, widths, **limits) if executor else None
+        work.append((job, instance, data, digest, result))
+
+    encoded = []
+    for job, instance, data, digest, result in work:
+        try:
+            if isinstance(result, dict):
+                output = result
+            else:
+                output = result.result() if result else encode_image_variants(data, profiles, widths, **limits)
+            output['source_hash'] = digest
+            encoded.append((job, instance, len(data), output))
+        except ImageTooLarge as e:
+            # Deterministic: retrying cannot help.
+            logger.error(f"Image for job {job.pk} rejected: {e}")
+            _finish(job, ImageOptimizationJob.FAILED, str(e))
+        except Exception as e:
+            logger.error(f"Error optimizing image for job {job.pk}: {e}")
+            _retry_or_fail(job, str(e))
+    _apply_results(encoded)
+
+    summary = {}
+    for job in jobs:
+        summary[job.status] = summary.get(job.status, 0) + 1
+    return summary
+
+
+def _retry_or_fail(job, error):
+    from .models import ImageOptimizationJob
+
+    status = ImageOptimizationJob.FAILED if job.attempts >= MAX_ATTEMPTS else ImageOptimizationJob.PENDING
+    _finish(job, status, error)
+
+
+def default_stale_timeout():
+    return timedelta(minutes=getattr(settings, 'IMAGE_OPTIMIZATION_STALE_MINUTES', 15))
+
+
+def rendition_index():
+    """
+    {source_name: {format: [(width, name), ...]}} for every recorded image,
+    narrowest first. One cached snapshot for the whole table, so template
+    tags never query per image.
+    """
+    from .models import ImageRendition
+
+    def build():
+        index = {}
+        for source_name, image_format, width, name in (
+            ImageRendition.objects.order_by('source_name', 'width')
+            .values_list('source_name', 'format', 'width', 'name')
+        ):
+            index.setdefault(source_name, {}).setdefault(image_format, []).append((width, name))
+        return index
+
+    return cached_snapshot('image-renditions', (ImageRendition,), build)
+
+
+def image_metadata_index():
+    """
+    {source_name: {'width', 'height', 'dominant_color', 'lqip'}} for every
+    processed image; cached like rendition_index.
+    """
+    from .models import ImageMetadata
+
+    def build():
+        return {
+            row.pop('source_name'): row
+            for row in ImageMetadata.objects.values('source_name', 'width', 'height', 'dominant_color', 'lqip')
+        }
+
+    return cached_snapshot('image-metadata', (ImageMetadata,), build)
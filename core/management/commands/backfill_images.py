@@ -0,0 +1,64 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+
+from core.image_pipeline import claim_jobs, default_stale_timeout, process_jobs, queue_backfill, requeue_stale_jobs
+from core.models import ImageOptimizationJob
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-optimizes images stored before the optimization pipeline (or with old settings): '
+        'queues every ImageField file in core and processes the batch in a process pool'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', default='backfill', help='Batch name; re-run with the same name to resume (default: backfill).')
+        parser.add_argument('--force', action='store_true', help='Also re-encode images that are already optimized (e.g. after changing quality).')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Encoder processes (default: all cores).')
+        parser.add_argument('--batch-size', type=int, default=None, help='Jobs claimed per round (default: 4 per worker).')
+        parser.add_argument('--queue-only', action='store_true', help='Only queue the jobs and leave them to process_image_jobs.')
+
+    def handle(self, *args, **options):
+        batch = options['batch']
+        workers = max(1, options['workers'])
+        batch_size = options['batch_size'] or workers * 4
+
+        queued = queue_backfill(batch, force=options['force'])
+        self.stdout.write(f"Queued {queued} image(s) in batch '{batch}'.")
+
+        if not options['queue_only']:
+            # Jobs this batch already completed are never re-claimed, so an
+            # interrupted run picks up where it stopped.
+            requeue_stale_jobs(default_stale_timeout())
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                while True:
+                    jobs = claim_jobs(limit=batch_size, batch=batch)
+                    if not jobs:
+                        break
+                    summary = process_jobs(jobs, executor)
+                    report = ', '.join(f"{count} {status.lower()}" for status, count in sorted(summary.items()))
+                    self.stdout.write(f"Processed {len(jobs)} job(s): {report}")
+
+        self.report(batch)
+
+    def report(self, batch):
+        jobs = ImageOptimizationJob.objects.filter(batch=batch)
+        counts = dict(jobs.values_list('status').annotate(count=Count('pk')).order_by())
+        sizes = jobs.filter(status=ImageOptimizationJob.COMPLETED).aggregate(
+            before=Sum('source_size'), after=Sum('optimized_size'),
+        )
+        before, after = sizes['before'] or 0, sizes['after'] or 0
+        saved = before - after
+        percent = f" ({saved / before:.0%})" if before else ''
+
+        self.stdout.write(', '.join(f"{counts[status]} {status.lower()}" for status in sorted(counts)) or 'No jobs.')
+        self.stdout.write(self.style.SUCCESS(
+            f"Batch '{batch}': {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB, saved {saved / 1e6:.1f} MB{percent}."
+        ))
+        if counts.get(ImageOptimizationJob.PENDING) or counts.get(ImageOptimizationJob.PROCESSING):
+            self.stdout.write(self.style.WARNING("Some jobs are unfinished; re-run with the same --batch to resume."))
@@ -0,0 +1,25 @@
+import shutil
+import subprocess
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SCRIPT = 'scripts/build-frontend.mjs'
+
+
+class Command(BaseCommand):
+    help = (
+        'Builds the front-end assets (the purged, minified Tailwind stylesheet) into '
+        'core/static/core/dist/ (run before collectstatic, which gives them content-hashed names)'
+    )
+
+    def handle(self, *args, **options):
+        node = shutil.which('node')
+        if node is None:
+            raise CommandError('Node.js is required to build the front-end assets (`node` is not on PATH).')
+        if not (settings.BASE_DIR / 'node_modules' / 'tailwindcss').is_dir():
+            raise CommandError('tailwindcss is not installed; run `npm ci` first.')
+        result = subprocess.run([node, SCRIPT], cwd=settings.BASE_DIR, capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(f'{SCRIPT} failed:\n{result.stderr or result.stdout}')
+        self.stdout.write(self.style.SUCCESS(result.stdout.strip()))
@@ -0,0 +1,22 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.site_search import build_index, index_path
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds the site-wide search index (services, projects, jobs, training) and its file '
+        '(needed after bulk updates or imports, which bypass the signals that keep it current)'
+    )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        index = build_index()
+        path = index_path()
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {len(index)} document(s), {len(index.terms)} term(s) in {time.perf_counter() - start:.2f}s; "
+            f"{path} is {os.path.getsize(path) / 1024:.1f} KB."
+        ))
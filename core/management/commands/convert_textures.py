@@ -1,35 +1,177 @@
-from django.core.management.base import BaseCommand
-from django.conf import settings
+import hashlib
+import json
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 from PIL import Image
 
+from core.utils import SIZED_STEM, encode_image_variants, file_digest, resolve_profiles, variant_name
+
+SOURCE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+# Committed WebP textures without a PNG/JPEG original are sources too.
+DERIVABLE_EXTENSIONS = SOURCE_EXTENSIONS + ('.webp',)
+# Dotfile, so collectstatic ignores it.
+MANIFEST_NAME = '.convert_textures.json'
+# Mip tiers stop at this width.
+MIN_MIP_WIDTH = 16
+
+
+def mip_widths(width, levels):
+    """
+    Widths of the first `levels` mip tiers below `width` (each half the last).
+    """
+    return [width >> level for level in range(1, levels + 1) if width >> level >= MIN_MIP_WIDTH]
+
+
+def convert_texture(source_path, profiles, widths, mip_levels=0):
+    """
+    Encodes one texture in every profile and width (plus `mip_levels` mip
+    tiers) and writes the files next to the source. Runs in a worker process;
+    returns (written paths relative to the source's directory, full width).
+    """
+    with open(source_path, 'rb') as fh:
+        data = fh.read()
+    if mip_levels:
+        with Image.open(source_path) as img:
+            widths = sorted(set(widths) | set(mip_widths(img.width, mip_levels)))
+    result = encode_image_variants(data, profiles, widths)
+
+    directory = os.path.dirname(source_path)
+    extensions = {profile['name']: profile['extension'] for profile in profiles}
+    written = []
+    for variant in result['variants']:
+        width = None if variant['width'] == result['width'] else variant['width']
+        out_path = variant_name(source_path, extensions[variant['format']], width)
+        if out_path == source_path:
+            # A WebP source is never overwritten by its own re-encode.
+            continue
+        with open(out_path, 'wb') as fh:
+            fh.write(variant['data'])
+        written.append(os.path.relpath(out_path, directory))
+    return written, result['width']
+
+
 class Command(BaseCommand):
-    help = 'Converts all images in the static textures directory to WebP format'
+    help = (
+        'Converts images in the static textures directory (recursively) to WebP/AVIF, '
+        'in parallel, skipping sources whose content and settings are unchanged'
+    )
 
-    def handle(self, *args, **kwargs):
-        textures_dir = os.path.join(settings.BASE_DIR, 'core', 'static', 'core', 'textures')
-        
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dir', default=os.path.join(settings.BASE_DIR, 'core', 'static', 'core', 'textures'),
+            help='Root directory to convert (default: core/static/core/textures).',
+        )
+        parser.add_argument('--formats', default='webp,avif', help='Comma-separated output formats (default: webp,avif).')
+        parser.add_argument('--sizes', default='', help='Comma-separated extra widths in px, e.g. 512,1024 (never upscaled).')
+        parser.add_argument(
+            '--mip-levels', type=int, default=0,
+            help='Also write this many mip tiers per texture (1/2, 1/4, ... of its width), for low-end clients.',
+        )
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Encoder processes (default: all cores).')
+        parser.add_argument('--force', action='store_true', help='Re-encode everything, ignoring the manifest.')
+
+    def handle(self, *args, **options):
+        textures_dir = options['dir']
         if not os.path.exists(textures_dir):
-            self.stdout.write(self.style.ERROR(f"Directory not found: {textures_dir}"))
-            return
-
-        for filename in os.listdir(textures_dir):
-            if filename.lower().endswith(('.png', '.jpg', '.jpeg')) and not filename.lower().endswith('.webp'):
-                file_path = os.path.join(textures_dir, filename)
-                try:
-                    img = Image.open(file_path)
-                    
-                    # Convert to RGB if necessary, keeping transparency for PNGs
-                    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
-                        pass 
-                    else:
-                        img = img.convert('RGB')
-                        
-                    webp_filename = os.path.splitext(filename)[0] + '.webp'
-                    webp_path = os.path.join(textures_dir, webp_filename)
-                    
-                    img.save(webp_path, 'WEBP', quality=80)
-                    self.stdout.write(self.style.SUCCESS(f"Converted {filename} to {webp_filename}"))
-                    
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(f"Failed to convert {filename}: {str(e)}"))
+            raise CommandError(f"Directory not found: {textures_dir}")
+
+        try:
+            formats = [f.strip() for f in options['formats'].split(',') if f.strip()]
+            profiles = resolve_profiles(formats, getattr(settings, 'IMAGE_ENCODING_OPTIONS', {}))
+            widths = sorted({int(w) for w in options['sizes'].split(',') if w.strip()})
+        except (KeyError, ValueError) as e:
+            raise CommandError(f"Invalid --formats/--sizes: {e}")
+
+        manifest_path = os.path.join(textures_dir, MANIFEST_NAME)
+        manifest = self.load_manifest(manifest_path)
+        # Part of each entry, so changing formats, sizes or quality re-encodes.
+        mip_levels = max(0, options['mip_levels'])
+        settings_key = hashlib.sha256(
+            json.dumps([profiles, widths] + ([mip_levels] if mip_levels else []), sort_keys=True).encode()
+        ).hexdigest()[:16]
+
+        pending, skipped = [], 0
+        for rel_path in self.find_sources(textures_dir, manifest):
+            abs_path = os.path.join(textures_dir, rel_path)
+            digest = file_digest(abs_path)
+            entry = manifest.get(rel_path)
+            if (
+                not options['force'] and entry and entry['sha256'] == digest and entry['settings'] == settings_key
+                and all(os.path.exists(os.path.join(os.path.dirname(abs_path), out)) for out in entry['outputs'])
+            ):
+                skipped += 1
+                continue
+            pending.append((rel_path, abs_path, digest))
+
+        converted = failed = 0
+        if pending:
+            workers = max(1, min(options['workers'], len(pending)))
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                futures = {
+                    executor.submit(convert_texture, abs_path, profiles, widths, mip_levels): (rel_path, digest)
+                    for rel_path, abs_path, digest in pending
+                }
+                for future in as_completed(futures):
+                    rel_path, digest = futures[future]
+                    try:
+                        outputs, width = future.result()
+                    except Exception as e:
+                        failed += 1
+                        manifest.pop(rel_path, None)
+                        self.stdout.write(self.style.ERROR(f"Failed to convert {rel_path}: {str(e)}"))
+                        continue
+                    converted += 1
+                    manifest[rel_path] = {
+                        'sha256': digest, 'settings': settings_key, 'outputs': sorted(outputs), 'width': width,
+                    }
+                    self.stdout.write(self.style.SUCCESS(f"Converted {rel_path} to {', '.join(sorted(outputs))}"))
+
+            self.save_manifest(manifest_path, manifest)
+
+        self.stdout.write(self.style.SUCCESS(f"Textures: {converted} converted, {skipped} unchanged, {failed} failed."))
+
+    def find_sources(self, textures_dir, manifest):
+        """
+        Relative paths of every source image under `textures_dir`. Files the
+        manifest lists as outputs, downscaled copies, and WebPs that sit next to a
+        PNG/JPEG with the same name are generated and therefore not sources.
+        """
+        generated = {
+            os.path.normpath(os.path.join(os.path.dirname(source), out))
+            for source, entry in manifest.items() for out in entry['outputs']
+        }
+        sources = []
+        for root, dirs, files in os.walk(textures_dir):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+            originals = {os.path.splitext(f)[0] for f in files if f.lower().endswith(SOURCE_EXTENSIONS)}
+            for filename in sorted(files):
+                stem, ext = os.path.splitext(filename)
+                rel_path = os.path.relpath(os.path.join(root, filename), textures_dir)
+                if ext.lower() not in DERIVABLE_EXTENSIONS or rel_path in generated or SIZED_STEM.search(stem):
+                    continue
+                if ext.lower() == '.webp' and stem in originals:
+                    continue
+                sources.append(rel_path)
+        return sources
+
+    def load_manifest(self, path):
+        try:
+            with open(path) as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            self.stdout.write(self.style.WARNING(f"Ignoring unreadable manifest {path}"))
+            return {}
+
+    def save_manifest(self, path, manifest):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as fh:
+            json.dump(manifest, fh, indent=2, sort_keys=True)
+            fh.write('\n')
+        os.replace(tmp_path, path)
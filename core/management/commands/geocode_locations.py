@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+
+from core.cache import bump_content_version
+from core.geocoding import GeocodingError, geocode, get_provider, normalize_address
+from core.models import Location
+
+
+class Command(BaseCommand):
+    help = 'Fills in Location coordinates from their addresses (cached, rate-limited geocoding)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-geocode locations that already have coordinates.')
+        parser.add_argument('--refresh', action='store_true', help='Ask the provider again instead of using cached answers.')
+        parser.add_argument('--limit', type=int, default=None, help='Geocode at most this many distinct addresses.')
+
+    def handle(self, *args, **options):
+        locations = Location.objects.exclude(address='').order_by('pk')
+        if not options['all']:
+            locations = locations.filter(latitude__isnull=True) | locations.filter(longitude__isnull=True)
+
+        # One lookup per distinct address, however many locations share it.
+        by_address = {}
+        for location in locations:
+            by_address.setdefault(normalize_address(location.address), []).append(location)
+        addresses = list(by_address.items())[:options['limit']]
+
+        provider = get_provider()
+        updated, not_found, failed = [], 0, 0
+        for query, group in addresses:
+            try:
+                coords = geocode(group[0].address, refresh=options['refresh'], provider=provider)
+            except GeocodingError as e:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f"Failed to geocode '{group[0].address}': {e}"))
+                continue
+            if not coords:
+                not_found += 1
+                self.stdout.write(self.style.WARNING(f"No match for '{group[0].address}'"))
+                continue
+            for location in group:
+                location.latitude, location.longitude = coords
+                updated.append(location)
+
+        if updated:
+            Location.objects.bulk_update(updated, ['latitude', 'longitude'], batch_size=500)
+            # bulk_update sends no signals, so invalidate by hand.
+            bump_content_version(Location)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Geocoded {len(updated)} location(s) from {len(addresses)} address(es): "
+            f"{not_found} not found, {failed} failed."
+        ))
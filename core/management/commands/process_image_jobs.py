@@ -0,0 +1,47 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core.image_pipeline import claim_jobs, default_stale_timeout, process_jobs, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = 'Worker: optimizes queued uploaded images (ImageOptimizationJob) in a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Encoder processes (default: all cores).')
+        parser.add_argument('--batch-size', type=int, default=None, help='Jobs claimed per round (default: 4 per worker).')
+        parser.add_argument('--poll-interval', type=float, default=5.0, help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--stale-minutes', type=int, default=None, help='Requeue PROCESSING jobs older than this.')
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit (for cron) instead of polling forever.')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        batch_size = options['batch_size'] or workers * 4
+        stale_after = timedelta(minutes=options['stale_minutes']) if options['stale_minutes'] else default_stale_timeout()
+
+        # 'spawn' so encoder processes never inherit this process's DB connection.
+        context = multiprocessing.get_context('spawn')
+        self.stdout.write(f"Image worker started with {workers} process(es).")
+
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            while True:
+                requeued, failed = requeue_stale_jobs(stale_after)
+                if requeued or failed:
+                    self.stdout.write(self.style.WARNING(f"Stale jobs: {requeued} requeued, {failed} failed."))
+
+                jobs = claim_jobs(limit=batch_size)
+                if jobs:
+                    summary = process_jobs(jobs, executor)
+                    report = ', '.join(f"{count} {status.lower()}" for status, count in sorted(summary.items()))
+                    self.stdout.write(self.style.SUCCESS(f"Processed {len(jobs)} job(s): {report}"))
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['poll_interval'])
+
+        self.stdout.write(self.style.SUCCESS("Image queue drained."))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from core.enrollment_stats import rebuild_rollup, rollup_stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes the per-status enrollment totals behind the LMS dashboard header '
+        '(needed after bulk updates or imports, which bypass the signals that keep them current)'
+    )
+
+    def handle(self, *args, **options):
+        rebuild_rollup()
+        stats = rollup_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Enrollments: {stats['total_enrolled']} total, {stats['total_paid']} paid, "
+            f"{stats['total_pending']} pending, revenue {stats['total_revenue']}."
+        ))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.fulltext import SEARCH_INDEXES, ensure_search_schema
+
+
+class Command(BaseCommand):
+    help = (
+        'Drops and rebuilds the full-text search indexes (job posts, enrollments). '
+        'Run it after changing the indexed fields in core.fulltext.SEARCH_INDEXES'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database alias (default: default).')
+
+    def handle(self, *args, **options):
+        errors = ensure_search_schema(options['database'], rebuild=True)
+        if errors is None:
+            self.stdout.write(self.style.WARNING("This database has no full-text support; searches use icontains."))
+            return
+        for index, messages in errors.items():
+            for message in messages:
+                self.stdout.write(self.style.ERROR(f"Failed to build the '{index}' index: {message}"))
+        vendor = connections[options['database']].vendor
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {len(SEARCH_INDEXES) - len(errors)} of {len(SEARCH_INDEXES)} search index(es) on {vendor}."
+        ))
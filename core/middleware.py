@@ -0,0 +1,73 @@
+import mimetypes
+import os
+import posixpath
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from .static_compression import precompressed_variant
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=0, must-revalidate'
+
+
+class PrecompressedStaticMiddleware:
+    """
+    Serves STATIC_ROOT at STATIC_URL for deployments where no web server in
+    front handles /static/ (enable with STATIC_SERVE=True). Sends the .br or
+    .gz sibling written by collectstatic when the client accepts it, so no
+    static response is compressed per request. Content-hashed names (from
+    HashedStaticFilesStorage's manifest) are cached for a year as immutable;
+    anything else is revalidated with Last-Modified.
+
+    Goes right after SecurityMiddleware, so static requests skip the session,
+    CSRF and auth middleware.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'STATIC_SERVE', False) or not settings.STATIC_ROOT:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL if settings.STATIC_URL.startswith('/') else f'/{settings.STATIC_URL}'
+        self.root = os.fspath(settings.STATIC_ROOT)
+        self.hashed_names = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and request.path.startswith(self.prefix):
+            response = self.serve(request, request.path[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def serve(self, request, name):
+        name = posixpath.normpath(name).lstrip('/')
+        try:
+            path = safe_join(self.root, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        stat = os.stat(path)
+        hashed = name in self.hashed_names
+        if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+            response = HttpResponseNotModified()
+        else:
+            variant, encoding = precompressed_variant(path, request.META.get('HTTP_ACCEPT_ENCODING', ''), hashed)
+            content_type, _ = mimetypes.guess_type(path)
+            response = FileResponse(
+                open(variant, 'rb'), content_type=content_type or 'application/octet-stream',
+                filename=os.path.basename(path),
+            )
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Cache-Control'] = IMMUTABLE if hashed else REVALIDATE
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
@@ -1,10 +1,15 @@
+from django.conf import settings
 from django.db import models
 from django.utils.text import slugify
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
+from django.contrib.contenttypes.models import ContentType
 from geopy.distance import geodesic
-from .utils import compress_image_to_webp
-
-import requests
+from .geo import nearest_locations
+from .geocoding import GeocodingError, cached_geocode, geocode
+from .image_pipeline import fresh_image_uploads, queue_image_optimization, reuse_optimized_images
+from .storage import optimized_image_storage
+from .utils import ImageTooLarge, check_image_pixels
 
 
 # ============================================================
@@ -28,14 +33,47 @@ class BaseModel(models.Model):
         return super().save(*args, **kwargs)
 
 
+class OptimizedImageMixin:
+    """
+    Saves immediately with the original upload and queues a WebP optimization
+    job for each new file in `optimized_image_fields`, which swaps the field
+    over when it is ready. The jobs are left to the manage.py process_image_jobs
+    worker, unless IMAGE_OPTIMIZATION_ASYNC=False runs them right after the save.
+    Uploads identical to an image that was already optimized reuse it directly.
+
+    Declare those fields with storage=optimized_image_storage, so identical
+    images are stored once.
+    """
+    optimized_image_fields = ()
+
+    def clean(self):
+        super().clean()
+        # Reject oversized uploads from their header alone, before anything decodes them.
+        errors = {}
+        for name in fresh_image_uploads(self, self.optimized_image_fields):
+            image = getattr(self, name)
+            try:
+                check_image_pixels(image.width, image.height, getattr(settings, 'IMAGE_MAX_SOURCE_PIXELS', None))
+            except ImageTooLarge as e:
+                errors[name] = str(e)
+        if errors:
+            raise ValidationError(errors)
+
+    def save(self, *args, **kwargs):
+        new_uploads = reuse_optimized_images(self, fresh_image_uploads(self, self.optimized_image_fields))
+        super().save(*args, **kwargs)
+        if new_uploads:
+            queue_image_optimization(self, new_uploads)
+
+
 # ============================================================
 # 2. GLOBAL SITE SETTINGS / LANDING PAGE SECTIONS
 # ============================================================
 
-class SiteConfiguration(models.Model):
+class SiteConfiguration(OptimizedImageMixin, models.Model):
     site_name = models.CharField(max_length=100, default="ALIENHOUSE", help_text="The main name of the website displayed in the browser tab.")
-    logo = models.ImageField(upload_to='site_logos/', blank=True, null=True, help_text="Upload the main site logo.")
-    favicon = models.ImageField(upload_to='site_favicons/', blank=True, null=True, help_text="Upload the site favicon (ideally 32x32 or 16x16 png/ico).")
+    logo = models.ImageField(upload_to='site_logos/', storage=optimized_image_storage, blank=True, null=True, help_text="Upload the main site logo.")
+    favicon = models.ImageField(upload_to='site_favicons/', storage=optimized_image_storage, blank=True, null=True, help_text="Upload the site favicon (ideally 32x32 or 16x16 png/ico).")
     logo_highlight_text = models.CharField(max_length=100, default="HOUSE", help_text="Part of the logo text to highlight (usually in a different color).")
 
     address = models.CharField(max_length=200, default="Rajkot, Gujarat, India", help_text="Physical address displayed in the footer.")
@@ -51,21 +89,9 @@ class SiteConfiguration(models.Model):
     razorpay_key_id = models.CharField(max_length=255, blank=True, null=True, help_text="Razorpay Key ID for payments.")
     razorpay_key_secret = models.CharField(max_length=255, blank=True, null=True, help_text="Razorpay Key Secret for payment verification.")
 
-
-    def save(self, *args, **kwargs):
-        try:
-            if self.logo:
-                compress_image_to_webp(self.logo)
-            if self.favicon:
-                # Favicons usually need to be ICO or PNG, but browsers support WebP favicons now.
-                # However, keeping favicon as is might be safer for compatibility.
-                # Let's compress it anyway for modern browsers.
-                compress_image_to_webp(self.favicon)
-        except Exception as e:
-            # Log the error but don't stop the save
-            # logger.error(f"Error compressing images: {e}")
-            pass
-        super().save(*args, **kwargs)
+    # Favicons usually need to be ICO or PNG, but browsers support WebP favicons now.
+    # Let's compress it anyway for modern browsers.
+    optimized_image_fields = ('logo', 'favicon')
 
     def __str__(self):
         return "Site Configuration"
@@ -77,20 +103,17 @@ class SiteConfiguration(models.Model):
 # -------------------------
 # ABOUT US SECTION inside home page indes.html
 # -------------------------
-class AboutUs(models.Model):
+class AboutUs(OptimizedImageMixin, models.Model):
     heading = models.CharField(max_length=255)
     subheading = models.TextField(blank=True)
-    image = models.ImageField(upload_to="about/", blank=True)
+    image = models.ImageField(upload_to="about/", storage=optimized_image_storage, blank=True)
     order = models.PositiveIntegerField(default=0)
 
+    optimized_image_fields = ('image',)
+
     class Meta:
         ordering = ['order']
 
-    def save(self, *args, **kwargs):
-        if self.image:
-            compress_image_to_webp(self.image)
-        super().save(*args, **kwargs)
-
     def __str__(self):
         return self.heading
 
@@ -120,19 +143,16 @@ class HeroSection(models.Model):
 # -------------------------
 # CLIENT LOGOS SECTION
 # -------------------------
-class ClientLogo(models.Model):
-    logo = models.ImageField(upload_to="clients/")
+class ClientLogo(OptimizedImageMixin, models.Model):
+    logo = models.ImageField(upload_to="clients/", storage=optimized_image_storage)
     name = models.CharField(max_length=255)
     order = models.PositiveIntegerField(default=0)
 
+    optimized_image_fields = ('logo',)
+
     class Meta:
         ordering = ['order']
 
-    def save(self, *args, **kwargs):
-        if self.logo:
-            compress_image_to_webp(self.logo)
-        super().save(*args, **kwargs)
-
     def __str__(self):
         return self.name
 
@@ -243,7 +263,6 @@ from django.utils.text import slugify
 from django.core.validators import MinValueValidator
 # GIS imports removed: from django.contrib.gis.db import models as gis_models
 # GIS imports removed: from django.contrib.gis.geos import Point 
-import requests
 
 # Import the distance calculation tool from geopy
 from geopy.distance import geodesic 
@@ -259,33 +278,33 @@ class Location(BaseModel):
     google_map_link = models.URLField(blank=True, null=True, help_text="Google Maps URL. If provided, overrides the auto-generated link.")
     # The PointField is removed as it required GeoDjango/GDAL
 
-    geo_api = "https://nominatim.openstreetmap.org/search"
-
-    def auto_geocode(self):
+    def auto_geocode(self, allow_network=True):
         """
-        Looks up the coordinates for the address using OpenStreetMap's Nominatim API.
+        Looks up the coordinates for the address (see core/geocoding.py: cached,
+        provider configurable, OpenStreetMap's Nominatim by default).
         The latitude and longitude are stored directly in the model's float fields.
+        With allow_network=False only the local geocoding cache is consulted.
         """
         # If coordinates already exist, skip geocoding
-        if self.latitude and self.longitude:
+        if self.latitude is not None and self.longitude is not None:
             return
-            
+        if not self.address:
+            return
+
         try:
-            response = requests.get(
-                self.geo_api,
-                params={"q": self.address, "format": "json"}
-            ).json()
-
-            if response:
-                # Store coordinates as standard floats
-                self.latitude = float(response[0]["lat"])
-                self.longitude = float(response[0]["lon"])
-                # GeoDjango Point object creation removed
-        except Exception:
+            coords = geocode(self.address) if allow_network else cached_geocode(self.address)
+        except GeocodingError:
             # Handle API or network errors silently if geocoding fails
-            pass
+            return
+        if coords:
+            self.latitude, self.longitude = coords
 
     def save(self, *args, **kwargs):
+        # Cache only: the network lookup is left to `manage.py geocode_locations`
+        # (run every 15 minutes by the portfolio-geocode systemd timer), so saving
+        # (e.g. in the admin) never waits on the geocoding API.
+        self.auto_geocode(allow_network=False)
+
         if not self.slug:
             base_slug = slugify(self.name)
             slug = base_slug
@@ -326,10 +345,36 @@ class Location(BaseModel):
         return f"{self.name} ({self.address})"
 
 
+class GeocodeResult(models.Model):
+    """
+    Cached geocoding answer for a normalized address, including "not found"
+    (no coordinates), so each distinct address is looked up once.
+    """
+    query = models.CharField(max_length=255, unique=True, help_text="Normalized address (see core.geocoding.normalize_address).")
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    display_name = models.CharField(max_length=500, blank=True, help_text="Provider's full name for the match.")
+    provider = models.CharField(max_length=50, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Geocode Result"
+        verbose_name_plural = "Geocode Results"
+
+    @property
+    def found(self):
+        return self.latitude is not None and self.longitude is not None
+
+    def __str__(self):
+        return f"{self.query} ({self.latitude}, {self.longitude})" if self.found else f"{self.query} (not found)"
+
+
 # ============================================================
 # 5. SERVICE + SUBSERVICE (Business Services)
 # ============================================================
-class Service(BaseModel):
+class Service(OptimizedImageMixin, BaseModel):
 
     # ... (fields)
     order = models.PositiveIntegerField(default=0, help_text="Order in which this service appears (lowest number first).")
@@ -343,6 +388,7 @@ class Service(BaseModel):
     
     service_image = models.ImageField(
         upload_to="services/main/",
+        storage=optimized_image_storage,
         blank=True,
         null=True,
         help_text="Main image for the service"
@@ -357,6 +403,7 @@ class Service(BaseModel):
 
     hero_image = models.ImageField(
         upload_to="services/hero/",
+        storage=optimized_image_storage,
         blank=True,
         null=True
     )
@@ -374,18 +421,8 @@ class Service(BaseModel):
     advantage_2 = models.CharField(max_length=200, blank=True)
     advantage_3 = models.CharField(max_length=200, blank=True)
 
-    def save(self, *args, **kwargs):
-        # Optimization: Compress images to WebP on save
-        if self.pk:
-            # Check if image has changed (optional optimization, skipping for now for simplicity)
-            pass
-        
-        if self.service_image:
-            compress_image_to_webp(self.service_image)
-        if self.hero_image:
-            compress_image_to_webp(self.hero_image)
-            
-        super().save(*args, **kwargs)
+    # Optimization: Compress images to WebP (queued on save, see OptimizedImageMixin)
+    optimized_image_fields = ('service_image', 'hero_image')
 
     class Meta:
         ordering = ['order', 'name']
@@ -395,18 +432,15 @@ class Service(BaseModel):
 
 # ... (Other models)
 
-class Project(models.Model):
+class Project(OptimizedImageMixin, models.Model):
     title = models.CharField(max_length=100)
     tech_stack = models.CharField(max_length=100)
     description = models.TextField()
-    image = models.ImageField(upload_to='projects/')
+    image = models.ImageField(upload_to='projects/', storage=optimized_image_storage)
     color_class = models.CharField(max_length=50, default="text-alien")
     website_url = models.URLField(blank=True, null=True, help_text="Optional link to live project/website")
-    
-    def save(self, *args, **kwargs):
-        if self.image:
-            compress_image_to_webp(self.image)
-        super().save(*args, **kwargs)
+
+    optimized_image_fields = ('image',)
         
     def __str__(self):
         return self.title
@@ -437,20 +471,17 @@ class SubService(BaseModel):
 
 
 
-class BusinessTeamMember(models.Model):
+class BusinessTeamMember(OptimizedImageMixin, models.Model):
     name = models.CharField(max_length=255)
     role = models.CharField(max_length=255)
-    image = models.ImageField(upload_to="team/", blank=True, null=True)
+    image = models.ImageField(upload_to="team/", storage=optimized_image_storage, blank=True, null=True)
 
     linkedin = models.URLField(blank=True)
     instagram = models.URLField(blank=True)
 
     order = models.PositiveIntegerField(default=1)
 
-    def save(self, *args, **kwargs):
-        if self.image:
-            compress_image_to_webp(self.image)
-        super().save(*args, **kwargs)
+    optimized_image_fields = ('image',)
 
     def __str__(self):
         return self.name
@@ -501,12 +532,18 @@ class ContactMessage(models.Model):
 
     def save(self, *args, **kwargs):
         # Calculate the distance upon saving if all necessary data is present
-        if self.user_lat and self.user_lon and self.location:
-            # Calls the non-GIS distance_from method on the related Location object
-            dist = self.location.distance_from(self.user_lat, self.user_lon)
-            if dist is not None:
-                self.distance_km = dist
-                
+        if self.user_lat is not None and self.user_lon is not None:
+            if self.location_id is None:
+                # Auto-assign the closest office
+                nearest = nearest_locations(self.user_lat, self.user_lon, k=1)
+                if nearest:
+                    self.location_id, self.distance_km = nearest[0]
+            else:
+                # Calls the non-GIS distance_from method on the related Location object
+                dist = self.location.distance_from(self.user_lat, self.user_lon)
+                if dist is not None:
+                    self.distance_km = dist
+
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -808,24 +845,20 @@ class EventItem(models.Model):
         return self.title
 
 
-class AboutUsGalleryImage(models.Model):
+class AboutUsGalleryImage(OptimizedImageMixin, models.Model):
     """
     Images for the About Us page slideshow/gallery.
     """
     about_page = models.ForeignKey(AboutUsPage, on_delete=models.CASCADE, related_name="gallery_images")
-    image = models.ImageField(upload_to="about_us/gallery/")
+    image = models.ImageField(upload_to="about_us/gallery/", storage=optimized_image_storage)
     caption = models.CharField(max_length=200, blank=True, help_text="Optional caption for the image.")
     order = models.PositiveIntegerField(default=0)
 
+    optimized_image_fields = ('image',)
+
     class Meta:
         ordering = ["order"]
 
-    def save(self, *args, **kwargs):
-        if self.image:
-           from .utils import compress_image_to_webp
-           compress_image_to_webp(self.image)
-        super().save(*args, **kwargs)
-
     def __str__(self):
         return f"Gallery Image {self.order} - {self.caption or 'No Caption'}"
 
@@ -977,27 +1010,23 @@ class TrainingField(BaseModel):
         return self.name
 
 
-class TrainingSubField(BaseModel):
+class TrainingSubField(OptimizedImageMixin, BaseModel):
     """
     Specific niche within a training field, e.g., 'Backend Development', 'Performance Marketing'.
     """
     field = models.ForeignKey(TrainingField, on_delete=models.CASCADE, related_name="sub_fields")
     description = models.TextField(blank=True)
-    image = models.ImageField(upload_to="training/subfields/", blank=True, null=True)
+    image = models.ImageField(upload_to="training/subfields/", storage=optimized_image_storage, blank=True, null=True)
 
     class Meta:
         verbose_name = "Training Sub-field"
         verbose_name_plural = "Training Sub-fields"
 
+    optimized_image_fields = ('image',)
+
     def __str__(self):
         return f"{self.field.name} -> {self.name}"
 
-    def save(self, *args, **kwargs):
-        if self.image:
-            from .utils import compress_image_to_webp
-            compress_image_to_webp(self.image)
-        super().save(*args, **kwargs)
-
 
 class TrainingPackage(models.Model):
     """
@@ -1101,6 +1130,119 @@ class TrainingEnrollment(models.Model):
 
     class Meta:
         ordering = ['-enrollment_date']
+        indexes = [
+            # Keyset pagination of the LMS dashboard table, unfiltered and by status.
+            models.Index(fields=['-enrollment_date', '-id']),
+            models.Index(fields=['payment_status', '-enrollment_date', '-id']),
+        ]
+
+    def __str__(self):
+        return f"{self.full_name} | {self.package.name if self.package else 'N/A'}"
+
+
+class EnrollmentStatusTotal(models.Model):
+    """
+    Running enrollment count and price total per payment status, read by the LMS
+    dashboard header. Maintained by signals (see core/enrollment_stats.py).
+    """
+    payment_status = models.CharField(max_length=20, unique=True)
+    count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.payment_status}: {self.count}"
+
+
+# ============================================================
+# 11. MEDIA PROCESSING
+# ============================================================
+
+class ImageOptimizationJob(models.Model):
+    """
+    Queue entry for an image awaiting optimization: a new upload, or an existing
+    file queued by `manage.py backfill_images` (`batch` set).
+    Processed by `manage.py process_image_jobs` (see core/image_pipeline.py).
+    """
+    PENDING = 'PENDING'
+    PROCESSING = 'PROCESSING'
+    COMPLETED = 'COMPLETED'
+    SKIPPED = 'SKIPPED'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (COMPLETED, 'Completed'),
+        (SKIPPED, 'Skipped'),
+        (FAILED, 'Failed'),
+    ]
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveBigIntegerField()
+    field_name = models.CharField(max_length=100)
+    source_name = models.CharField(max_length=255, help_text="File the job was created for; the swap is skipped if the field has changed since.")
+    batch = models.CharField(max_length=50, blank=True, db_index=True, help_text="Backfill run that queued the job; empty for uploads.")
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    source_size = models.PositiveBigIntegerField(null=True, blank=True, help_text="Bytes of the original file.")
+    optimized_size = models.PositiveBigIntegerField(null=True, blank=True, help_text="Bytes of the optimized full-size file.")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+        verbose_name = "Image Optimization Job"
+        verbose_name_plural = "Image Optimization Jobs"
+
+    def __str__(self):
+        return f"{self.content_type.model}#{self.object_id}.{self.field_name} ({self.status})"
+
+
+class ImageRendition(models.Model):
+    """
+    One stored size/format of an optimized image (the full-size file included),
+    used to build srcset attributes and <picture> sources. Keyed by file name, so any ImageField can use it.
+    """
+    source_name = models.CharField(max_length=255, db_index=True, help_text="Storage name of the full-size image.")
+    name = models.CharField(max_length=255, help_text="Storage name of this rendition.")
+    format = models.CharField(max_length=10, default='webp', help_text="Encoding profile, e.g. 'webp' or 'avif'.")
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    file_size = models.PositiveIntegerField(default=0, help_text="Size in bytes.")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['source_name', 'width']
+        constraints = [
+            models.UniqueConstraint(fields=['source_name', 'format', 'width'], name='unique_rendition_format_width'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.format}, {self.width}w)"
+
+
+class ImageMetadata(models.Model):
+    """
+    Intrinsic size and placeholder (dominant colour + tiny LQIP data URI) of an
+    optimized image, recorded when it is processed so templates can reserve the
+    layout box and paint something before the real file arrives.
+    """
+    source_name = models.CharField(max_length=255, unique=True, help_text="Storage name of the full-size image.")
+    source_hash = models.CharField(max_length=64, blank=True, db_index=True, help_text="SHA-256 of the original upload it was made from.")
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    dominant_color = models.CharField(max_length=7, blank=True, help_text="Hex colour, e.g. #1a2b3c.")
+    lqip = models.TextField(blank=True, help_text="Blurred low-quality placeholder as a data: URI.")
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Image metadata"
 
     def __str__(self):
-        return f"{self.full_name} | {self.package.name if self.package else 'N/A'}"
\ No newline at end of file
+        return f"{self.source_name} ({self.width}x{self.height})"
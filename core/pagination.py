@@ -0,0 +1,53 @@
+"""
+Keyset (cursor) pagination, newest first.
+
+A page is read with a WHERE on the sort key of the last row already sent
+instead of an OFFSET, so every page is one index range scan however deep the
+client has scrolled, and rows added in the meantime do not shift later pages.
+The sort key is a datetime field plus the primary key as a tie-breaker.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """
+    The cursor was not produced by encode_cursor().
+    """
+
+
+def encode_cursor(moment, pk):
+    return base64.urlsafe_b64encode(f'{moment.isoformat()}|{pk}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        moment, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(moment), int(pk)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}") from e
+
+
+def keyset_page(queryset, date_field, cursor=None, size=50):
+    """
+    Returns (rows, next_cursor): up to `size` rows of `queryset` ordered by
+    `date_field` then pk, descending, starting after `cursor`. next_cursor is
+    None on the last page. Works with model instances and with values() rows,
+    which must include `id` and `date_field`. Raises InvalidCursor.
+    """
+    queryset = queryset.order_by(f'-{date_field}', '-pk')
+    if cursor:
+        moment, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(**{f'{date_field}__lt': moment}) | Q(**{date_field: moment, 'pk__lt': pk}))
+
+    rows = list(queryset[:size + 1])
+    if len(rows) <= size:
+        return rows, None
+    rows = rows[:size]
+    last = rows[-1]
+    if isinstance(last, dict):
+        return rows, encode_cursor(last[date_field], last['id'])
+    return rows, encode_cursor(getattr(last, date_field), last.pk)
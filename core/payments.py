@@ -0,0 +1,155 @@
+"""
+Payment gateway for training enrollments.
+
+Views go through a gateway object instead of building a razorpay.Client per
+request. PAYMENT_GATEWAY names the class and PAYMENT_GATEWAY_OPTIONS its
+keyword arguments, so tests and local development can use StubGateway, which
+never touches the network. RazorpayGateway keeps one client per set of
+credentials for the whole process, all on one pooled HTTP session, with
+bounded connect/read timeouts so a slow gateway cannot hold a worker for
+long. Only connection failures are retried (with backoff): the request never
+reached Razorpay, whereas retrying a timed-out order POST could create a
+second order.
+"""
+import hashlib
+import hmac
+import itertools
+import threading
+
+import razorpay
+import requests
+from django.conf import settings
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .context_processors import site_configuration
+
+
+class PaymentError(Exception):
+    """
+    The gateway could not be reached or rejected the request.
+    """
+
+
+def razorpay_credentials(site_config=None):
+    """
+    (key id, key secret): the admin-configured keys, else the settings'.
+    Without `site_config`, reads the cached site configuration (no query on a
+    cache hit).
+    """
+    if site_config is None:
+        site_config = site_configuration()
+    key_id = site_config.razorpay_key_id if site_config and site_config.razorpay_key_id else settings.RAZORPAY_KEY_ID
+    key_secret = (
+        site_config.razorpay_key_secret if site_config and site_config.razorpay_key_secret
+        else settings.RAZORPAY_KEY_SECRET
+    )
+    return key_id, key_secret
+
+
+def payment_signature(key_secret, order_id, payment_id):
+    """
+    The signature Razorpay's checkout returns for a payment (HMAC-SHA256 of
+    "order_id|payment_id" keyed with the key secret).
+    """
+    return hmac.new(key_secret.encode(), f'{order_id}|{payment_id}'.encode(), hashlib.sha256).hexdigest()
+
+
+def _signature_matches(credentials, order_id, payment_id, signature):
+    expected = payment_signature(credentials[1], order_id, payment_id)
+    return hmac.compare_digest(expected, str(signature))
+
+
+class RazorpayGateway:
+    """
+    Razorpay Orders API over one pooled HTTP session.
+    """
+    name = 'razorpay'
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10.0, retries=2, backoff=0.5, pool_size=10):
+        self.timeout = (connect_timeout, read_timeout)
+        self._clients = {}
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        # connect= only: a connection error means nothing was sent. No read or
+        # status retries, since order creation is not idempotent.
+        retry = Retry(total=retries, connect=retries, read=0, status=0, other=0, backoff_factor=backoff)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def client(self, credentials):
+        """
+        The razorpay.Client for `credentials`, created once per process.
+        """
+        credentials = tuple(credentials)
+        client = self._clients.get(credentials)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(credentials)
+                if client is None:
+                    client = razorpay.Client(session=self.session, auth=credentials)
+                    self._clients[credentials] = client
+        return client
+
+    def create_order(self, credentials, amount, currency='INR'):
+        """
+        Creates an auto-captured order for `amount` (in the currency's smallest
+        unit) and returns it ({'id', 'amount', 'currency', ...}).
+        """
+        data = {'amount': amount, 'currency': currency, 'payment_capture': '1'}
+        try:
+            return self.client(credentials).order.create(data, timeout=self.timeout)
+        except (
+            requests.RequestException, ValueError,
+            razorpay.errors.BadRequestError, razorpay.errors.GatewayError, razorpay.errors.ServerError,
+        ) as e:
+            raise PaymentError(f"{self.name}: {e}") from e
+
+    def verify_payment(self, credentials, order_id, payment_id, signature):
+        """
+        Whether `signature` is the gateway's signature of the payment. Local,
+        no request.
+        """
+        return _signature_matches(credentials, order_id, payment_id, signature)
+
+
+class StubGateway:
+    """
+    In-process gateway for tests and local development: orders get sequential
+    ids and are kept in `orders`; signatures are checked like Razorpay's, so
+    a test can complete a payment with payment_signature(). Transport options
+    (timeouts, retries) are accepted and ignored.
+    """
+    name = 'stub'
+
+    def __init__(self, **options):
+        self.orders = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def create_order(self, credentials, amount, currency='INR'):
+        with self._lock:
+            order = {'id': f'order_stub{next(self._ids):010d}', 'amount': amount, 'currency': currency, 'status': 'created'}
+            self.orders.append(order)
+        return order
+
+    def verify_payment(self, credentials, order_id, payment_id, signature):
+        return _signature_matches(credentials, order_id, payment_id, signature)
+
+
+_gateway = None
+
+
+def get_gateway():
+    """
+    The configured gateway, built once per process so its HTTP session (and
+    connection pool) and clients are reused across requests.
+    """
+    global _gateway
+    if _gateway is None:
+        gateway_class = import_string(getattr(settings, 'PAYMENT_GATEWAY', 'core.payments.RazorpayGateway'))
+        _gateway = gateway_class(**getattr(settings, 'PAYMENT_GATEWAY_OPTIONS', {}))
+    return _gateway
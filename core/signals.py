@@ -0,0 +1,95 @@
+from django.db import transaction
+from django.db.models.signals import pre_delete, pre_save, post_save, post_delete, post_migrate, m2m_changed
+from django.dispatch import receiver
+
+from .cache import bump_content_version
+from .enrollment_stats import apply_rollup_change
+from .fulltext import ensure_search_schema
+from .models import TrainingEnrollment
+from .site_search import SOURCES as SITE_SEARCH_SOURCES, update_documents
+
+# Apps whose models feed cached snapshots (site chrome, page caches, game world).
+VERSIONED_APPS = ('core',)
+
+
+def _is_versioned(model):
+    return model._meta.app_label in VERSIONED_APPS
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_version_on_change(sender, **kwargs):
+    if _is_versioned(sender):
+        bump_content_version(sender)
+
+
+@receiver(m2m_changed)
+def bump_version_on_m2m_change(sender, instance, action, model, **kwargs):
+    if not action.startswith('post_'):
+        return
+    for changed in (type(instance), model):
+        if _is_versioned(changed):
+            bump_content_version(changed)
+
+
+ROLLUP_FIELDS = {'payment_status', 'final_price'}
+
+
+def _enrollment_state(instance):
+    return instance.payment_status, instance.final_price
+
+
+def _stored_enrollment_state(instance):
+    # What the rollup currently counts for this row; None if it is not stored yet.
+    if instance.pk is None:
+        return None
+    return TrainingEnrollment.objects.filter(pk=instance.pk).values_list('payment_status', 'final_price').first()
+
+
+def _touches_rollup(update_fields):
+    return update_fields is None or bool(ROLLUP_FIELDS & set(update_fields))
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def update_site_search(sender, instance, raw=False, **kwargs):
+    label = sender._meta.label
+    if raw or label not in SITE_SEARCH_SOURCES:
+        return
+    pk = instance.pk
+    # robust: a failed index write is logged, never fails the save.
+    transaction.on_commit(lambda: update_documents(label, [pk]), robust=True)
+
+
+@receiver(post_migrate)
+def create_search_indexes(sender, using='default', **kwargs):
+    # Full-text indexes live outside Django's schema (see core/fulltext.py).
+    if sender.name == 'core':
+        ensure_search_schema(using)
+
+
+# The stored state is read just before a write (one query by pk), not when
+# instances are loaded, so listing enrollments (deferred fields included) costs
+# nothing extra.
+@receiver(pre_save, sender=TrainingEnrollment)
+def remember_enrollment_state(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw and _touches_rollup(update_fields):
+        instance._rollup_state = _stored_enrollment_state(instance)
+
+
+@receiver(post_save, sender=TrainingEnrollment)
+def update_rollup_on_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or not _touches_rollup(update_fields):
+        return
+    old = None if created else getattr(instance, '_rollup_state', None)
+    apply_rollup_change(old, _enrollment_state(instance))
+
+
+@receiver(pre_delete, sender=TrainingEnrollment)
+def remember_deleted_enrollment_state(sender, instance, **kwargs):
+    instance._rollup_state = _stored_enrollment_state(instance)
+
+
+@receiver(post_delete, sender=TrainingEnrollment)
+def update_rollup_on_delete(sender, instance, **kwargs):
+    apply_rollup_change(getattr(instance, '_rollup_state', None), None)
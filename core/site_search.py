@@ -0,0 +1,461 @@
+"""
+Site-wide typeahead search over services, projects, jobs and training.
+
+Documents from the models in SOURCES are kept in an in-process inverted index
+(term -> {document: weight}, with the terms sorted so a prefix is a bisect
+range), so a query never touches the database. The index is persisted to
+SITE_SEARCH_INDEX_PATH in a compact binary format, so a worker loads it
+instead of rebuilding it, and it is updated incrementally: saving or deleting
+a source object re-indexes just that object (and objects whose document
+depends on it) once the transaction commits, and rewrites the file. Other
+workers notice the new file by its mtime and reload it on their next query.
+
+Note: queryset.update() / bulk_create() / bulk_update() do not send signals.
+Run `manage.py build_site_search` after using them on a source model.
+"""
+import os
+import re
+import struct
+import threading
+import unicodedata
+import zlib
+from bisect import bisect_left, insort
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Optional: no cross-process lock on Windows.
+    fcntl = None
+
+from django.apps import apps
+from django.conf import settings
+from django.urls import reverse
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+MAGIC = b'AHSS'
+FORMAT_VERSION = 1
+TITLE_WEIGHT = 3
+BODY_WEIGHT = 1
+SUMMARY_CHARS = 140
+# Terms a prefix may expand to (the first ones in sorted order), so a one- or
+# two-letter query stays as fast as a whole word.
+MAX_EXPANSIONS = 256
+
+
+# ------------------------------------------------------------
+# Documents
+# ------------------------------------------------------------
+
+def _text(*values):
+    return ' '.join(strip_tags(value) for value in values if value)
+
+
+def _index_url(anchor):
+    return f"{reverse('index')}#{anchor}"
+
+
+def _service(obj):
+    if not obj.is_active:
+        return None
+    return obj.name, reverse('service_detail', args=[obj.slug]), _text(
+        obj.short_description, obj.description, obj.technical_specs, obj.advantage_1, obj.advantage_2, obj.advantage_3,
+    )
+
+
+def _sub_service(obj):
+    if not (obj.is_active and obj.service.is_active):
+        return None
+    return obj.name, reverse('service_detail', args=[obj.service.slug]), _text(obj.description, obj.service.name)
+
+
+def _service_module(obj):
+    service = obj.sub_service.service if obj.sub_service else None
+    url = reverse('service_detail', args=[service.slug]) if service and service.is_active else _index_url('services')
+    return obj.title, url, _text(obj.description, obj.features_list)
+
+
+def _project(obj):
+    return obj.title, obj.website_url or _index_url('rnd'), _text(obj.description, obj.tech_stack)
+
+
+def _lab_experiment(obj):
+    return obj.title, obj.website_url or _index_url('rnd'), _text(obj.description)
+
+
+def _job_post(obj):
+    if not obj.is_active:
+        return None
+    return obj.title, reverse('job_detail', args=[obj.slug]), _text(obj.description, obj.location, obj.get_job_type_display())
+
+
+def _training_sub_field(obj):
+    if not (obj.is_active and obj.field.is_active):
+        return None
+    return obj.name, reverse('training_subfield_detail', args=[obj.slug]), _text(obj.description, obj.field.name)
+
+
+def _training_package(obj):
+    if not (obj.sub_field.is_active and obj.sub_field.field.is_active):
+        return None
+    return (
+        f"{obj.sub_field.name} - {obj.name}", reverse('training_subfield_detail', args=[obj.sub_field.slug]),
+        _text(obj.features, obj.duration),
+    )
+
+
+# Model label -> document builder ((title, url, body), or None to leave the
+# object out; no builder for a model that only appears in other documents),
+# related objects to load with it, and the labels/lookups of other sources
+# whose documents include this model's fields.
+SOURCES = {
+    'core.Service': {'document': _service, 'related': (), 'dependents': {
+        'core.SubService': 'service', 'core.ServiceModule': 'sub_service__service',
+    }},
+    'core.SubService': {'document': _sub_service, 'related': ('service',), 'dependents': {
+        'core.ServiceModule': 'sub_service',
+    }},
+    'core.ServiceModule': {'document': _service_module, 'related': ('sub_service__service',), 'dependents': {}},
+    'core.Project': {'document': _project, 'related': (), 'dependents': {}},
+    'core.LabExperiment': {'document': _lab_experiment, 'related': (), 'dependents': {}},
+    'core.JobPost': {'document': _job_post, 'related': (), 'dependents': {}},
+    'core.TrainingField': {'document': None, 'related': (), 'dependents': {
+        'core.TrainingSubField': 'field', 'core.TrainingPackage': 'sub_field__field',
+    }},
+    'core.TrainingSubField': {'document': _training_sub_field, 'related': ('field',), 'dependents': {
+        'core.TrainingPackage': 'sub_field',
+    }},
+    'core.TrainingPackage': {'document': _training_package, 'related': ('sub_field__field',), 'dependents': {}},
+}
+
+
+def tokenize(text):
+    """
+    Lowercase, accent-folded words.
+    """
+    text = unicodedata.normalize('NFKD', text.lower())
+    return re.findall(r'\w+', ''.join(c for c in text if not unicodedata.combining(c)))
+
+
+def _documents(label, pks=None):
+    """
+    Yields (key, kind, title, url, body) for the objects of `label` (all, or
+    those in `pks`); objects the builder leaves out yield body None.
+    """
+    spec = SOURCES[label]
+    model = apps.get_model(label)
+    queryset = model.objects.select_related(*spec['related'])
+    if pks is not None:
+        queryset = queryset.filter(pk__in=pks)
+    kind = str(model._meta.verbose_name).title()
+    for obj in queryset.iterator():
+        document = spec['document'](obj)
+        key = f'{label}:{obj.pk}'
+        yield (key, kind, *document) if document else (key, kind, None, None, None)
+
+
+# ------------------------------------------------------------
+# Index
+# ------------------------------------------------------------
+
+class SiteSearchIndex:
+    """
+    Documents with numeric ids and, per term, {document id: weight}.
+    """
+
+    def __init__(self):
+        self.docs = {}  # id -> (key, kind, title, url, summary)
+        self.ids = {}  # key -> id
+        self.doc_terms = {}  # id -> terms, for removal (not persisted)
+        self.postings = {}  # term -> {id: weight}
+        self.terms = []  # sorted keys of postings
+        self.next_id = 0
+
+    def __len__(self):
+        return len(self.docs)
+
+    def copy(self):
+        return type(self).from_bytes(self.to_bytes())
+
+    def add(self, key, kind, title, url, body):
+        self.remove(key)
+        doc_id = self.next_id
+        self.next_id += 1
+        summary = Truncator(' '.join(body.split())).chars(SUMMARY_CHARS)
+        self.docs[doc_id] = (key, kind, title, url, summary)
+        self.ids[key] = doc_id
+
+        weights = dict.fromkeys(tokenize(body), BODY_WEIGHT)
+        weights.update(dict.fromkeys(tokenize(title), TITLE_WEIGHT))
+        self.doc_terms[doc_id] = tuple(weights)
+        for term, weight in weights.items():
+            if term not in self.postings:
+                self.postings[term] = {}
+                insort(self.terms, term)
+            self.postings[term][doc_id] = weight
+
+    def remove(self, key):
+        doc_id = self.ids.pop(key, None)
+        if doc_id is None:
+            return
+        del self.docs[doc_id]
+        for term in self.doc_terms.pop(doc_id):
+            del self.postings[term][doc_id]
+            if not self.postings[term]:
+                del self.postings[term]
+                del self.terms[bisect_left(self.terms, term)]
+
+    def _prefix_matches(self, prefix):
+        """
+        {id: score} for documents containing a term that starts with `prefix`.
+        An exact term match counts double.
+        """
+        scores = {}
+        start = bisect_left(self.terms, prefix)
+        end = min(bisect_left(self.terms, prefix + '\uffff', start), start + MAX_EXPANSIONS)
+        for term in self.terms[start:end]:
+            boost = 2 if term == prefix else 1
+            for doc_id, weight in self.postings[term].items():
+                scores[doc_id] = max(scores.get(doc_id, 0), weight * boost)
+        return scores
+
+    def search(self, query, limit=10):
+        """
+        Documents containing every word of `query` (each as a prefix), best
+        first, as dicts with type, title, url and summary.
+        """
+        scores = None
+        for term in dict.fromkeys(tokenize(query)):
+            matches = self._prefix_matches(term)
+            if scores is None:
+                scores = matches
+            else:
+                scores = {doc_id: score + matches[doc_id] for doc_id, score in scores.items() if doc_id in matches}
+            if not scores:
+                return []
+
+        ranked = sorted((scores or {}).items(), key=lambda item: (-item[1], len(self.docs[item[0]][2])))
+        results = []
+        for doc_id, score in ranked[:limit]:
+            key, kind, title, url, summary = self.docs[doc_id]
+            results.append({'type': kind, 'title': title, 'url': url, 'summary': summary})
+        return results
+
+    # Binary format: MAGIC, version byte, then zlib-compressed varints and
+    # length-prefixed UTF-8 strings: documents, then terms with their postings
+    # as document-id deltas and weights.
+
+    def to_bytes(self):
+        out = bytearray()
+        _write_varint(out, self.next_id)
+        _write_varint(out, len(self.docs))
+        for doc_id in sorted(self.docs):
+            _write_varint(out, doc_id)
+            for value in self.docs[doc_id]:
+                _write_string(out, value)
+        _write_varint(out, len(self.terms))
+        for term in self.terms:
+            _write_string(out, term)
+            postings = self.postings[term]
+            _write_varint(out, len(postings))
+            previous = 0
+            for doc_id in sorted(postings):
+                _write_varint(out, doc_id - previous)
+                out.append(postings[doc_id])
+                previous = doc_id
+        return MAGIC + struct.pack('B', FORMAT_VERSION) + zlib.compress(bytes(out), 9)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if data[:len(MAGIC)] != MAGIC or data[len(MAGIC)] != FORMAT_VERSION:
+            raise ValueError("Not a site search index (or an older format).")
+        data = zlib.decompress(data[len(MAGIC) + 1:])
+        index, pos = cls(), 0
+        index.next_id, pos = _read_varint(data, pos)
+        count, pos = _read_varint(data, pos)
+        for _ in range(count):
+            doc_id, pos = _read_varint(data, pos)
+            values = []
+            for _ in range(5):
+                value, pos = _read_string(data, pos)
+                values.append(value)
+            index.docs[doc_id] = tuple(values)
+            index.ids[values[0]] = doc_id
+        count, pos = _read_varint(data, pos)
+        for _ in range(count):
+            term, pos = _read_string(data, pos)
+            size, pos = _read_varint(data, pos)
+            postings, doc_id = {}, 0
+            for _ in range(size):
+                delta, pos = _read_varint(data, pos)
+                doc_id += delta
+                postings[doc_id] = data[pos]
+                pos += 1
+            index.postings[term] = postings
+            index.terms.append(term)
+            for doc_id in postings:
+                index.doc_terms.setdefault(doc_id, []).append(term)
+        return index
+
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _write_string(out, value):
+    encoded = value.encode()
+    _write_varint(out, len(encoded))
+    out += encoded
+
+
+def _read_string(data, pos):
+    size, pos = _read_varint(data, pos)
+    return data[pos:pos + size].decode(), pos + size
+
+
+# ------------------------------------------------------------
+# Persistence
+# ------------------------------------------------------------
+
+_state = {'index': None, 'mtime': None}
+_lock = threading.Lock()
+
+
+def index_path():
+    return str(getattr(settings, 'SITE_SEARCH_INDEX_PATH', settings.BASE_DIR / '.cache' / 'site_search.idx'))
+
+
+@contextmanager
+def _file_lock():
+    # Serializes read-modify-write of the index file across worker processes.
+    path = index_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with _lock, open(f'{path}.lock', 'a') as fh:
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        yield
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _save(index):
+    path = index_path()
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as fh:
+        fh.write(index.to_bytes())
+    os.replace(tmp_path, path)
+    _state.update(index=index, mtime=_mtime(path))
+
+
+def _build():
+    # Caller holds _file_lock().
+    index = SiteSearchIndex()
+    for label, spec in SOURCES.items():
+        if spec['document'] is None:
+            continue
+        for key, kind, title, url, body in _documents(label):
+            if body is not None:
+                index.add(key, kind, title, url, body)
+    _save(index)
+    return index
+
+
+def build_index():
+    """
+    Indexes every source object and saves the index file.
+    """
+    with _file_lock():
+        return _build()
+
+
+def _load():
+    """
+    The index in the index file (cached until the file's mtime changes), or
+    None if there is no readable file.
+    """
+    path = index_path()
+    mtime = _mtime(path)
+    if _state['index'] is not None and mtime == _state['mtime']:
+        return _state['index']
+    if mtime is None:
+        return None
+    try:
+        with open(path, 'rb') as fh:
+            index = SiteSearchIndex.from_bytes(fh.read())
+    except (OSError, ValueError, zlib.error, IndexError, UnicodeDecodeError):
+        return None
+    _state.update(index=index, mtime=mtime)
+    return index
+
+
+def _load_or_build():
+    # Caller holds _file_lock(). Loads again first: another worker may have
+    # written the file while this one waited for the lock.
+    index = _load()
+    return index if index is not None else _build()
+
+
+def get_index():
+    """
+    This process's index: loaded from the index file (reloaded when another
+    process rewrites it), or built if there is none.
+    """
+    index = _load()
+    if index is None:
+        with _file_lock():
+            index = _load_or_build()
+    return index
+
+
+def update_documents(label, pks):
+    """
+    Re-indexes the objects of `label` with the given pks (removing deleted or
+    hidden ones) and the documents that depend on them, then saves the file.
+    """
+    changes = {label: set(pks)} if SOURCES[label]['document'] else {}
+    for dependent, lookup in SOURCES[label]['dependents'].items():
+        model = apps.get_model(dependent)
+        changes.setdefault(dependent, set()).update(
+            model.objects.filter(**{f'{lookup}__in': pks}).values_list('pk', flat=True)
+        )
+
+    with _file_lock():
+        # Changes go to a copy, swapped in by _save(): other threads may be
+        # searching the current index.
+        index = _load_or_build().copy()
+        for changed_label, changed_pks in changes.items():
+            found = set()
+            for key, kind, title, url, body in _documents(changed_label, changed_pks):
+                found.add(key)
+                if body is None:
+                    index.remove(key)
+                else:
+                    index.add(key, kind, title, url, body)
+            for pk in changed_pks:
+                key = f'{changed_label}:{pk}'
+                if key not in found:
+                    index.remove(key)
+        _save(index)
+
+
+def search(query, limit=10):
+    return get_index().search(query, limit)
@@ -0,0 +1,148 @@
+"""
+Precompressed static files.
+
+collectstatic (core.storage.HashedStaticFilesStorage) writes a `.br` and a
+`.gz` sibling next to every compressible file in STATIC_ROOT, at maximum
+compression, in parallel worker processes. Whatever serves /static/ then only
+picks the variant the client accepts: nginx with `gzip_static on;` and
+`brotli_static on;`, or core.middleware.PrecompressedStaticMiddleware when
+Django serves STATIC_ROOT itself (STATIC_SERVE=True).
+
+Siblings are rewritten only when the file is newer than them, or, for
+content-hashed names (which collectstatic rewrites on every run), only when
+missing, so a collectstatic that copies nothing new compresses nothing. No sibling is
+written when compression saves too little to be worth a separate response
+(e.g. a GLB made mostly of JPEG textures); a quick gzip pass detects those
+before the slow maximum-level one.
+"""
+import gzip
+import logging
+import multiprocessing
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import brotli
+except ImportError:  # optional: only .gz siblings are written without it
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_EXTENSIONS = (
+    '.css', '.js', '.mjs', '.map', '.json', '.html', '.txt', '.xml', '.svg',
+    '.glb', '.gltf', '.bin', '.wasm', '.ico', '.ttf', '.otf', '.eot',
+)
+# Not worth it below this size: the response headers dominate.
+MIN_SIZE = 256
+# A sibling must be at most this fraction of the original to be kept.
+MAX_RATIO = 0.95
+
+# Suffix -> (Content-Encoding, compress function), in order of preference.
+ENCODINGS = {
+    '.br': ('br', lambda data: brotli.compress(data, quality=11)),
+    '.gz': ('gzip', lambda data: gzip.compress(data, compresslevel=9, mtime=0)),
+}
+
+
+def available_encodings():
+    return {suffix: value for suffix, value in ENCODINGS.items() if suffix != '.br' or brotli is not None}
+
+
+def is_compressible(path):
+    return path.lower().endswith(COMPRESSIBLE_EXTENSIONS)
+
+
+def _is_current(path, sibling):
+    try:
+        return os.path.getmtime(sibling) >= os.path.getmtime(path)
+    except OSError:
+        return False
+
+
+def compress_file(path):
+    """
+    Writes the missing or outdated siblings of `path`. Runs in a worker
+    process; returns the suffixes written.
+    """
+    with open(path, 'rb') as fh:
+        data = fh.read()
+    worth_it = len(zlib.compress(data, 1)) <= len(data) * MAX_RATIO
+    written = []
+    for suffix, (encoding, compress) in available_encodings().items():
+        sibling = path + suffix
+        if worth_it and _is_current(path, sibling):
+            continue
+        compressed = compress(data) if worth_it else None
+        if compressed is None or len(compressed) > len(data) * MAX_RATIO:
+            if os.path.exists(sibling):
+                os.remove(sibling)
+            continue
+        tmp = f'{sibling}.tmp{os.getpid()}'
+        with open(tmp, 'wb') as fh:
+            fh.write(compressed)
+        os.replace(tmp, sibling)
+        written.append(suffix)
+    return written
+
+
+def _pending(root, hashed_names):
+    for directory, _dirs, files in os.walk(root):
+        for name in files:
+            path = os.path.join(directory, name)
+            if not is_compressible(name) or os.path.getsize(path) < MIN_SIZE:
+                continue
+            if os.path.relpath(path, root).replace(os.sep, '/') in hashed_names:
+                # The name changes with the content: an existing sibling is current.
+                current = all(os.path.exists(path + suffix) for suffix in available_encodings())
+            else:
+                current = all(_is_current(path, path + suffix) for suffix in available_encodings())
+            if not current:
+                yield path
+
+
+def compress_tree(root, workers=None, hashed_names=()):
+    """
+    Compresses every compressible file under `root` that has no current
+    siblings; `hashed_names` are content-hashed paths relative to `root`.
+    Returns (files compressed, siblings written).
+    """
+    pending = sorted(_pending(root, set(hashed_names)), key=os.path.getsize, reverse=True)  # biggest first
+    if not pending:
+        return 0, 0
+    workers = max(1, min(workers or os.cpu_count() or 1, len(pending)))
+    if workers == 1:
+        written = sum(len(suffixes) for suffixes in map(compress_file, pending))
+    else:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            written = sum(len(suffixes) for suffixes in executor.map(compress_file, pending))
+    logger.info('Precompressed %d static file(s) into %d sibling(s).', len(pending), written)
+    return len(pending), written
+
+
+def accepted_encodings(accept_encoding):
+    """
+    Content codings listed in an Accept-Encoding header (q=0 excluded).
+    """
+    accepted = set()
+    for part in accept_encoding.split(','):
+        coding, _, params = part.partition(';')
+        params = params.replace(' ', '')
+        if coding.strip() and params not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def precompressed_variant(path, accept_encoding, hashed=False):
+    """
+    (sibling path, Content-Encoding) of the best precompressed variant of
+    `path` that the client accepts, or (path, None). `hashed`: the file has a
+    content-hashed name (see _pending()).
+    """
+    accepted = accepted_encodings(accept_encoding)
+    for suffix, (encoding, _compress) in ENCODINGS.items():
+        sibling = path + suffix
+        if encoding in accepted and (os.path.exists(sibling) if hashed else _is_current(path, sibling)):
+            return sibling, encoding
+    return path, None
@@ -0,0 +1,79 @@
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage, storages
+
+from .static_compression import compress_tree
+from .utils import content_hash
+
+
+def optimized_image_storage():
+    """
+    Storage of the image fields OptimizedImageMixin optimizes (the
+    'optimized_images' entry of STORAGES). Other file fields keep the default
+    storage, with their upload_to directories and file names.
+    """
+    return storages['optimized_images']
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every file under its SHA-256 (cas/ab/cd/<hash><ext>), whatever the
+    upload_to directory or uploaded filename. Identical files therefore share
+    one copy on disk and one URL, e.g. the same photo on BusinessTeamMember and
+    AboutUsGalleryImage, or identical renditions. Saving content that is already
+    stored writes nothing and returns the existing name.
+
+    Because names are shared, callers must not delete a file another row still
+    references (see core.image_pipeline.delete_unreferenced).
+    """
+    prefix = 'cas'
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        digest = content_hash(content)
+        extension = os.path.splitext(name)[1].lower()
+        name = f"{self.prefix}/{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+
+class HashedStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    collectstatic copies every static file to <name>.<md5 prefix><ext> and
+    {% static %} resolves names through the resulting staticfiles.json, so a
+    URL only changes when the file's content does and every static response
+    can be cached for a year as immutable.
+
+    Relative ES module imports (`import { x } from './config.js'`) are
+    rewritten to the hashed names too, so the game's unbundled modules are
+    cache-busted without query strings.
+
+    Afterwards every compressible file gets .br/.gz siblings (see
+    core.static_compression).
+    """
+    support_js_module_import_aggregation = True
+    manifest_strict = False
+
+    def stored_name(self, name):
+        # A reference to a file that does not exist (e.g. a favicon that was
+        # never added) keeps its plain URL, as with StaticFilesStorage, instead
+        # of failing the page.
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if not dry_run:
+            compress_tree(
+                self.location, getattr(settings, 'STATIC_COMPRESSION_WORKERS', None), self.hashed_files.values(),
+            )
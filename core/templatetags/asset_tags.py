@@ -0,0 +1,43 @@
+import json
+from functools import lru_cache
+
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.templatetags.static import static
+
+register = template.Library()
+
+# Written by scripts/build-frontend.mjs (`manage.py build_frontend`).
+MANIFEST = 'core/dist/manifest.json'
+
+
+def _read_manifest():
+    path = finders.find(MANIFEST)
+    if not path:
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+_cached_manifest = lru_cache(maxsize=1)(_read_manifest)
+
+
+def asset_path(name):
+    """
+    Static path of built front-end asset `name`, e.g. 'tailwind.css' ->
+    'core/dist/tailwind.css'.
+    """
+    manifest = _read_manifest() if settings.DEBUG else _cached_manifest()
+    return manifest.get(name, f'core/dist/{name}')
+
+
+@register.simple_tag
+def asset(name):
+    """
+    URL of a built front-end asset (content-hashed by collectstatic):
+        <link rel="stylesheet" href="{% asset 'tailwind.css' %}">
+    In DEBUG the manifest is re-read on every use, so rebuilds show up without
+    a restart.
+    """
+    return static(asset_path(name))
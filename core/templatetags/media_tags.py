@@ -0,0 +1,97 @@
+from django import template
+from django.conf import settings
+from django.utils.html import format_html, format_html_join
+
+from core.image_pipeline import image_metadata_index, rendition_index
+from core.utils import ENCODING_PROFILES, PRIMARY_FORMAT
+
+register = template.Library()
+
+
+def _request_index(context, attr, builder):
+    # One snapshot lookup per request, however many images the page renders.
+    request = context.get('request')
+    index = getattr(request, attr, None)
+    if index is None:
+        index = builder()
+        if request is not None:
+            setattr(request, attr, index)
+    return index
+
+
+def _renditions(context, image):
+    return _request_index(context, '_rendition_index', rendition_index).get(image.name, {}) if image else {}
+
+
+def _candidates(image, variants):
+    return ', '.join(f'{image.storage.url(name)} {width}w' for width, name in variants)
+
+
+@register.simple_tag(takes_context=True)
+def srcset(context, image, sizes='100vw'):
+    """
+    Emits srcset/sizes attributes for an optimized ImageField, e.g.
+        <img src="{{ p.image.url }}" {% srcset p.image "(min-width: 768px) 50vw, 100vw" %}>
+    Emits nothing for images without recorded renditions, so the plain src still works.
+    """
+    variants = _renditions(context, image).get(PRIMARY_FORMAT)
+    if not variants:
+        return ''
+    return format_html('srcset="{}" sizes="{}"', _candidates(image, variants), sizes)
+
+
+@register.simple_tag(takes_context=True)
+def picture_sources(context, image, sizes='100vw'):
+    """
+    Emits a <source> per extra output format (e.g. AVIF), best first, for use
+    inside <picture> ahead of the <img> fallback:
+        <picture>{% picture_sources p.image "100vw" %}<img src="..." {% srcset p.image "100vw" %}></picture>
+    The browser picks the first type it supports, so clients without AVIF get WebP.
+    """
+    formats = _renditions(context, image)
+    sources = [
+        (ENCODING_PROFILES[name]['content_type'], _candidates(image, formats[name]), sizes)
+        for name in getattr(settings, 'IMAGE_OUTPUT_FORMATS', ())
+        if name != PRIMARY_FORMAT and formats.get(name)
+    ]
+    return format_html_join('', '<source type="{}" srcset="{}" sizes="{}">', sources)
+
+
+@register.simple_tag(takes_context=True)
+def image_meta(context, image):
+    """
+    Recorded size and placeholder of an optimized ImageField as a dict with
+    width, height, dominant_color and lqip (empty if not processed yet):
+        {% image_meta p.image as meta %}<img ... width="{{ meta.width }}" height="{{ meta.height }}">
+    """
+    if not image:
+        return {}
+    return _request_index(context, '_image_metadata_index', image_metadata_index).get(image.name, {})
+
+
+@register.simple_tag(takes_context=True)
+def image_size(context, image):
+    """
+    Emits width/height attributes so the browser reserves the image's box
+    before it loads (no layout shift); nothing for unprocessed images.
+    """
+    meta = image_meta(context, image)
+    if not meta:
+        return ''
+    return format_html('width="{}" height="{}"', meta['width'], meta['height'])
+
+
+@register.simple_tag(takes_context=True)
+def placeholder_style(context, image):
+    """
+    CSS declarations painting the dominant colour and blurred LQIP behind an
+    opaque image until it arrives, for use inside a style attribute:
+        <img ... style="{% placeholder_style p.image %}">
+    """
+    meta = image_meta(context, image)
+    if not meta:
+        return ''
+    return format_html(
+        "background-color: {}; background-image: url('{}'); background-size: cover; background-position: center;",
+        meta['dominant_color'], meta['lqip'],
+    )
@@ -0,0 +1,25 @@
+import re
+
+from django import template
+from django.utils.html import escape, strip_tags
+from django.utils.safestring import mark_safe
+
+from core.fulltext import HIGHLIGHT_END, HIGHLIGHT_START
+
+register = template.Library()
+
+# A snippet of HTML text can start or end inside a tag.
+PARTIAL_TAGS = re.compile(r'^[^<]*?>|<[^>]*$')
+
+
+@register.filter
+def highlight_marks(value):
+    """
+    Renders a search highlight (see core.fulltext) as text with the matched
+    words in <mark>. Any HTML in the indexed text is stripped, not rendered.
+    """
+    if not value:
+        return ''
+    text = strip_tags(PARTIAL_TAGS.sub('', str(value)))
+    text = escape(text).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>')
+    return mark_safe(text)
@@ -1,3 +1,631 @@
-from django.test import TestCase
+import copy
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from io import BytesIO, StringIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
+from datetime import timedelta
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.middleware.csrf import _unmask_cipher_token
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from core import cache as page_cache, geocoding, image_pipeline, payments, site_search
+from core.enrollment_stats import enrollment_stats, rollup_stats
+from core.fulltext import (
+    HIGHLIGHT_END,
+    HIGHLIGHT_START,
+    SEARCH_VECTOR_COLUMN,
+    _postgres_catalog,
+    _postgres_trigger,
+    ensure_search_schema,
+    search,
+    search_filter,
+)
+from core.geocoding import GeocodingError, NominatimProvider, cached_geocode, geocode, normalize_address
+from core.models import (
+    ClientLogo,
+    GeocodeResult,
+    ImageOptimizationJob,
+    ImageRendition,
+    JobPost,
+    Location,
+    ReferralCode,
+    TrainingEnrollment,
+    TrainingField,
+    TrainingPackage,
+    TrainingSubField,
+)
+from core.payments import PaymentError, StubGateway, payment_signature
+from core.storage import optimized_image_storage
+from core.templatetags.search_tags import highlight_marks
+
+
+class StubGeocoder:
+    """
+    In-process geocoding provider: answers from `ADDRESSES` and records every
+    lookup in `calls`.
+    """
+    name = 'stub'
+    ADDRESSES = {'1 main road, rajkot': (22.3, 70.8, 'Main Road, Rajkot')}
+
+    def __init__(self, **options):
+        self.calls = []
+
+    def geocode(self, address):
+        self.calls.append(address)
+        return self.ADDRESSES.get(normalize_address(address))
+
+
+class StubNominatimHandler(BaseHTTPRequestHandler):
+    """
+    Answers like Nominatim's search API after `server.delay` seconds, and
+    records the time of every request in `server.requests`.
+    """
+
+    def do_GET(self):
+        self.server.requests.append(time.monotonic())
+        time.sleep(self.server.delay)
+        query = parse_qs(urlparse(self.path).query).get('q', [''])[0]
+        body = json.dumps([{'lat': '22.3', 'lon': '70.8', 'display_name': query}]).encode()
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            # The client gave up (timeout test).
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(test, delay=0.0):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubNominatimHandler)
+    server.daemon_threads = True
+    server.delay = delay
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    test.addCleanup(server.server_close)
+    test.addCleanup(server.shutdown)
+    return server, f'http://127.0.0.1:{server.server_address[1]}/search'
+
+
+@override_settings(GEOCODING_PROVIDER='core.tests.StubGeocoder', GEOCODING_OPTIONS={})
+class GeocodeCacheTests(TestCase):
+    def setUp(self):
+        geocoding._provider = None
+        self.addCleanup(setattr, geocoding, '_provider', None)
+
+    def test_normalize_address(self):
+        self.assertEqual(normalize_address('  1 Main  Road ,Rajkot;  '), '1 main road, rajkot')
+
+    def test_spellings_of_one_address_share_a_lookup(self):
+        self.assertEqual(geocode('1 Main Road, Rajkot'), (22.3, 70.8))
+        self.assertEqual(geocode('1 MAIN ROAD ,  rajkot'), (22.3, 70.8))
+        self.assertEqual(geocoding.get_provider().calls, ['1 Main Road, Rajkot'])
+        self.assertEqual(GeocodeResult.objects.get().query, '1 main road, rajkot')
+        self.assertEqual(cached_geocode('1 main road, Rajkot'), (22.3, 70.8))
+
+    def test_not_found_is_cached(self):
+        self.assertIsNone(geocode('Nowhere'))
+        self.assertIsNone(geocode('nowhere'))
+        self.assertEqual(geocoding.get_provider().calls, ['Nowhere'])
+        self.assertIsNone(cached_geocode('Nowhere'))
+
+    def test_refresh_asks_the_provider_again(self):
+        geocode('1 Main Road, Rajkot')
+        geocode('1 Main Road, Rajkot', refresh=True)
+        self.assertEqual(len(geocoding.get_provider().calls), 2)
+        self.assertEqual(GeocodeResult.objects.count(), 1)
+
+    def test_new_location_is_geocoded_by_the_command(self):
+        location = Location.objects.create(name='Rajkot Office', address='1 Main Road, Rajkot')
+        self.assertIsNone(location.latitude)  # saving never calls the provider
+        call_command('geocode_locations', stdout=StringIO())
+        location.refresh_from_db()
+        self.assertEqual((location.latitude, location.longitude), (22.3, 70.8))
+
+
+class NominatimProviderTests(TestCase):
+    def test_lookup(self):
+        server, url = start_stub_server(self)
+        provider = NominatimProvider(url=url, min_interval=0)
+        self.assertEqual(provider.geocode('Rajkot'), (22.3, 70.8, 'Rajkot'))
+
+    def test_requests_are_spaced_by_min_interval(self):
+        server, url = start_stub_server(self)
+        provider = NominatimProvider(url=url, min_interval=0.2)
+        for address in ('a', 'b', 'c'):
+            provider.geocode(address)
+        gaps = [later - earlier for earlier, later in zip(server.requests, server.requests[1:])]
+        self.assertEqual(len(gaps), 2)
+        for gap in gaps:
+            # Arrival times at the server jitter a little around the client's spacing.
+            self.assertGreater(gap, 0.15)
+
+    def test_timeout_raises_and_is_not_cached(self):
+        server, url = start_stub_server(self, delay=1.0)
+        provider = NominatimProvider(url=url, timeout=0.1, min_interval=0, retries=0)
+        with self.assertRaises(GeocodingError):
+            geocode('Rajkot', provider=provider)
+        self.assertFalse(GeocodeResult.objects.exists())
+
+
+class EnrollmentRollupTests(TestCase):
+    def setUp(self):
+        for name, price in (('A', 100), ('B', 250)):
+            TrainingEnrollment.objects.create(full_name=name, email='a@example.com', phone='1', final_price=price)
+        rollup_stats()  # builds the rollup
+
+    def assertRollupMatches(self):
+        self.assertEqual(rollup_stats(), enrollment_stats(TrainingEnrollment.objects.all()))
+
+    def test_deferred_loads(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(len(TrainingEnrollment.objects.only('id', 'full_name')), 2)
+        self.assertEqual(len(TrainingEnrollment.objects.defer('payment_status')), 2)
+
+    def test_status_change_on_deferred_instance(self):
+        enrollment = TrainingEnrollment.objects.only('id', 'full_name').get(full_name='A')
+        enrollment.payment_status = 'COMPLETED'
+        enrollment.save()
+        stats = rollup_stats()
+        self.assertEqual((stats['total_paid'], stats['total_pending']), (1, 1))
+        self.assertEqual(stats['total_revenue'], 100)
+        self.assertRollupMatches()
+
+    def test_create_update_delete(self):
+        enrollment = TrainingEnrollment.objects.create(
+            full_name='C', email='c@example.com', phone='1', final_price=40, payment_status='COMPLETED',
+        )
+        self.assertRollupMatches()
+        enrollment.final_price = 60
+        enrollment.save()
+        self.assertEqual(rollup_stats()['total_revenue'], 60)
+        TrainingEnrollment.objects.get(full_name='B').delete()
+        self.assertRollupMatches()
+        self.assertEqual(rollup_stats()['total_enrolled'], 2)
+
+    def test_unrelated_update_fields_skip_the_rollup(self):
+        enrollment = TrainingEnrollment.objects.get(full_name='A')
+        enrollment.full_name = 'A2'
+        with self.assertNumQueries(1):
+            enrollment.save(update_fields=['full_name'])
+
+
+class LmsEnrollmentsApiTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        moment = timezone.now().replace(microsecond=0)
+        # Five rows share one enrollment_date, so pages of two break inside the tie.
+        self.dates = {}
+        for i in range(7):
+            status = 'COMPLETED' if i % 2 else 'PENDING'
+            name = f'Ravi {i}' if i < 5 else f'Meera {i}'
+            enrollment = TrainingEnrollment.objects.create(
+                full_name=name, email=f'{i}@example.com', phone='1', final_price=100, payment_status=status,
+            )
+            self.dates[enrollment.pk] = moment - timedelta(days=1 if i < 2 else 0)
+            TrainingEnrollment.objects.filter(pk=enrollment.pk).update(enrollment_date=self.dates[enrollment.pk])
+
+    def pages(self, **params):
+        results, cursor = [], None
+        while True:
+            query = dict(params, limit=2, **({'cursor': cursor} if cursor else {}))
+            response = self.client.get(reverse('lms_enrollments_api'), query)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertLessEqual(len(data['results']), 2)
+            results.extend(data['results'])
+            cursor = data['next_cursor']
+            if not cursor:
+                return results
+
+    def expected(self, queryset):
+        return sorted(queryset.values_list('pk', flat=True), key=lambda pk: (self.dates[pk], pk), reverse=True)
+
+    def test_pages_split_equal_dates_without_gaps_or_repeats(self):
+        rows = self.pages()
+        self.assertEqual([row['id'] for row in rows], self.expected(TrainingEnrollment.objects.all()))
+
+    def test_cursor_keeps_the_search_and_status_filters(self):
+        rows = self.pages(status='PENDING')
+        self.assertEqual({row['payment_status'] for row in rows}, {'PENDING'})
+        self.assertEqual(
+            [row['id'] for row in rows], self.expected(TrainingEnrollment.objects.filter(payment_status='PENDING')),
+        )
+
+        rows = self.pages(search='ravi', status='PENDING')
+        self.assertEqual(
+            [row['id'] for row in rows],
+            self.expected(TrainingEnrollment.objects.filter(full_name__startswith='Ravi', payment_status='PENDING')),
+        )
+
+    def test_invalid_cursor_is_a_bad_request(self):
+        for cursor in ('not-a-cursor', 'bm9fc2VwYXJhdG9y', '!!!'):
+            response = self.client.get(reverse('lms_enrollments_api'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['status'], 'error')
+
+
+@skipUnless(connection.vendor in ('sqlite', 'postgresql'), 'no full-text index on this database')
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        JobPost.objects.create(
+            name='python-dev', title='Python Developer', location='Rajkot',
+            description='Build Django services and data pipelines.',
+        )
+        JobPost.objects.create(
+            name='designer', title='Product Designer', location='Remote',
+            description='Work with our Python developers on internal tools.',
+        )
+        JobPost.objects.create(name='sales', title='Sales Lead', location='Remote', description='Grow accounts.')
+        TrainingEnrollment.objects.create(full_name='Asha Patel', email='asha.patel@example.com', phone='9876543210')
+        TrainingEnrollment.objects.create(full_name='Ravi Shah', email='ravi@example.org', phone='9123456780')
+
+    def test_title_match_ranks_first(self):
+        jobs = list(search(JobPost.objects.all(), 'jobs', 'python', highlight=('title',), snippet=('description',)))
+        self.assertEqual([job.name for job in jobs], ['python-dev', 'designer'])
+        self.assertGreater(jobs[0].search_rank, jobs[1].search_rank)
+        self.assertEqual(jobs[0].title_highlight, f'{HIGHLIGHT_START}Python{HIGHLIGHT_END} Developer')
+        self.assertIn(f'{HIGHLIGHT_START}Python{HIGHLIGHT_END}', jobs[1].description_highlight)
+        self.assertEqual(highlight_marks(jobs[0].title_highlight), '<mark>Python</mark> Developer')
+
+    def test_prefix_and_stemmed_terms(self):
+        self.assertEqual(
+            sorted(search_filter(JobPost.objects.all(), 'jobs', 'develop').values_list('name', flat=True)),
+            ['designer', 'python-dev'],
+        )
+
+    def test_index_follows_updates(self):
+        JobPost.objects.filter(name='sales').update(title='Python Sales Engineer')
+        self.assertEqual(search(JobPost.objects.all(), 'jobs', 'python').count(), 3)
+
+    def test_enrollment_substrings(self):
+        def names(query):
+            return list(search_filter(TrainingEnrollment.objects.all(), 'enrollments', query).values_list('full_name', flat=True))
+
+        self.assertEqual(names('patel@exa'), ['Asha Patel'])
+        self.assertEqual(names('234567'), ['Ravi Shah'])
+
+    @skipUnless(connection.vendor == 'sqlite', 'drops the FTS5 tables')
+    def test_falls_back_when_the_index_cannot_be_created(self):
+        self.addCleanup(ensure_search_schema)
+        with connection.cursor() as cursor:
+            for table in ('core_jobpost_fts', 'core_trainingenrollment_fts'):
+                for trigger in ('ai', 'ad', 'au'):
+                    cursor.execute(f'DROP TRIGGER "{table}_{trigger}"')
+                cursor.execute(f'DROP TABLE "{table}"')
+
+        no_fts5 = OperationalError('no such module: fts5')
+        with mock.patch('core.fulltext._sqlite_schema', autospec=True, side_effect=no_fts5):
+            with self.assertLogs('core.fulltext', 'WARNING'):
+                errors = ensure_search_schema()
+        self.assertEqual(errors, {'jobs': [str(no_fts5)], 'enrollments': [str(no_fts5)]})
+
+        jobs = list(search(JobPost.objects.all(), 'jobs', 'python', highlight=('title',)))
+        self.assertEqual({job.name for job in jobs}, {'python-dev', 'designer'})
+        self.assertEqual({job.search_rank for job in jobs}, {0.0})
+        self.assertEqual(jobs[0].title_highlight, JobPost.objects.get(name=jobs[0].name).title)
+        self.assertEqual(search_filter(TrainingEnrollment.objects.all(), 'enrollments', 'ravi@').count(), 1)
+
+    def run_deferred_checks(self):
+        # setUp's inserts left deferred foreign key checks pending in the test
+        # transaction, and PostgreSQL refuses ALTER TABLE until they have run.
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL search vector column')
+    def test_indexed_column_type_can_be_altered(self):
+        self.run_deferred_checks()
+        old_field = JobPost._meta.get_field('title')
+        new_field = copy.deepcopy(old_field)
+        new_field.max_length = old_field.max_length + 50
+        with connection.schema_editor() as editor:
+            editor.alter_field(JobPost, old_field, new_field)
+        JobPost.objects.filter(name='sales').update(title='Python Sales Engineer')
+        self.assertEqual(search(JobPost.objects.all(), 'jobs', 'python').count(), 3)
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL search vector column')
+    def test_generated_column_is_converted(self):
+        table = JobPost._meta.db_table
+        self.addCleanup(ensure_search_schema)
+        self.run_deferred_checks()
+        with connection.cursor() as cursor:
+            # The schema an earlier version created.
+            cursor.execute(f'DROP FUNCTION "{_postgres_trigger(table)}"() CASCADE')
+            cursor.execute(f'ALTER TABLE "{table}" DROP COLUMN "{SEARCH_VECTOR_COLUMN}"')
+            cursor.execute(
+                f'ALTER TABLE "{table}" ADD COLUMN "{SEARCH_VECTOR_COLUMN}" tsvector GENERATED ALWAYS AS '
+                "(to_tsvector('english'::regconfig, coalesce(title, ''))) STORED"
+            )
+        self.assertEqual(ensure_search_schema(), {})
+        with connection.cursor() as cursor:
+            catalog = _postgres_catalog(cursor, table)
+        self.assertEqual((catalog['generated'], catalog['trigger']), (False, True))
+        self.assertEqual(search(JobPost.objects.all(), 'jobs', 'python').count(), 1)
+        JobPost.objects.filter(name='sales').update(title='Python Sales Engineer')
+        self.assertEqual(search(JobPost.objects.all(), 'jobs', 'python').count(), 2)
+
+
+class SiteSearchIndexFileTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'site_search.idx')
+        settings_override = override_settings(SITE_SEARCH_INDEX_PATH=self.path)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        site_search._state.update(index=None, mtime=None)
+        self.addCleanup(site_search._state.update, index=None, mtime=None)
+        JobPost.objects.create(name='python-dev', title='Python Developer', description='Django services.')
+
+    def test_unreadable_file_is_rebuilt(self):
+        with open(self.path, 'wb') as fh:
+            fh.write(b'not an index')
+        self.assertEqual([hit['title'] for hit in site_search.search('pyth')], ['Python Developer'])
+        with open(self.path, 'rb') as fh:
+            self.assertEqual(len(site_search.SiteSearchIndex.from_bytes(fh.read())), 1)
+
+    def test_index_written_while_waiting_for_the_lock_is_loaded(self):
+        other = site_search.SiteSearchIndex()
+        other.add('core.JobPost:0', 'Job Post', 'Written Elsewhere', '/', 'written by another worker')
+        file_lock = site_search._file_lock
+
+        @contextmanager
+        def contended_lock():
+            # Another worker writes the index while this one waits for the lock.
+            with file_lock():
+                with open(self.path, 'wb') as fh:
+                    fh.write(other.to_bytes())
+                yield
+
+        with mock.patch('core.site_search._file_lock', contended_lock), mock.patch('core.site_search._build') as build:
+            index = site_search.get_index()
+        build.assert_not_called()
+        self.assertEqual([hit['title'] for hit in index.search('elsewhere')], ['Written Elsewhere'])
+
+    def test_updates_leave_the_served_index_untouched(self):
+        served = site_search.get_index()
+        job = JobPost.objects.create(name='rust-dev', title='Rust Developer', description='Systems.')
+        site_search.update_documents('core.JobPost', [job.pk])
+        self.assertEqual(served.search('rust'), [])
+        self.assertEqual([hit['title'] for hit in site_search.search('rust')], ['Rust Developer'])
+
+    def test_training_field_changes_reindex_its_sub_fields(self):
+        field = TrainingField.objects.create(name='Development', slug='development')
+        sub_field = TrainingSubField.objects.create(name='Web', slug='web', field=field)
+        TrainingPackage.objects.create(sub_field=sub_field, name='Pro', price=1000, duration='4 Weeks', features='Mentoring')
+        site_search.build_index()
+        self.assertEqual([hit['title'] for hit in site_search.search('development')], ['Web'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            field.name = 'Robotics'
+            field.save()
+        self.assertEqual([hit['title'] for hit in site_search.search('robotics')], ['Web'])
+        self.assertEqual(site_search.search('development'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            field.is_active = False
+            field.save()
+        self.assertEqual(site_search.search('web'), [])
+
+
+@override_settings(
+    PAYMENT_GATEWAY='core.payments.StubGateway', PAYMENT_GATEWAY_OPTIONS={},
+    RAZORPAY_KEY_ID='rzp_test_key', RAZORPAY_KEY_SECRET='test-secret',
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+)
+class TrainingPaymentFlowTests(TestCase):
+    def setUp(self):
+        payments._gateway = None
+        self.addCleanup(setattr, payments, '_gateway', None)
+        field = TrainingField.objects.create(name='Development', slug='development')
+        sub_field = TrainingSubField.objects.create(name='Web', slug='web', field=field)
+        self.package = TrainingPackage.objects.create(
+            sub_field=sub_field, name='Pro', price=1000, duration='4 Weeks', features='Mentoring',
+        )
+        self.referral = ReferralCode.objects.create(code='WELCOME10', discount_percentage=10)
+        self.form_data = {
+            'full_name': 'Asha Patel', 'email': 'asha@example.com', 'phone': '9876543210',
+            'date_of_birth': '2000-01-01', 'college_name': 'GEC', 'degree': 'B.Tech', 'branch': 'CE',
+            'year_of_study': '2', 'skills': 'Python', 'field': field.pk, 'sub_field': sub_field.pk,
+            'package': self.package.pk, 'referral_code_text': 'WELCOME10',
+        }
+
+    def enroll(self):
+        return self.client.post(reverse('training_enroll', args=[self.package.pk]), self.form_data)
+
+    def callback(self, enrollment, signature):
+        return self.client.post(reverse('training_payment_callback'), {
+            'razorpay_payment_id': 'pay_1',
+            'razorpay_order_id': enrollment.razorpay_order_id,
+            'razorpay_signature': signature,
+        })
+
+    def test_enroll_creates_an_order(self):
+        response = self.enroll()
+        self.assertTemplateUsed(response, 'core/training_payment.html')
+        enrollment = TrainingEnrollment.objects.get()
+        order = payments.get_gateway().orders[0]
+        self.assertEqual(enrollment.razorpay_order_id, order['id'])
+        self.assertEqual(order['amount'], 90000)
+        self.assertEqual(enrollment.payment_status, 'PENDING')
+
+    def test_valid_signature_completes_the_payment(self):
+        self.enroll()
+        enrollment = TrainingEnrollment.objects.get()
+        response = self.callback(enrollment, payment_signature('test-secret', enrollment.razorpay_order_id, 'pay_1'))
+        self.assertTemplateUsed(response, 'core/training_success.html')
+        enrollment.refresh_from_db()
+        self.assertEqual((enrollment.payment_status, enrollment.razorpay_payment_id), ('COMPLETED', 'pay_1'))
+        self.referral.refresh_from_db()
+        self.assertEqual(self.referral.usage_count, 1)
+
+    def test_bad_signature_fails_the_payment(self):
+        self.enroll()
+        enrollment = TrainingEnrollment.objects.get()
+        response = self.callback(enrollment, 'bad')
+        self.assertTemplateUsed(response, 'core/training_failed.html')
+        enrollment.refresh_from_db()
+        self.assertEqual(enrollment.payment_status, 'FAILED')
+        self.referral.refresh_from_db()
+        self.assertEqual(self.referral.usage_count, 0)
+
+    def test_gateway_error_renders_the_failure_page(self):
+        with mock.patch.object(StubGateway, 'create_order', side_effect=PaymentError('stub: unreachable')):
+            response = self.enroll()
+        self.assertTemplateUsed(response, 'core/training_failed.html')
+        self.assertContains(response, 'stub: unreachable')
+        self.assertEqual(TrainingEnrollment.objects.get().razorpay_order_id, None)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class WorldDataEncodingTests(TestCase):
+    def encoding(self, accept_encoding):
+        response = self.client.get(reverse('game_world_data'), HTTP_ACCEPT_ENCODING=accept_encoding)
+        self.assertEqual(response.status_code, 200)
+        return response.get('Content-Encoding')
+
+    def test_refused_codings_are_not_sent(self):
+        self.assertEqual(self.encoding('gzip, br'), 'br')
+        self.assertEqual(self.encoding('br;q=0, gzip'), 'gzip')
+        self.assertIsNone(self.encoding('br;q=0, gzip; q=0'))
+        self.assertIsNone(self.encoding(''))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class AnonymousPageCacheTests(TestCase):
+    def csrf_tokens(self, response):
+        return set(re.findall(r'name="csrfmiddlewaretoken" value="([^"]+)"', response.content.decode()))
+
+    def assertOwnToken(self, client, response):
+        self.assertNotIn(page_cache.CSRF_TOKEN_PLACEHOLDER.encode(), response.content)
+        tokens = self.csrf_tokens(response)
+        self.assertTrue(tokens)
+        secret = client.cookies[settings.CSRF_COOKIE_NAME].value
+        self.assertEqual({_unmask_cipher_token(token) for token in tokens}, {secret})
+        return tokens
+
+    def test_each_visitor_gets_their_own_token(self):
+        first, second = Client(enforce_csrf_checks=True), Client(enforce_csrf_checks=True)
+        first_tokens = self.assertOwnToken(first, first.get('/'))
+        with self.assertNumQueries(0):  # served from the cache
+            response = second.get('/')
+        second_tokens = self.assertOwnToken(second, response)
+        self.assertNotEqual(
+            first.cookies[settings.CSRF_COOKIE_NAME].value, second.cookies[settings.CSRF_COOKIE_NAME].value,
+        )
+        self.assertFalse(first_tokens & second_tokens)
+
+        # The injected token passes the CSRF check (400: the empty form is invalid, not 403).
+        response = second.post(reverse('contact_submit'), {'csrfmiddlewaretoken': second_tokens.pop()})
+        self.assertEqual(response.status_code, 400)
+
+    def test_query_strings_and_signed_in_users_bypass_the_cache(self):
+        cache = page_cache.get_cache()
+        with mock.patch.object(cache, 'get', wraps=cache.get) as get, mock.patch.object(cache, 'set', wraps=cache.set) as set_:
+            self.assertOwnToken(self.client, self.client.get('/', {'utm_source': 'mail'}))
+            self.client.force_login(User.objects.create_user('staff'))
+            self.assertOwnToken(self.client, self.client.get('/'))
+        page_keys = [call.args[0] for call in get.call_args_list + set_.call_args_list if call.args[0].startswith('page:')]
+        self.assertEqual(page_keys, [])
+
+
+def png_upload(name, color):
+    buffer = BytesIO()
+    Image.new('RGB', (64, 48), color).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    IMAGE_OPTIMIZATION_ASYNC=True, IMAGE_OUTPUT_FORMATS=('webp',), IMAGE_RENDITION_WIDTHS=(32,),
+)
+class SharedImageFileTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.storage = optimized_image_storage()
+
+    def test_identical_uploads_share_one_file(self):
+        first = ClientLogo.objects.create(name='first', logo=png_upload('a.png', 'red'))
+        second = ClientLogo.objects.create(name='second', logo=png_upload('b.png', 'red'))
+        self.assertEqual(first.logo.name, second.logo.name)
+        self.assertTrue(first.logo.name.startswith('cas/'))
+
+    def test_deleting_one_of_two_rows_keeps_the_shared_file(self):
+        first = ClientLogo.objects.create(name='first', logo=png_upload('a.png', 'red'))
+        second = ClientLogo.objects.create(name='second', logo=png_upload('b.png', 'red'))
+        shared = first.logo.name
+
+        first.delete()
+        image_pipeline.delete_unreferenced(self.storage, [shared])
+        self.assertTrue(self.storage.exists(shared))
+
+        second.delete()
+        image_pipeline.delete_unreferenced(self.storage, [shared])
+        self.assertFalse(self.storage.exists(shared))
+
+    def test_optimizing_one_row_keeps_the_source_another_row_uses(self):
+        first = ClientLogo.objects.create(name='first', logo=png_upload('a.png', 'red'))
+        second = ClientLogo.objects.create(name='second', logo=png_upload('b.png', 'red'))
+        source = first.logo.name
+
+        image_pipeline.process_jobs(image_pipeline.claim_jobs(
+            ids=ImageOptimizationJob.objects.filter(object_id=first.pk).values_list('pk', flat=True),
+        ))
+        first.refresh_from_db()
+        self.assertTrue(first.logo.name.endswith('.webp'))
+        self.assertTrue(self.storage.exists(source))
+
+        # The second job reuses the first result, after which nothing needs the source.
+        image_pipeline.process_jobs(image_pipeline.claim_jobs())
+        second.refresh_from_db()
+        self.assertEqual(second.logo.name, first.logo.name)
+        self.assertFalse(self.storage.exists(source))
+        self.assertTrue(self.storage.exists(first.logo.name))
+
+    def test_swap_leaves_a_field_changed_while_encoding(self):
+        logo = ClientLogo.objects.create(name='logo', logo=png_upload('a.png', 'red'))
+        source = logo.logo.name
+        replacement = self.storage.save('b.png', png_upload('b.png', 'blue'))
+        encode = image_pipeline.encode_image_variants
+
+        def encode_while_the_user_edits(*args, **kwargs):
+            ClientLogo.objects.filter(pk=logo.pk).update(logo=replacement)
+            return encode(*args, **kwargs)
+
+        with mock.patch('core.image_pipeline.encode_image_variants', side_effect=encode_while_the_user_edits):
+            image_pipeline.process_jobs(image_pipeline.claim_jobs())
+
+        logo.refresh_from_db()
+        self.assertEqual(logo.logo.name, replacement)
+        job = ImageOptimizationJob.objects.get(object_id=logo.pk)
+        self.assertEqual(job.status, ImageOptimizationJob.SKIPPED)
+        self.assertFalse(ImageRendition.objects.exists())
+        self.assertTrue(self.storage.exists(source))
+        self.assertTrue(self.storage.exists(replacement))
+        # The encoded files nobody points at are removed again.
+        stored = [name for root, dirs, files in os.walk(self.storage.location) for name in files]
+        self.assertFalse([name for name in stored if name.endswith('.webp')])
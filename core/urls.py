@@ -10,6 +10,7 @@ urlpatterns = [
     path('careers/<slug:slug>/', views.job_detail, name='job_detail'),
     path('company/<slug:slug>/', views.company_page_detail, name='company_page_detail'),
     path('api/contact/submit/', views.contact_submit, name='contact_submit'),
+    path('api/search/', views.site_search_api, name='site_search'),
     
     # Industry Training System
     path('training/', views.training_list, name='training_list'),
@@ -20,5 +21,6 @@ urlpatterns = [
     
     # LMS Dashboard (Staff/Admin Only)
     path('admin/lms-dashboard/', views.lms_dashboard, name='lms_dashboard'),
+    path('admin/lms-dashboard/enrollments/', views.lms_enrollments_api, name='lms_enrollments_api'),
     path('admin/lms-dashboard/update-status/<int:pk>/', views.update_enrollment_status, name='update_enrollment_status'),
 ]
\ No newline at end of file
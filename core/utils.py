@@ -1,54 +1,194 @@
-from PIL import Image
+from PIL import Image, ImageOps
 from io import BytesIO
-from django.core.files.base import ContentFile
+import base64
+import hashlib
 from django.core.files.uploadedfile import UploadedFile
 import os
-import logging
+import re
 
-logger = logging.getLogger(__name__)
 
-def compress_image_to_webp(image_field, quality=80):
+def is_fresh_upload(image_field):
     """
-    Compresses a Django ImageField to WebP format.
-    Checks if the file is a newly uploaded file before processing to avoid re-compression loops.
+    True if the field holds a newly uploaded file (InMemoryUploadedFile or
+    TemporaryUploadedFile) rather than a FieldFile already saved to storage.
     """
     if not image_field:
-        return
-
-    # Check if the file is an uploaded file (InMemoryUploadedFile or TemporaryUploadedFile)
-    # If it's a FieldFile (already saved to storage), we skip.
+        return False
     try:
-        if not hasattr(image_field, 'file') or not isinstance(image_field.file, UploadedFile):
-            return
+        return hasattr(image_field, 'file') and isinstance(image_field.file, UploadedFile)
     except Exception:
-        # If accessing file fails for some reason (e.g. missing file), just return
-        return
+        # If accessing file fails for some reason (e.g. missing file), treat as not fresh
+        return False
 
-    try:
-        # Open the image using Pillow
-        img = Image.open(image_field)
-        
-        # Convert to RGB if necessary (keeping transparency if possible)
-        if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
-            pass # Keep transparency
-        else:
-            img = img.convert('RGB')
-
-        # Save to BytesIO buffer
-        buffer = BytesIO()
-        img.save(buffer, format='WEBP', quality=quality)
-        
-        # Get the mapping of the new content
-        new_content = ContentFile(buffer.getvalue())
-        
-        # Change the filename extension
-        filename, ext = os.path.splitext(image_field.name)
-        new_filename = f"{filename}.webp"
-        
-        # Save the new file to the field (this does not save the model, just updates the file field)
-        image_field.save(new_filename, new_content, save=False)
-        
-    except Exception as e:
-        logger.error(f"Error compressing image {image_field}: {e}")
-        # Proceed without compression if error occurs
-        pass
+
+def content_hash(file):
+    """
+    SHA-256 hex digest of a Django File (or any object with chunks()/read()),
+    streamed so large uploads are never read into memory at once. Leaves the
+    file rewound.
+    """
+    digest = hashlib.sha256()
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    chunks = file.chunks() if hasattr(file, 'chunks') else iter(lambda: file.read(1 << 20), b'')
+    for chunk in chunks:
+        digest.update(chunk if isinstance(chunk, bytes) else chunk.encode())
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    return digest.hexdigest()
+
+
+def file_digest(path):
+    """
+    SHA-256 hex digest of the file at `path` on disk, streamed.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Output encodings for optimized images. WebP is the primary format (stored in
+# the ImageField and used for <img src>); the others are offered via <picture>.
+ENCODING_PROFILES = {
+    'avif': {'format': 'AVIF', 'extension': '.avif', 'content_type': 'image/avif', 'options': {'quality': 55, 'speed': 6}},
+    'webp': {'format': 'WEBP', 'extension': '.webp', 'content_type': 'image/webp', 'options': {'quality': 80}},
+}
+PRIMARY_FORMAT = 'webp'
+
+
+def resolve_profiles(formats, options=None):
+    """
+    Picklable encoding profiles for `formats`, with per-format Pillow save()
+    options from `options` (e.g. settings.IMAGE_ENCODING_OPTIONS) applied on top.
+    """
+    options = options or {}
+    profiles = []
+    for name in formats:
+        profile = dict(ENCODING_PROFILES[name], name=name)
+        profile['options'] = {**profile['options'], **options.get(name, {})}
+        profiles.append(profile)
+    return profiles
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def check_image_pixels(width, height, max_source_pixels=None):
+    """
+    Raises ImageTooLarge if a width x height image is over `max_source_pixels`.
+    Only needs the header's dimensions, so it runs before anything is decoded.
+    """
+    if max_source_pixels and width * height > max_source_pixels:
+        raise ImageTooLarge(
+            f"Image is {width}x{height} ({width * height / 1e6:.0f} MP); "
+            f"the limit is {max_source_pixels / 1e6:.0f} MP."
+        )
+
+
+def _open_for_encoding(data, max_pixels=None, max_source_pixels=None):
+    """
+    Decodes `data` holding at most about `max_pixels` pixels in memory.
+    JPEGs are decoded at a reduced DCT scale (draft mode) instead of full size.
+    Anything still over the budget is downscaled to it.
+    The EXIF orientation is applied, so the result is upright.
+    """
+    img = Image.open(BytesIO(data))  # Lazy: only the header has been read.
+    check_image_pixels(img.width, img.height, max_source_pixels)
+
+    if max_pixels and img.width * img.height > max_pixels:
+        scale = (max_pixels / (img.width * img.height)) ** 0.5
+        target = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+        if img.format == 'JPEG':
+            # Decodes at 1/2, 1/4 or 1/8 scale, never smaller than `target`.
+            img.draft(None, target)
+        if img.width * img.height > max_pixels:
+            img = img.resize(target, Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+    ImageOps.exif_transpose(img, in_place=True)
+
+    # Convert to RGB if necessary (keeping transparency if possible)
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA') if img.mode == 'P' else img # Keep transparency
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+    return img
+
+
+def encode_image(img, profile):
+    buffer = BytesIO()
+    img.save(buffer, format=profile['format'], **profile['options'])
+    return buffer.getvalue()
+
+
+def encode_webp(data, quality=80, lossless=False, max_pixels=None):
+    """
+    Re-encodes raw image bytes as WebP and returns the new bytes, downscaled to
+    at most `max_pixels` pixels if given.
+    Pure function (no Django/DB access) so it can run in a worker process.
+    """
+    options = {'quality': quality, 'lossless': True} if lossless else {'quality': quality}
+    profile = resolve_profiles([PRIMARY_FORMAT], {PRIMARY_FORMAT: options})[0]
+    return encode_image(_open_for_encoding(data, max_pixels), profile)
+
+
+LQIP_SIZE = 16
+
+
+def image_placeholder(img):
+    """
+    Dominant colour ('#rrggbb') and a tiny blurred WebP data URI (LQIP) that
+    templates can paint while the real image loads.
+    """
+    # contain() resizes straight from the source, so no full-size copy is made.
+    sample = ImageOps.contain(img, (64, 64))
+    palette_img = sample.convert('RGB').quantize(colors=5)
+    count, index = max(palette_img.getcolors())
+    r, g, b = palette_img.getpalette()[index * 3:index * 3 + 3]
+
+    thumb = ImageOps.contain(sample, (LQIP_SIZE, LQIP_SIZE))
+    buffer = BytesIO()
+    thumb.save(buffer, format='WEBP', quality=30)
+    return {
+        'dominant_color': f'#{r:02x}{g:02x}{b:02x}',
+        'lqip': 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii'),
+    }
+
+
+def encode_image_variants(data, profiles, widths=(), max_pixels=None, max_source_pixels=None):
+    """
+    Encodes the full-size image plus one downscaled copy per width in `widths`
+    that is narrower than the original (images are never upscaled), in every
+    format in `profiles` (see resolve_profiles). "Full size" is capped at
+    `max_pixels`; see _open_for_encoding.
+    Pure function, like encode_webp. Returns:
+        {'width', 'height', 'placeholder': {'dominant_color', 'lqip'},
+         'variants': [{'format', 'width', 'height', 'data'}, ...]}
+    """
+    img = _open_for_encoding(data, max_pixels, max_source_pixels)
+    sizes = [(img.width, img.height, img)]
+    for width in sorted(set(widths)):
+        if width >= img.width:
+            continue
+        height = max(1, round(img.height * width / img.width))
+        sizes.append((width, height, img.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=2.0)))
+
+    variants = [
+        {'format': profile['name'], 'width': width, 'height': height, 'data': encode_image(sized, profile)}
+        for profile in profiles
+        for width, height, sized in sizes
+    ]
+    return {'width': img.width, 'height': img.height, 'placeholder': image_placeholder(img), 'variants': variants}
+
+
+# Stem suffix of the downscaled copies variant_name() names, e.g. 'map.320w'.
+SIZED_STEM = re.compile(r'\.\d+w$')
+
+
+def variant_name(name, extension='.webp', width=None):
+    filename, ext = os.path.splitext(name)
+    if width:
+        return f"{filename}.{width}w{extension}"
+    return f"{filename}{extension}"
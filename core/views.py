@@ -10,12 +10,23 @@ from .models import (
 
 
 from django.shortcuts import render, get_object_or_404
+from django.template.response import TemplateResponse
 from .models import (
     HeroSection, Service, BusinessTeamMember, 
-    ClientTicker, TacticalAdvantage, Project, LabExperiment
+    ClientTicker, TacticalAdvantage, Project, LabExperiment, ImageRendition, ImageMetadata
 )
 from .forms import ContactForm
+from .cache import cache_anonymous_page
+from .context_processors import SITE_CHROME_MODELS
+
+# Every model the landing page (body + header/footer) reads.
+INDEX_PAGE_MODELS = SITE_CHROME_MODELS + (
+    AboutUs, HeroSection, BusinessTeamMember, ClientTicker, TacticalAdvantage,
+    Project, LabExperiment, ClientLogo, Testimonial, TrainingIntroSection, Location,
+    ImageRendition, ImageMetadata,  # srcset, image sizes and placeholders
+)
 
+@cache_anonymous_page('index', INDEX_PAGE_MODELS)
 def index(request):
     # Note: 'config' and 'all_services' are now handled by the context processor!
     # You only need to fetch data specific to the BODY of the index page.
@@ -28,7 +39,6 @@ def index(request):
     tactics = TacticalAdvantage.objects.all()
     projects = Project.objects.all()
     experiments = LabExperiment.objects.all()
-    experiments = LabExperiment.objects.all()
     clients_logo = ClientLogo.objects.all()
     testimonials = Testimonial.objects.all()
     training_section = TrainingIntroSection.objects.first()
@@ -52,7 +62,8 @@ def index(request):
         "location": location,
     }
     
-    return render(request, 'core/index.html', context)
+    # TemplateResponse (not render) so the page cache can punch the CSRF hole before rendering
+    return TemplateResponse(request, 'core/index.html', context)
 
 from django.shortcuts import render, get_object_or_404
 from .models import Service, SiteConfiguration
@@ -170,18 +181,16 @@ def company_page_detail(request, slug):
 from .models import JobPost, JobField
 from .forms import JobApplicationForm
 from django.contrib import messages
-from django.db.models import Q
+from .fulltext import search, search_filter
 
 def career_list(request):
     jobs = JobPost.objects.filter(is_active=True).order_by('-posted_at')
     config = SiteConfiguration.objects.first()
 
-    q = request.GET.get('q')
+    q = request.GET.get('q', '').strip()
     job_type = request.GET.get('type')
     field_id = request.GET.get('field')
 
-    if q:
-        jobs = jobs.filter(Q(title__icontains=q) | Q(description__icontains=q))
     if job_type:
         jobs = jobs.filter(job_type=job_type)
     if field_id:
@@ -189,6 +198,9 @@ def career_list(request):
             jobs = jobs.filter(field_id=int(field_id))
         except ValueError:
             pass
+    if q:
+        # Best match first, with the matched words highlighted.
+        jobs = search(jobs, 'jobs', q, highlight=('title',), snippet=('description',))
             
     fields = JobField.objects.all()
 
@@ -240,6 +252,20 @@ def contact_submit(request):
             return JsonResponse({'success': False, 'errors': form.errors}, status=400)
     return JsonResponse({'success': False, 'message': 'Invalid request method.'}, status=405)
 
+from . import site_search
+
+def site_search_api(request):
+    """
+    Typeahead search over services, projects, jobs and training, answered from
+    the in-memory index (see core/site_search.py).
+    """
+    q = request.GET.get('q', '').strip()[:100]
+    try:
+        limit = min(max(int(request.GET.get('limit', 8)), 1), 20)
+    except ValueError:
+        limit = 8
+    return JsonResponse({'query': q, 'results': site_search.search(q, limit) if q else []})
+
 
 # ============================================================
 # 11. INDUSTRY TRAINING VIEWS
@@ -247,6 +273,11 @@ def contact_submit(request):
 
 from .models import TrainingField, TrainingSubField, TrainingPackage, ReferralCode, TrainingEnrollment
 from .forms import TrainingEnrollmentForm
+from .enrollment_stats import enrollment_stats, rollup_stats
+from .pagination import InvalidCursor, keyset_page
+
+LMS_PAGE_SIZE = 50
+LMS_MAX_PAGE_SIZE = 200
 
 def training_list(request):
     """
@@ -276,15 +307,9 @@ from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.admin.views.decorators import staff_member_required
 from django.http import HttpResponse, JsonResponse
-from django.db.models import Sum, Q
-import razorpay
-
-def get_razorpay_keys(site_config=None):
-    if not site_config:
-        site_config = SiteConfiguration.objects.first()
-    key_id = site_config.razorpay_key_id if site_config and site_config.razorpay_key_id else settings.RAZORPAY_KEY_ID
-    key_secret = site_config.razorpay_key_secret if site_config and site_config.razorpay_key_secret else settings.RAZORPAY_KEY_SECRET
-    return key_id, key_secret
+from django.db.models import F
+from .context_processors import site_configuration
+from .payments import PaymentError, get_gateway, razorpay_credentials
 
 def training_enroll(request, package_id):
     """
@@ -314,18 +339,13 @@ def training_enroll(request, package_id):
             enrollment.payment_status = 'PENDING'
             enrollment.save()
             
-            # Initialize Razorpay and create order
-            site_config = SiteConfiguration.objects.first()
-            key_id, key_secret = get_razorpay_keys(site_config)
-            client = razorpay.Client(auth=(key_id, key_secret))
+            # Create the Razorpay order (pooled client, bounded timeouts; see core/payments.py)
+            site_config = site_configuration()
+            credentials = razorpay_credentials(site_config)
             amount_in_paisa = int(enrollment.final_price * 100)
             
             try:
-                razorpay_order = client.order.create(dict(
-                    amount=amount_in_paisa,
-                    currency='INR',
-                    payment_capture='1'
-                ))
+                razorpay_order = get_gateway().create_order(credentials, amount_in_paisa, currency='INR')
                 enrollment.razorpay_order_id = razorpay_order['id']
                 enrollment.save()
                 
@@ -333,11 +353,11 @@ def training_enroll(request, package_id):
                     'enrollment': enrollment,
                     'razorpay_order_id': razorpay_order['id'],
                     'razorpay_amount': amount_in_paisa,
-                    'razorpay_key_id': key_id,
+                    'razorpay_key_id': credentials[0],
                     'config': site_config,
                 }
                 return render(request, 'core/training_payment.html', context)
-            except Exception as e:
+            except PaymentError as e:
                 messages.error(request, f"Error generating payment link: {str(e)}")
                 return render(request, 'core/training_failed.html', {'error': str(e)})
         else:
@@ -370,14 +390,8 @@ def training_payment_callback(request):
             enrollment = TrainingEnrollment.objects.get(razorpay_order_id=order_id)
             
             # Verify signature
-            key_id, key_secret = get_razorpay_keys()
-            client = razorpay.Client(auth=(key_id, key_secret))
-            params_dict = {
-                'razorpay_order_id': order_id,
-                'razorpay_payment_id': payment_id,
-                'razorpay_signature': signature
-            }
-            client.utility.verify_payment_signature(params_dict)
+            if not get_gateway().verify_payment(razorpay_credentials(), order_id, payment_id, signature):
+                raise PaymentError("Razorpay Signature Verification Failed")
             
             # Update to Completed/Paid
             enrollment.razorpay_payment_id = payment_id
@@ -428,46 +442,71 @@ def validate_referral(request):
     except (ReferralCode.DoesNotExist, TrainingPackage.DoesNotExist):
         return JsonResponse({'valid': False, 'message': 'Invalid or inactive referral code.'})
 
-@staff_member_required
-def lms_dashboard(request):
+def _lms_enrollments(request):
     """
-    LMS dashboard view, accessible only by staff side users.
-    Allows managing status and viewing enrollments.
+    Enrollments matching the dashboard's `search` and `status` query parameters.
+    Returns (queryset, search, status).
     """
-    enrollments_list = TrainingEnrollment.objects.select_related('field', 'sub_field', 'package').all()
+    enrollments_list = TrainingEnrollment.objects.all()
     
     # Search
     q_search = request.GET.get('search', '').strip()
     if q_search:
-        enrollments_list = enrollments_list.filter(
-            Q(full_name__icontains=q_search) |
-            Q(email__icontains=q_search) |
-            Q(phone__icontains=q_search)
-        )
+        enrollments_list = search_filter(enrollments_list, 'enrollments', q_search)
         
     # Filter
     status_filter = request.GET.get('status', '').strip()
     if status_filter:
         enrollments_list = enrollments_list.filter(payment_status=status_filter)
-        
-    # Stats
-    total_enrolled = enrollments_list.count()
-    total_paid = enrollments_list.filter(payment_status='COMPLETED').count()
-    total_revenue = enrollments_list.filter(payment_status='COMPLETED').aggregate(Sum('final_price'))['final_price__sum'] or 0.00
-    total_pending = enrollments_list.filter(payment_status='PENDING').count()
+    return enrollments_list, q_search, status_filter
+
+@staff_member_required
+def lms_dashboard(request):
+    """
+    LMS dashboard view, accessible only by staff side users.
+    Allows managing status and viewing enrollments; the table is loaded page
+    by page from lms_enrollments_api.
+    """
+    enrollments_list, q_search, status_filter = _lms_enrollments(request)
+
+    # Stats: from the per-status rollup unless a search narrows the rows.
+    if not q_search and getattr(settings, 'LMS_STATS_ROLLUP', True):
+        stats = rollup_stats(status_filter)
+    else:
+        stats = enrollment_stats(enrollments_list)
     
     context = {
-        'enrollments': enrollments_list,
         'search': q_search,
         'status_filter': status_filter,
-        'total_enrolled': total_enrolled,
-        'total_paid': total_paid,
-        'total_revenue': total_revenue,
-        'total_pending': total_pending,
+        **stats,
         'config': SiteConfiguration.objects.first(),
     }
     return render(request, 'core/lms_dashboard.html', context)
 
+@staff_member_required
+def lms_enrollments_api(request):
+    """
+    JSON page of enrollments for the LMS dashboard table, newest first, with the
+    same `search`/`status` filters as the dashboard. Pass the returned
+    `next_cursor` as `cursor` to get the next page; it is null on the last one.
+    """
+    enrollments_list, q_search, status_filter = _lms_enrollments(request)
+    try:
+        size = min(max(int(request.GET.get('limit', LMS_PAGE_SIZE)), 1), LMS_MAX_PAGE_SIZE)
+    except ValueError:
+        size = LMS_PAGE_SIZE
+
+    rows = enrollments_list.values(
+        'id', 'full_name', 'email', 'phone', 'final_price', 'original_price',
+        'razorpay_order_id', 'razorpay_payment_id', 'payment_status', 'enrollment_date',
+        field_name=F('field__name'), sub_field_name=F('sub_field__name'), referral_code_code=F('referral_code__code'),
+    )
+    try:
+        results, next_cursor = keyset_page(rows, 'enrollment_date', request.GET.get('cursor'), size)
+    except InvalidCursor as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    return JsonResponse({'results': results, 'next_cursor': next_cursor})
+
 @staff_member_required
 def update_enrollment_status(request, pk):
     """
@@ -24,7 +24,19 @@ fi
 
 bash scripts/ensure-glb-models.sh
 
-echo "==> Collecting static files..."
+echo "==> Optimizing GLB models..."
+python manage.py optimize_models
+
+echo "==> Building front-end assets..."
+if ! command -v npm >/dev/null 2>&1; then
+    echo "ERROR: Node.js/npm not installed — needed to build the Tailwind CSS (core/static/core/dist/ is not committed)"
+    exit 1
+fi
+# npm ci installs exactly package-lock.json and never rewrites it.
+npm ci --no-audit --no-fund
+python manage.py build_frontend
+
+echo "==> Collecting static files (hashed names, .br/.gz copies)..."
 rm -rf staticfiles/game/models
 python manage.py collectstatic --noinput
 
@@ -35,5 +47,22 @@ if ! head -c 4 "$SAMPLE" | grep -q glTF; then
 fi
 echo "==> staticfiles/game/models OK ($(wc -c < "$SAMPLE") bytes)"
 
+echo "==> Installing background services (scripts/systemd)..."
+UNITS=()
+for unit in scripts/systemd/*.service scripts/systemd/*.timer; do
+    [ -e "$unit" ] || continue
+    name="$(basename "$unit")"
+    sed -e "s|@USER@|$(id -un)|g" -e "s|@APP_DIR@|$(pwd)|g" "$unit" | sudo tee "/etc/systemd/system/$name" >/dev/null
+    UNITS+=("$name")
+done
+sudo systemctl daemon-reload
+for name in "${UNITS[@]}"; do
+    # Timers start their service; services with a timer are not enabled themselves.
+    if [[ "$name" == *.timer || ! -e "scripts/systemd/${name%.service}.timer" ]]; then
+        sudo systemctl enable "$name"
+        sudo systemctl restart "$name"
+    fi
+done
+
 sudo systemctl restart portfolio
 echo "Deploy complete. Hard-refresh /game/ in browser (Cmd+Shift+R)."
\ No newline at end of file
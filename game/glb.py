@@ -0,0 +1,841 @@
+"""
+Reading, optimizing and writing binary glTF (GLB) models.
+
+optimize_glb() is what `manage.py optimize_models` runs over the game's
+character models (see game.model_assets). Its passes:
+
+- pruning: nodes outside the scene, helper meshes the client strips after
+  loading anyway (see stripHelperMeshes in CharacterModels.js), animation
+  clips the client never plays, and everything only they referenced;
+- vertex quantization (KHR_mesh_quantization): positions as 16-bit integers
+  (the dequantization transform goes into the node, or for skinned meshes
+  into the inverse bind matrices), normals and tangents as 8-bit, UVs as
+  16-bit and skin weights as 8-bit normalized values; animation rotations as
+  16-bit normalized values;
+- index compaction: degenerate triangles and unreferenced vertices dropped,
+  vertices renumbered in first-use order, indices stored as 16-bit whenever
+  they fit;
+- embedded PNG/JPEG textures re-encoded as WebP (EXT_texture_webp) when that
+  is smaller; normal maps losslessly.
+
+Everything is rewritten into one tightly packed buffer in which identical
+accessors (e.g. keyframe times shared by many channels) are stored once.
+Pure functions of bytes (no Django/DB access), so they can run in a worker
+process.
+
+For lower levels of detail it also decimates triangle meshes (vertex
+clustering) and downscales the textures. Decimation only rewrites indices and
+the nodes, skins and quantization transforms stay those of the full model, so
+the client can swap a level's geometry into an already skinned instance.
+"""
+import hashlib
+import json
+import re
+import struct
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from core.utils import encode_webp
+
+GLB_MAGIC = b'glTF'
+CHUNK_JSON = 0x4E4F534A
+CHUNK_BIN = 0x004E4942
+
+BYTE, UNSIGNED_BYTE, SHORT, UNSIGNED_SHORT, UNSIGNED_INT, FLOAT = 5120, 5121, 5122, 5123, 5125, 5126
+DTYPES = {
+    BYTE: np.int8, UNSIGNED_BYTE: np.uint8, SHORT: np.int16,
+    UNSIGNED_SHORT: np.uint16, UNSIGNED_INT: np.uint32, FLOAT: np.float32,
+}
+COMPONENTS = {'SCALAR': 1, 'VEC2': 2, 'VEC3': 3, 'VEC4': 4, 'MAT2': 4, 'MAT3': 9, 'MAT4': 16}
+ARRAY_BUFFER, ELEMENT_ARRAY_BUFFER = 34962, 34963
+TRIANGLES = 4
+
+# Clips CharacterModels.js can play (findClip()); the rest are dropped.
+DEFAULT_KEEP_ANIMATIONS = r'idle|walk|run|jump|climb'
+# Meshes CharacterModels.js removes right after loading (stripHelperMeshes()).
+HELPER_MESH = re.compile(r'collision|hitbox|placeholder|root\s*mesh', re.IGNORECASE)
+DEFAULT_TEXTURE_QUALITY = 90
+
+QUANTIZATION_EXTENSION = 'KHR_mesh_quantization'
+WEBP_EXTENSION = 'EXT_texture_webp'
+
+
+class InvalidGLB(ValueError):
+    """
+    The data is not a self-contained glTF 2.0 binary.
+    """
+
+
+# ------------------------------------------------------------
+# Container
+# ------------------------------------------------------------
+
+def read_glb(data):
+    """
+    Returns (document, binary chunk) of a GLB file.
+    """
+    if len(data) < 20 or data[:4] != GLB_MAGIC:
+        if data.startswith(b'version https://git-lfs'):
+            raise InvalidGLB('Git LFS pointer, not a GLB (run `git lfs pull`)')
+        raise InvalidGLB('Not a GLB file')
+    version, length = struct.unpack_from('<II', data, 4)
+    if version != 2:
+        raise InvalidGLB(f'Unsupported glTF version {version}')
+
+    doc, binary = None, b''
+    offset, end = 12, min(length, len(data))
+    while offset + 8 <= end:
+        chunk_length, chunk_type = struct.unpack_from('<II', data, offset)
+        chunk = data[offset + 8:offset + 8 + chunk_length]
+        if chunk_type == CHUNK_JSON:
+            doc = json.loads(chunk)
+        elif chunk_type == CHUNK_BIN and not binary:
+            binary = bytes(chunk)
+        offset += 8 + chunk_length
+    if doc is None:
+        raise InvalidGLB('GLB has no JSON chunk')
+
+    for kind in ('buffers', 'images'):
+        for item in doc.get(kind, []):
+            if 'uri' in item:
+                raise InvalidGLB(f'External {kind} are not supported; embed them in the GLB')
+    if len(doc.get('buffers', [])) > 1:
+        raise InvalidGLB('GLB has more than one buffer')
+    return doc, binary
+
+
+def write_glb(doc, binary):
+    body = json.dumps(doc, separators=(',', ':')).encode()
+    body += b' ' * (-len(body) % 4)
+    binary = bytes(binary) + b'\0' * (-len(binary) % 4)
+    chunks = struct.pack('<II', len(body), CHUNK_JSON) + body
+    if binary:
+        chunks += struct.pack('<II', len(binary), CHUNK_BIN) + binary
+    return struct.pack('<4sII', GLB_MAGIC, 2, 12 + len(chunks)) + chunks
+
+
+def _view_array(doc, binary, view_index, byte_offset, dtype, count, components):
+    view = doc['bufferViews'][view_index]
+    start = view.get('byteOffset', 0) + byte_offset
+    element = dtype.itemsize * components
+    stride = view.get('byteStride') or element
+    if count == 0:
+        return np.zeros((0, components), dtype)
+    return np.ndarray(
+        shape=(count, components), dtype=dtype, buffer=binary, offset=start, strides=(stride, dtype.itemsize),
+    ).copy()
+
+
+def read_accessor(doc, binary, index):
+    """
+    The accessor's elements as a (count, components) array of its stored
+    component type (sparse substitutions applied).
+    """
+    accessor = doc['accessors'][index]
+    dtype = np.dtype(DTYPES[accessor['componentType']]).newbyteorder('<')
+    components = COMPONENTS[accessor['type']]
+    count = accessor['count']
+    if 'bufferView' in accessor:
+        array = _view_array(doc, binary, accessor['bufferView'], accessor.get('byteOffset', 0), dtype, count, components)
+    else:
+        array = np.zeros((count, components), dtype)
+
+    sparse = accessor.get('sparse')
+    if sparse:
+        indices, values = sparse['indices'], sparse['values']
+        index_dtype = np.dtype(DTYPES[indices['componentType']]).newbyteorder('<')
+        rows = _view_array(doc, binary, indices['bufferView'], indices.get('byteOffset', 0), index_dtype, sparse['count'], 1)
+        array[rows[:, 0]] = _view_array(
+            doc, binary, values['bufferView'], values.get('byteOffset', 0), dtype, sparse['count'], components,
+        )
+    return array
+
+
+class _BufferBuilder:
+    """
+    Accumulates the output buffer, its views and accessors. Identical
+    accessors are stored once.
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+        self.views = []
+        self.accessors = []
+        self._stored = {}
+
+    def view(self, payload, target=None, stride=None):
+        self.data += b'\0' * (-len(self.data) % 4)
+        view = {'buffer': 0, 'byteOffset': len(self.data), 'byteLength': len(payload)}
+        if stride:
+            view['byteStride'] = stride
+        if target:
+            view['target'] = target
+        self.data += payload
+        self.views.append(view)
+        return len(self.views) - 1
+
+    def accessor(self, array, component_type, accessor_type, normalized=False, target=None, bounds=False):
+        dtype = np.dtype(DTYPES[component_type]).newbyteorder('<')
+        array = np.ascontiguousarray(array, dtype=dtype).reshape(len(array), COMPONENTS[accessor_type])
+        count = len(array)
+        element = array.itemsize * array.shape[1]
+        payload, stride = array.tobytes(), None
+        if target == ARRAY_BUFFER and element % 4:
+            # Vertex attributes must be 4-byte aligned.
+            stride = element + (-element % 4)
+            padded = np.zeros((count, stride), np.uint8)
+            padded[:, :element] = array.view(np.uint8).reshape(count, element)
+            payload = padded.tobytes()
+
+        key = (hashlib.sha1(payload).digest(), count, component_type, accessor_type, normalized, target, bounds)
+        if key in self._stored:
+            return self._stored[key]
+
+        accessor = {
+            'bufferView': self.view(payload, target, stride),
+            'componentType': component_type,
+            'count': count,
+            'type': accessor_type,
+        }
+        if normalized:
+            accessor['normalized'] = True
+        if bounds and count:
+            accessor['min'] = array.min(axis=0).tolist()
+            accessor['max'] = array.max(axis=0).tolist()
+        self.accessors.append(accessor)
+        self._stored[key] = len(self.accessors) - 1
+        return self._stored[key]
+
+    def copy(self, doc, binary, index, target=None, bounds=False):
+        """
+        Stores an input accessor unchanged (apart from being densely packed).
+        """
+        accessor = doc['accessors'][index]
+        return self.accessor(
+            read_accessor(doc, binary, index), accessor['componentType'], accessor['type'],
+            accessor.get('normalized', False), target, bounds or 'min' in accessor,
+        )
+
+
+# ------------------------------------------------------------
+# Pruning
+# ------------------------------------------------------------
+
+def _descendants(nodes, roots):
+    found, stack = set(), list(roots)
+    while stack:
+        index = stack.pop()
+        if index not in found:
+            found.add(index)
+            stack.extend(nodes[index].get('children', []))
+    return found
+
+
+def _kept_nodes(doc):
+    nodes = doc.get('nodes', [])
+    scenes = doc.get('scenes', [])
+    roots = [index for scene in scenes for index in scene.get('nodes', [])] if scenes else range(len(nodes))
+    kept = _descendants(nodes, roots)
+    # Joints of kept skins, even if the scene does not reach them.
+    for index in list(kept):
+        skin = nodes[index].get('skin')
+        if skin is not None:
+            skin = doc['skins'][skin]
+            kept |= _descendants(nodes, skin['joints'] + ([skin['skeleton']] if 'skeleton' in skin else []))
+    return kept
+
+
+def _is_helper(doc, node):
+    mesh = doc['meshes'][node['mesh']]
+    return bool(HELPER_MESH.search(node.get('name', '')) or HELPER_MESH.search(mesh.get('name', '')))
+
+
+def _kept_animations(doc, kept_nodes, keep_animations):
+    animations = doc.get('animations', [])
+    if keep_animations:
+        pattern = re.compile(keep_animations, re.IGNORECASE)
+        selected = [animation for animation in animations if pattern.search(animation.get('name', ''))]
+        # A pattern matching nothing is a mistake, not a request to drop every clip.
+        animations = selected or animations
+
+    kept = []
+    for animation in animations:
+        channels = [
+            channel for channel in animation['channels']
+            if channel['target'].get('node') is None or channel['target']['node'] in kept_nodes
+        ]
+        if channels:
+            kept.append((animation, channels))
+    return kept
+
+
+def _texture_refs(value, found):
+    """
+    Collects the texture indices of a material (any *Texture textureInfo,
+    including in extensions).
+    """
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key.endswith('Texture') and isinstance(item, dict) and 'index' in item:
+                found.add(item['index'])
+            _texture_refs(item, found)
+    elif isinstance(value, list):
+        for item in value:
+            _texture_refs(item, found)
+    return found
+
+
+def _remap_texture_refs(value, texture_map):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key.endswith('Texture') and isinstance(item, dict) and 'index' in item:
+                item['index'] = texture_map[item['index']]
+            _remap_texture_refs(item, texture_map)
+    elif isinstance(value, list):
+        for item in value:
+            _remap_texture_refs(item, texture_map)
+
+
+def _texture_source(texture):
+    for extension in (WEBP_EXTENSION, 'KHR_texture_basisu', 'EXT_texture_avif'):
+        source = texture.get('extensions', {}).get(extension, {}).get('source')
+        if source is not None:
+            return source
+    return texture.get('source')
+
+
+# ------------------------------------------------------------
+# Quantization
+# ------------------------------------------------------------
+
+def _dequantization(positions):
+    """
+    (center, step) mapping 16-bit integers back to `positions`' bounding box:
+    p = center + step * q. The step is uniform so normals keep their direction.
+    """
+    low, high = positions.min(axis=0), positions.max(axis=0)
+    center = (low + high) / 2
+    step = float((high - low).max()) / 2 / 32767 or 1.0
+    return center.astype(np.float64), step
+
+
+def _dequantization_matrix(center, step):
+    matrix = np.diag([step, step, step, 1.0])
+    matrix[:3, 3] = center
+    return matrix
+
+
+def _quantize_positions(positions, center, step):
+    return np.clip(np.round((positions - center) / step), -32767, 32767).astype(np.int16)
+
+
+def _quantize_unit(values, bits):
+    limit = (1 << (bits - 1)) - 1
+    return np.clip(np.round(values * limit), -limit, limit).astype(np.int8 if bits == 8 else np.int16)
+
+
+def _quantize_weights(weights):
+    """
+    8-bit normalized weights, rounded so that every vertex still sums to 255.
+    """
+    total = weights.sum(axis=1, keepdims=True)
+    weights = np.where(total > 0, weights / np.where(total > 0, total, 1), weights)
+    quantized = np.round(weights * 255).astype(np.int32)
+    error = 255 - quantized.sum(axis=1)
+    largest = quantized.argmax(axis=1)
+    rows = np.arange(len(quantized))
+    has_weight = total[:, 0] > 0
+    quantized[rows[has_weight], largest[has_weight]] += error[has_weight]
+    return np.clip(quantized, 0, 255).astype(np.uint8)
+
+
+def _node_matrix(node):
+    if 'matrix' in node:
+        return np.array(node['matrix'], dtype=np.float64).reshape(4, 4).T
+    x, y, z, w = node.get('rotation', (0, 0, 0, 1))
+    rotation = np.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+        [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+        [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)],
+    ])
+    matrix = np.eye(4)
+    matrix[:3, :3] = rotation * np.array(node.get('scale', (1, 1, 1)))
+    matrix[:3, 3] = node.get('translation', (0, 0, 0))
+    return matrix
+
+
+def _apply_to_node(node, center, step):
+    """
+    Appends the dequantization transform to an (unskinned) mesh node.
+    """
+    if 'matrix' in node:
+        matrix = _node_matrix(node) @ _dequantization_matrix(center, step)
+        node['matrix'] = matrix.T.reshape(16).tolist()
+        return
+    # T R S (T_c S_step) = T_(t + R S c) R (S step)
+    linear = _node_matrix(node)[:3, :3]
+    node['translation'] = (np.array(node.get('translation', (0, 0, 0))) + linear @ center).tolist()
+    node['scale'] = (np.array(node.get('scale', (1, 1, 1))) * step).tolist()
+
+
+def _quantization_plan(doc, binary, kept_nodes, animated_nodes, meshes):
+    """
+    Decides which meshes get 16-bit positions. Returns
+    ({mesh: (center, step)}, {skin: (center, step)}, {node: (center, step)}).
+
+    A skinned mesh is dequantized through its skin's inverse bind matrices, so
+    every mesh of that skin shares one transform. An unskinned mesh is
+    dequantized through its nodes, which therefore must have no children and
+    no animation.
+    """
+    nodes = doc['nodes']
+    users = {}
+    for index in kept_nodes:
+        node = nodes[index]
+        if node.get('mesh') in meshes:
+            users.setdefault(node['mesh'], []).append(index)
+
+    def float_positions(mesh):
+        arrays = []
+        for primitive in doc['meshes'][mesh]['primitives']:
+            position = primitive['attributes'].get('POSITION')
+            if position is None or primitive.get('targets') or doc['accessors'][position]['componentType'] != FLOAT:
+                return None
+            arrays.append(read_accessor(doc, binary, position))
+        return arrays
+
+    mesh_plan, skin_plan, node_plan = {}, {}, {}
+    skin_meshes, blocked_skins = {}, set()
+    for mesh, mesh_users in users.items():
+        skins = {nodes[index].get('skin') for index in mesh_users}
+        positions = float_positions(mesh)
+        if skins == {None}:
+            if positions and all(
+                not nodes[index].get('children') and index not in animated_nodes for index in mesh_users
+            ):
+                mesh_plan[mesh] = _dequantization(np.concatenate(positions))
+                for index in mesh_users:
+                    node_plan[index] = mesh_plan[mesh]
+            continue
+        if len(skins) > 1 or None in skins or positions is None:
+            blocked_skins |= skins - {None}
+            continue
+        skin_meshes.setdefault(skins.pop(), []).append((mesh, positions))
+
+    for skin, entries in skin_meshes.items():
+        if skin in blocked_skins:
+            continue
+        transform = _dequantization(np.concatenate([array for _mesh, arrays in entries for array in arrays]))
+        skin_plan[skin] = transform
+        for mesh, _arrays in entries:
+            mesh_plan[mesh] = transform
+    return mesh_plan, skin_plan, node_plan
+
+
+# ------------------------------------------------------------
+# Meshes
+# ------------------------------------------------------------
+
+def _compact(indices, vertex_count):
+    """
+    Drops degenerate triangles and renumbers vertices in first-use order.
+    Returns (new indices, old vertex index for each new vertex).
+    """
+    triangles = indices.reshape(-1, 3)
+    valid = (
+        (triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2]) & (triangles[:, 0] != triangles[:, 2])
+    )
+    flat = triangles[valid].reshape(-1)
+    used, first = np.unique(flat, return_index=True)
+    order = used[np.argsort(first, kind='stable')]
+    remap = np.full(vertex_count, -1, dtype=np.int64)
+    remap[order] = np.arange(len(order))
+    return remap[flat], order
+
+
+def _cluster(positions, triangles, used, low, cell):
+    """
+    `triangles` with every vertex replaced by the representative of its grid
+    cell (the vertex nearest the cell's centroid), degenerate and duplicate
+    triangles dropped.
+    """
+    points = positions[used]
+    cells = np.floor((points - low) / cell).astype(np.int64)
+    _cells, cell_of, counts = np.unique(cells, axis=0, return_inverse=True, return_counts=True)
+    cell_of = cell_of.reshape(-1)
+    centroids = np.zeros((len(counts), 3))
+    np.add.at(centroids, cell_of, points)
+    centroids /= counts[:, None]
+    distance = ((points - centroids[cell_of]) ** 2).sum(axis=1)
+    order = np.lexsort((distance, cell_of))
+    first = order[np.r_[0, np.flatnonzero(np.diff(cell_of[order])) + 1]]
+    remap = np.arange(len(positions))
+    remap[used] = used[first][cell_of]
+
+    collapsed = remap[triangles]
+    collapsed = collapsed[
+        (collapsed[:, 0] != collapsed[:, 1]) & (collapsed[:, 1] != collapsed[:, 2]) & (collapsed[:, 0] != collapsed[:, 2])
+    ]
+    _unique, keep = np.unique(np.sort(collapsed, axis=1), axis=0, return_index=True)
+    return collapsed[np.sort(keep)]
+
+
+def _decimate(positions, indices, ratio):
+    """
+    Vertex-clustering decimation of a triangle list to about `ratio` of its
+    triangles: the coarsest grid that still keeps that many. Only existing
+    vertices are referenced, so every attribute (skin weights included) stays
+    valid.
+    """
+    triangles = indices.reshape(-1, 3)
+    target = max(1, int(len(triangles) * ratio))
+    used = np.unique(triangles)
+    if len(triangles) <= target or not len(used):
+        return indices
+    positions = positions.astype(np.float64)
+    low = positions[used].min(axis=0)
+    extent = float((positions[used].max(axis=0) - low).max()) or 1.0
+
+    best, low_res, high_res = triangles, 1, 1024
+    while low_res < high_res:
+        resolution = (low_res + high_res) // 2
+        collapsed = _cluster(positions, triangles, used, low, extent / resolution)
+        if len(collapsed) >= target:
+            best, high_res = collapsed, resolution
+        else:
+            low_res = resolution + 1
+    return best.reshape(-1)
+
+
+def _write_attribute(builder, doc, binary, name, index, rows, quantize, transform, attributes):
+    accessor = doc['accessors'][index]
+    array = read_accessor(doc, binary, index)
+    if rows is not None:
+        array = array[rows]
+    is_float = accessor['componentType'] == FLOAT
+
+    if name == 'POSITION' and transform is not None:
+        return builder.accessor(_quantize_positions(array, *transform), SHORT, 'VEC3', target=ARRAY_BUFFER, bounds=True), True
+    if quantize and is_float:
+        if name in ('NORMAL', 'TANGENT'):
+            return builder.accessor(_quantize_unit(array, 8), BYTE, accessor['type'], True, ARRAY_BUFFER), True
+        if name.startswith('TEXCOORD_') and array.size and array.min() >= 0 and array.max() <= 1:
+            uv = np.round(array * 65535).astype(np.uint16)
+            return builder.accessor(uv, UNSIGNED_SHORT, 'VEC2', True, ARRAY_BUFFER), True
+        if name.startswith('COLOR_') and array.size and array.min() >= 0 and array.max() <= 1:
+            return builder.accessor(np.round(array * 255), UNSIGNED_BYTE, accessor['type'], True, ARRAY_BUFFER), False
+        # With a second weights set the 255 total would have to span both.
+        if name == 'WEIGHTS_0' and 'WEIGHTS_1' not in attributes:
+            return builder.accessor(_quantize_weights(array), UNSIGNED_BYTE, 'VEC4', True, ARRAY_BUFFER), False
+    if quantize and name.startswith('JOINTS_') and array.size and array.max() < 256:
+        return builder.accessor(array, UNSIGNED_BYTE, 'VEC4', target=ARRAY_BUFFER), False
+    return builder.accessor(
+        array, accessor['componentType'], accessor['type'], accessor.get('normalized', False), ARRAY_BUFFER,
+        bounds=name == 'POSITION',
+    ), False
+
+
+def _write_mesh(builder, doc, binary, mesh, exclusive, quantize, transform, simplify, stats):
+    """
+    Rewrites one mesh's primitives into `builder`. Returns (mesh, whether it
+    uses KHR_mesh_quantization).
+    """
+    mesh = dict(mesh)
+    primitives, extension_used = [], False
+    for primitive in mesh['primitives']:
+        primitive = dict(primitive)
+        attributes = primitive['attributes']
+        vertex_count = doc['accessors'][next(iter(attributes.values()))]['count']
+        stats['vertices_before'] += vertex_count
+
+        rows, indices = None, None
+        if 'indices' in primitive:
+            indices = read_accessor(doc, binary, primitive['indices']).reshape(-1).astype(np.int64)
+            if primitive.get('mode', TRIANGLES) == TRIANGLES:
+                stats['triangles_before'] += len(indices) // 3
+                if simplify < 1 and 'POSITION' in attributes:
+                    indices = _decimate(read_accessor(doc, binary, attributes['POSITION']), indices, simplify)
+                stats['triangles_after'] += len(indices) // 3
+                if exclusive(primitive):
+                    indices, rows = _compact(indices, vertex_count)
+                    vertex_count = len(rows)
+        stats['vertices_after'] += vertex_count
+
+        new_attributes = {}
+        for name, index in attributes.items():
+            new_attributes[name], quantized = _write_attribute(
+                builder, doc, binary, name, index, rows, quantize, transform, attributes,
+            )
+            extension_used |= quantized
+        primitive['attributes'] = new_attributes
+
+        if primitive.get('targets'):
+            primitive['targets'] = [
+                {
+                    name: builder.accessor(
+                        read_accessor(doc, binary, index)[rows] if rows is not None else read_accessor(doc, binary, index),
+                        doc['accessors'][index]['componentType'], doc['accessors'][index]['type'],
+                        doc['accessors'][index].get('normalized', False), ARRAY_BUFFER, bounds=name == 'POSITION',
+                    )
+                    for name, index in target.items()
+                }
+                for target in primitive['targets']
+            ]
+        if indices is not None:
+            component_type = UNSIGNED_SHORT if vertex_count <= 65536 else UNSIGNED_INT
+            primitive['indices'] = builder.accessor(indices, component_type, 'SCALAR', target=ELEMENT_ARRAY_BUFFER)
+        primitives.append(primitive)
+    mesh['primitives'] = primitives
+    return mesh, extension_used
+
+
+# ------------------------------------------------------------
+# Optimization
+# ------------------------------------------------------------
+
+def _normal_map_images(doc, textures):
+    images = set()
+    for material in doc.get('materials', []):
+        normal = material.get('normalTexture')
+        if normal and normal['index'] in textures:
+            images.add(_texture_source(doc['textures'][normal['index']]))
+    return images
+
+
+def _image_bytes(doc, binary, image):
+    view = doc['bufferViews'][image['bufferView']]
+    start = view.get('byteOffset', 0)
+    return binary[start:start + view['byteLength']]
+
+
+def optimize_glb(data, keep_animations=DEFAULT_KEEP_ANIMATIONS, quantize=True,
+                 texture_quality=DEFAULT_TEXTURE_QUALITY, webp=True, simplify=1.0, texture_scale=1.0):
+    """
+    Returns (optimized GLB bytes, stats dict). `keep_animations` is a regex of
+    clip names to keep (falsy: keep all); texture_quality is the lossy WebP
+    quality. For a lower level of detail, `simplify` is the fraction of
+    triangles to keep and `texture_scale` the fraction of the texture width
+    (WebP only). Raises InvalidGLB.
+    """
+    doc, binary = read_glb(data)
+    nodes = doc.get('nodes', [])
+    stats = {
+        'bytes_before': len(data), 'nodes_before': len(nodes), 'animations_before': len(doc.get('animations', [])),
+        'vertices_before': 0, 'vertices_after': 0, 'triangles_before': 0, 'triangles_after': 0, 'textures_webp': 0,
+    }
+
+    kept_nodes = _kept_nodes(doc)
+    helper_nodes = {index for index in kept_nodes if 'mesh' in nodes[index] and _is_helper(doc, nodes[index])}
+    animations = _kept_animations(doc, kept_nodes, keep_animations)
+    animated_nodes = {
+        channel['target']['node'] for _animation, channels in animations for channel in channels
+        if channel['target'].get('node') is not None
+    }
+
+    node_order = sorted(kept_nodes)
+    node_map = {old: new for new, old in enumerate(node_order)}
+    mesh_order = sorted({
+        nodes[index]['mesh'] for index in kept_nodes if 'mesh' in nodes[index] and index not in helper_nodes
+    })
+    mesh_map = {old: new for new, old in enumerate(mesh_order)}
+    skin_order = sorted({
+        nodes[index]['skin'] for index in kept_nodes
+        if 'skin' in nodes[index] and index not in helper_nodes and 'mesh' in nodes[index]
+    })
+    skin_map = {old: new for new, old in enumerate(skin_order)}
+    material_order = sorted({
+        primitive['material'] for mesh in mesh_order for primitive in doc['meshes'][mesh]['primitives']
+        if 'material' in primitive
+    })
+    material_map = {old: new for new, old in enumerate(material_order)}
+    texture_order = sorted(set().union(*(_texture_refs(doc['materials'][m], set()) for m in material_order)))
+    texture_map = {old: new for new, old in enumerate(texture_order)}
+    image_order = sorted({
+        _texture_source(doc['textures'][t]) for t in texture_order if _texture_source(doc['textures'][t]) is not None
+    })
+    image_map = {old: new for new, old in enumerate(image_order)}
+    sampler_order = sorted({doc['textures'][t]['sampler'] for t in texture_order if 'sampler' in doc['textures'][t]})
+    sampler_map = {old: new for new, old in enumerate(sampler_order)}
+
+    mesh_plan, skin_plan, node_plan = (
+        _quantization_plan(doc, binary, kept_nodes - helper_nodes, animated_nodes, set(mesh_order))
+        if quantize else ({}, {}, {})
+    )
+
+    builder = _BufferBuilder()
+    extensions_used = set(doc.get('extensionsUsed', []))
+    extensions_required = set(doc.get('extensionsRequired', []))
+
+    # Meshes. A primitive is compacted only if no other primitive shares its vertex data.
+    usage = {}
+    for mesh in mesh_order:
+        for primitive in doc['meshes'][mesh]['primitives']:
+            for index in primitive['attributes'].values():
+                usage[index] = usage.get(index, 0) + 1
+
+    def exclusive(primitive):
+        return all(usage[index] == 1 for index in primitive['attributes'].values()) and not primitive.get('targets')
+
+    new_meshes = []
+    for mesh in mesh_order:
+        new_mesh, quantized = _write_mesh(
+            builder, doc, binary, doc['meshes'][mesh], exclusive, quantize, mesh_plan.get(mesh), simplify, stats,
+        )
+        for primitive in new_mesh['primitives']:
+            if 'material' in primitive:
+                primitive['material'] = material_map[primitive['material']]
+        new_meshes.append(new_mesh)
+        if quantized:
+            extensions_used.add(QUANTIZATION_EXTENSION)
+            extensions_required.add(QUANTIZATION_EXTENSION)
+
+    # Nodes.
+    new_nodes = []
+    for old in node_order:
+        node = dict(nodes[old])
+        if old in helper_nodes:
+            node.pop('mesh', None)
+            node.pop('skin', None)
+        if 'children' in node:
+            node['children'] = [node_map[child] for child in node['children'] if child in node_map]
+            if not node['children']:
+                del node['children']
+        if 'mesh' in node:
+            node['mesh'] = mesh_map[node['mesh']]
+        if 'skin' in node:
+            node['skin'] = skin_map[node['skin']]
+        if old in node_plan:
+            _apply_to_node(node, *node_plan[old])
+        new_nodes.append(node)
+
+    # Skins: the dequantization transform goes into the inverse bind matrices.
+    new_skins = []
+    for old in skin_order:
+        skin = dict(doc['skins'][old])
+        if 'inverseBindMatrices' in skin:
+            matrices = read_accessor(doc, binary, skin['inverseBindMatrices']).astype(np.float64)
+        else:
+            matrices = np.tile(np.eye(4).reshape(16), (len(skin['joints']), 1))
+        if old in skin_plan:
+            dequantize = _dequantization_matrix(*skin_plan[old])
+            matrices = np.stack([(matrix.reshape(4, 4).T @ dequantize).T.reshape(16) for matrix in matrices])
+        skin['inverseBindMatrices'] = builder.accessor(matrices, FLOAT, 'MAT4')
+        skin['joints'] = [node_map[joint] for joint in skin['joints']]
+        if 'skeleton' in skin:
+            skin['skeleton'] = node_map[skin['skeleton']]
+        new_skins.append(skin)
+
+    # Animations. Rotations become 16-bit normalized quaternions.
+    new_animations = []
+    for animation, channels in animations:
+        animation = dict(animation)
+        sampler_paths = {}
+        for channel in channels:
+            sampler_paths.setdefault(channel['sampler'], set()).add(channel['target'].get('path'))
+        sampler_order_local = sorted(sampler_paths)
+        local_map = {old: new for new, old in enumerate(sampler_order_local)}
+        samplers = []
+        for old in sampler_order_local:
+            sampler = dict(animation['samplers'][old])
+            sampler['input'] = builder.copy(doc, binary, sampler['input'], bounds=True)
+            output = doc['accessors'][sampler['output']]
+            if (
+                quantize and sampler_paths[old] == {'rotation'} and output['componentType'] == FLOAT
+                and sampler.get('interpolation', 'LINEAR') != 'CUBICSPLINE'
+            ):
+                values = read_accessor(doc, binary, sampler['output'])
+                sampler['output'] = builder.accessor(_quantize_unit(values, 16), SHORT, 'VEC4', normalized=True)
+            else:
+                sampler['output'] = builder.copy(doc, binary, sampler['output'])
+            samplers.append(sampler)
+        new_channels = []
+        for channel in channels:
+            channel = {**channel, 'target': dict(channel['target']), 'sampler': local_map[channel['sampler']]}
+            if channel['target'].get('node') is not None:
+                channel['target']['node'] = node_map[channel['target']['node']]
+            new_channels.append(channel)
+        animation['samplers'], animation['channels'] = samplers, new_channels
+        new_animations.append(animation)
+
+    # Images and textures.
+    normal_images = _normal_map_images(doc, set(texture_order))
+    webp_images, new_images = set(), []
+    for old in image_order:
+        image = dict(doc['images'][old])
+        payload = _image_bytes(doc, binary, image)
+        # WebP sources are only re-encoded to downscale them.
+        reencode = ('image/png', 'image/jpeg', 'image/webp') if texture_scale < 1 else ('image/png', 'image/jpeg')
+        if webp and image.get('mimeType') in reencode:
+            lossless = old in normal_images and image['mimeType'] != 'image/jpeg'
+            max_pixels = None
+            if texture_scale < 1:
+                width, height = Image.open(BytesIO(payload)).size
+                max_pixels = max(1, int(width * height * texture_scale ** 2))
+            encoded = encode_webp(
+                payload, quality=100 if lossless else texture_quality, lossless=lossless, max_pixels=max_pixels,
+            )
+            if max_pixels or len(encoded) < len(payload):
+                payload, image['mimeType'] = encoded, 'image/webp'
+                webp_images.add(image_map[old])
+                stats['textures_webp'] += 1
+        image['bufferView'] = builder.view(payload)
+        new_images.append(image)
+
+    new_textures = []
+    for old in texture_order:
+        texture = json.loads(json.dumps(doc['textures'][old]))
+        source = _texture_source(texture)
+        for extension in texture.get('extensions', {}).values():
+            if isinstance(extension, dict) and 'source' in extension:
+                extension['source'] = image_map[extension['source']]
+        if 'source' in texture:
+            texture['source'] = image_map[texture['source']]
+        if source is not None and image_map[source] in webp_images:
+            texture.pop('source', None)
+            texture.setdefault('extensions', {})[WEBP_EXTENSION] = {'source': image_map[source]}
+            extensions_used.add(WEBP_EXTENSION)
+            extensions_required.add(WEBP_EXTENSION)
+        if 'sampler' in texture:
+            texture['sampler'] = sampler_map[texture['sampler']]
+        new_textures.append(texture)
+
+    new_materials = []
+    for old in material_order:
+        material = json.loads(json.dumps(doc['materials'][old]))
+        _remap_texture_refs(material, texture_map)
+        new_materials.append(material)
+
+    out = {key: value for key, value in doc.items() if key not in (
+        'accessors', 'bufferViews', 'buffers', 'nodes', 'meshes', 'skins', 'materials', 'textures', 'images',
+        'samplers', 'animations', 'scenes', 'extensionsUsed', 'extensionsRequired',
+    )}
+    out['scenes'] = [
+        {**scene, 'nodes': [node_map[index] for index in scene.get('nodes', []) if index in node_map]}
+        for scene in doc.get('scenes', [])
+    ]
+    for key, value in (
+        ('nodes', new_nodes), ('meshes', new_meshes), ('skins', new_skins), ('materials', new_materials),
+        ('textures', new_textures), ('images', new_images),
+        ('samplers', [doc['samplers'][old] for old in sampler_order]), ('animations', new_animations),
+        ('accessors', builder.accessors), ('bufferViews', builder.views),
+    ):
+        if value:
+            out[key] = value
+    if builder.data:
+        out['buffers'] = [{'byteLength': len(builder.data)}]
+    if extensions_used:
+        out['extensionsUsed'] = sorted(extensions_used)
+    if extensions_required:
+        out['extensionsRequired'] = sorted(extensions_required)
+    generator = doc.get('asset', {}).get('generator')
+    if generator and 'optimize_models' not in generator:
+        generator = f'{generator}; optimize_models'
+    out['asset'] = {**doc.get('asset', {'version': '2.0'}), 'generator': generator or 'optimize_models'}
+
+    result = write_glb(out, builder.data)
+    stats.update(
+        bytes_after=len(result), nodes_after=len(new_nodes), animations_after=len(new_animations),
+    )
+    return result, stats
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.utils import file_digest
+from game.glb import DEFAULT_KEEP_ANIMATIONS, DEFAULT_TEXTURE_QUALITY, optimize_glb
+from game.model_assets import (
+    LOD_LEVELS,
+    MODELS_DIR,
+    OPTIMIZED_SUBDIR,
+    entry_files,
+    load_manifest,
+    manifest_path,
+)
+
+
+def lod_name(name, level):
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.lod{level}{ext}"
+
+
+def optimize_model(source_path, out_dir, options, levels):
+    """
+    Optimizes one GLB and writes the result plus one decimated copy per
+    (simplify, texture scale) in `levels`. Runs in a worker process; returns
+    [(file name, optimize_glb() stats)], full detail first.
+    """
+    with open(source_path, 'rb') as fh:
+        source = fh.read()
+    name = os.path.basename(source_path)
+    written = []
+    for level, (simplify, texture_scale) in enumerate([(1.0, 1.0)] + list(levels)):
+        data, stats = optimize_glb(source, simplify=simplify, texture_scale=texture_scale, **options)
+        out_name = lod_name(name, level) if level else name
+        out_path = os.path.join(out_dir, out_name)
+        tmp_path = f"{out_path}.tmp"
+        with open(tmp_path, 'wb') as fh:
+            fh.write(data)
+        os.replace(tmp_path, out_path)
+        written.append((out_name, stats))
+    return written
+
+
+class Command(BaseCommand):
+    help = (
+        'Writes optimized copies of the game\'s GLB models (pruned, quantized, WebP textures) and '
+        'their decimated levels of detail to models/optimized/, skipping models whose content and '
+        'settings are unchanged'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=MODELS_DIR, help='Models directory (default: game/static/game/models).')
+        parser.add_argument(
+            '--keep-animations', default=DEFAULT_KEEP_ANIMATIONS,
+            help=f'Regex of animation clips to keep; "" keeps all (default: {DEFAULT_KEEP_ANIMATIONS}).',
+        )
+        parser.add_argument('--no-quantize', action='store_true', help='Keep float vertex data.')
+        parser.add_argument('--no-webp', action='store_true', help='Keep PNG/JPEG textures.')
+        parser.add_argument(
+            '--texture-quality', type=int, default=DEFAULT_TEXTURE_QUALITY,
+            help=f'WebP quality for color textures (default: {DEFAULT_TEXTURE_QUALITY}).',
+        )
+        parser.add_argument('--no-lods', action='store_true', help='Skip the decimated levels of detail.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Processes (default: all cores).')
+        parser.add_argument('--force', action='store_true', help='Re-optimize everything, ignoring the manifest.')
+
+    def handle(self, *args, **options):
+        models_dir = options['dir']
+        if not os.path.isdir(models_dir):
+            raise CommandError(f"Directory not found: {models_dir}")
+        out_dir = os.path.join(models_dir, OPTIMIZED_SUBDIR)
+        os.makedirs(out_dir, exist_ok=True)
+
+        optimize_options = {
+            'keep_animations': options['keep_animations'],
+            'quantize': not options['no_quantize'],
+            'texture_quality': options['texture_quality'],
+            'webp': not options['no_webp'],
+        }
+        levels = [] if options['no_lods'] else list(LOD_LEVELS)
+        # Part of each entry, so changing an option re-optimizes.
+        settings_key = hashlib.sha256(json.dumps([optimize_options, levels], sort_keys=True).encode()).hexdigest()[:16]
+
+        path = manifest_path(models_dir)
+        manifest = load_manifest(path)
+        sources = sorted(name for name in os.listdir(models_dir) if name.lower().endswith('.glb'))
+        # Models that were deleted take their optimized copies with them.
+        for name in set(manifest) - set(sources):
+            self.remove_files(models_dir, entry_files(manifest.pop(name)))
+
+        pending, skipped = [], 0
+        for name in sources:
+            abs_path = os.path.join(models_dir, name)
+            digest = file_digest(abs_path)
+            entry = manifest.get(name)
+            if (
+                not options['force'] and entry and entry['sha256'] == digest and entry['settings'] == settings_key
+                and all(os.path.exists(os.path.join(models_dir, file)) for file in entry_files(entry))
+            ):
+                skipped += 1
+                continue
+            pending.append((name, abs_path, digest))
+
+        optimized = failed = 0
+        if pending:
+            workers = max(1, min(options['workers'], len(pending)))
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                futures = {
+                    executor.submit(
+                        optimize_model, abs_path, out_dir, optimize_options,
+                        [(simplify, texture_scale) for simplify, texture_scale, _distance in levels],
+                    ): (name, digest)
+                    for name, abs_path, digest in pending
+                }
+                for future in as_completed(futures):
+                    name, digest = futures[future]
+                    try:
+                        written = future.result()
+                    except Exception as e:
+                        failed += 1
+                        manifest.pop(name, None)
+                        self.stdout.write(self.style.ERROR(f"Failed to optimize {name}: {str(e)}"))
+                        continue
+                    optimized += 1
+                    previous = manifest.get(name)
+                    (out_name, stats), lods = written[0], written[1:]
+                    manifest[name] = {
+                        'sha256': digest,
+                        'settings': settings_key,
+                        'file': f'{OPTIMIZED_SUBDIR}/{out_name}',
+                        'bytes': stats['bytes_after'],
+                        'sourceBytes': stats['bytes_before'],
+                        'lods': [
+                            {
+                                'file': f'{OPTIMIZED_SUBDIR}/{lod_out}',
+                                'bytes': lod_stats['bytes_after'],
+                                'triangles': lod_stats['triangles_after'],
+                                'distance': distance,
+                            }
+                            for (lod_out, lod_stats), (_simplify, _scale, distance) in zip(lods, levels)
+                        ],
+                    }
+                    if previous:
+                        # e.g. levels of detail that are no longer generated.
+                        self.remove_files(models_dir, set(entry_files(previous)) - set(entry_files(manifest[name])))
+                    self.stdout.write(self.style.SUCCESS(
+                        f"Optimized {name}: {stats['bytes_before'] / 1024:.0f} KB -> {stats['bytes_after'] / 1024:.0f} KB "
+                        f"({stats['vertices_before']} -> {stats['vertices_after']} vertices, "
+                        f"{stats['animations_before']} -> {stats['animations_after']} animations, "
+                        f"{stats['textures_webp']} texture(s) to WebP)"
+                        + ''.join(
+                            f"; LOD {level}: {lod_stats['triangles_after']} triangles, {lod_stats['bytes_after'] / 1024:.0f} KB"
+                            for level, (_lod_out, lod_stats) in enumerate(lods, 1)
+                        )
+                    ))
+
+        self.save_manifest(path, manifest)
+        self.stdout.write(self.style.SUCCESS(f"Models: {optimized} optimized, {skipped} unchanged, {failed} failed."))
+
+    def remove_files(self, models_dir, files):
+        for file in files:
+            path = os.path.join(models_dir, file)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def save_manifest(self, path, manifest):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as fh:
+            json.dump(manifest, fh, indent=2, sort_keys=True)
+            fh.write('\n')
+        os.replace(tmp_path, path)
@@ -0,0 +1,122 @@
+"""
+Optimized character models.
+
+`manage.py optimize_models` writes a slimmed copy of every GLB in
+game/static/game/models to its optimized/ subdirectory (see game.glb), plus
+decimated levels of detail with downscaled textures, and records them in a
+manifest there. The world payload's `characterModels` points the client at
+those copies, with their real sizes and the distance from which each level is
+used, and falls back to the originals for any model that has not been
+optimized.
+"""
+import hashlib
+import json
+import os
+
+from django.conf import settings
+
+MODELS_DIR = os.path.join(settings.BASE_DIR, 'game', 'static', 'game', 'models')
+OPTIMIZED_SUBDIR = 'optimized'
+# Dotfile, so collectstatic ignores it.
+MANIFEST_NAME = '.optimize_models.json'
+# Reduced levels of detail written next to each optimized model: (fraction of
+# triangles kept, fraction of texture width, distance in world units from
+# which the client switches to it). Low-end devices start at the first one.
+LOD_LEVELS = (
+    (0.5, 0.5, 30),
+    (0.2, 0.25, 70),
+)
+
+_cache = {}
+
+
+def manifest_path(models_dir=MODELS_DIR):
+    return os.path.join(models_dir, OPTIMIZED_SUBDIR, MANIFEST_NAME)
+
+
+def entry_files(entry):
+    """
+    Every file (relative to the models directory) a manifest entry wrote.
+    """
+    return [entry['file']] + [lod['file'] for lod in entry.get('lods', ())]
+
+
+def load_manifest(path):
+    """
+    {source file name: entry}; empty if the manifest is missing or unreadable.
+    """
+    try:
+        with open(path) as fh:
+            manifest = json.load(fh)
+    except (OSError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def optimized_models(models_dir=MODELS_DIR):
+    """
+    The manifest's entries whose optimized file exists. Re-read only when the
+    manifest file changes.
+    """
+    path = manifest_path(models_dir)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    cached = _cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    models = {
+        source: entry for source, entry in load_manifest(path).items()
+        if all(os.path.exists(os.path.join(models_dir, file)) for file in entry_files(entry))
+    }
+    _cache[path] = (mtime, models)
+    return models
+
+
+def model_assets_version(models_dir=MODELS_DIR):
+    """
+    Short token that changes whenever an optimized model is added, removed or
+    rebuilt; part of the world payload's cache key and ETag.
+    """
+    models = optimized_models(models_dir)
+    raw = json.dumps(
+        {source: entry['sha256'] + entry['settings'] for source, entry in models.items()}, sort_keys=True,
+    )
+    return hashlib.sha1(raw.encode()).hexdigest()[:8]
+
+
+def character_model(model_id, source, animated=True):
+    """
+    A `characterModels` entry for models/<source>: the optimized copy when
+    there is one, else the original, and its reduced levels of detail (coarsest
+    last). Files are relative to staticBase.
+    """
+    entry = optimized_models().get(source)
+    if entry:
+        file, size = entry['file'], entry['bytes']
+    else:
+        file = source
+        try:
+            size = os.path.getsize(os.path.join(MODELS_DIR, source))
+        except OSError:
+            size = None
+    return {
+        'id': model_id,
+        'file': f'models/{file}',
+        'animated': animated,
+        'sizeMB': _megabytes(size),
+        'lods': [
+            {
+                'file': f"models/{lod['file']}",
+                'sizeMB': _megabytes(lod['bytes']),
+                'triangles': lod['triangles'],
+                'distance': lod['distance'],
+            }
+            for lod in (entry or {}).get('lods', ())
+        ],
+    }
+
+
+def _megabytes(size):
+    return round(size / (1 << 20), 2) if size else None
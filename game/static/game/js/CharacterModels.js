@@ -150,6 +150,13 @@ function countMeshes(root) {
     return n;
 }
 
+/** Meshes in traversal order — the same order in every LOD file of a model. */
+function collectMeshes(root) {
+    const meshes = [];
+    root.traverse(obj => { if (obj.isMesh) meshes.push(obj); });
+    return meshes;
+}
+
 function createProceduralBody(gender = 'male', type = 'human') {
     const body = new THREE.Group();
     body.name = 'proceduralBody';
@@ -308,8 +315,54 @@ export function getRandomBodyKey() {
     return BODY_KEYS[Math.random() < 0.5 ? 0 : 1];
 }
 
-export async function preloadCharacterModels(baseUrl, onProgress) {
-    const entries = MODEL_KEYS.map(key => ({ key, cfg: MODEL_CATALOG[key] }));
+/** Phones and small devices: start one level of detail down (smaller meshes and textures). */
+export function isLowEndDevice() {
+    const memory = navigator.deviceMemory;
+    if (memory && memory <= 4) return true;
+    const cores = navigator.hardwareConcurrency || 8;
+    return cores <= 4 && window.matchMedia?.('(pointer: coarse)').matches;
+}
+
+/**
+ * Server LOD entry point for a model: the low-end device class loads the first
+ * reduced level as its full-detail model; the remaining levels are swapped in
+ * by distance (updateCharacterLod).
+ */
+function resolveModelConfig(key, served, lowEnd) {
+    const base = MODEL_CATALOG[key];
+    if (!served) return { ...base, lods: [] };
+    const lods = served.lods || [];
+    const first = lowEnd && lods.length ? lods[0] : served;
+    return {
+        ...base,
+        file: first.file,
+        sizeMB: first.sizeMB ?? base.sizeMB,
+        lods: lowEnd ? lods.slice(1) : lods,
+    };
+}
+
+async function loadLodGeometries(id, baseUrl, lods) {
+    for (const lod of lods) {
+        try {
+            const gltf = await fetchAndParseGlb(resolveUrl(baseUrl, lod.file));
+            prepareMeshes(gltf.scene);
+            lod.geometries = collectMeshes(gltf.scene).map(m => m.geometry);
+        } catch (err) {
+            console.warn(`[CharacterModels] LOD ${lod.file} for ${id}:`, err.message || err);
+            return;
+        }
+    }
+}
+
+/**
+ * @param {object} [models] — the world payload's `characterModels`; its entries
+ * point at the server-optimized GLBs (and their real sizes) and their levels
+ * of detail where available.
+ */
+export async function preloadCharacterModels(baseUrl, onProgress, models = null) {
+    const served = new Map((models?.humans || []).map(m => [m.id, m]));
+    const lowEnd = isLowEndDevice();
+    const entries = MODEL_KEYS.map(key => ({ key, cfg: resolveModelConfig(key, served.get(key), lowEnd) }));
     const errors = [];
     let done = 0;
 
@@ -323,13 +376,18 @@ export async function preloadCharacterModels(baseUrl, onProgress) {
             const gltf = await fetchAndParseGlb(url);
             prepareMeshes(gltf.scene);
             normalizeHeight(gltf.scene, cfg.targetHeight);
+            const lods = cfg.lods.map(lod => ({ file: lod.file, distance: lod.distance, geometries: null }));
             _cache.set(id, {
                 scene: gltf.scene,
                 animations: gltf.animations || [],
                 animationNames: (gltf.animations || []).map(c => c.name),
                 targetHeight: cfg.targetHeight,
                 slots: cfg.slots,
+                geometries: collectMeshes(gltf.scene).map(m => m.geometry),
+                lods,
             });
+            // Lower levels are only needed once NPCs are far away: load them in the background.
+            loadLodGeometries(id, baseUrl, lods);
         } catch (err) {
             console.error(`[CharacterModels] ${key}:`, err.message || err);
             errors.push({ key, error: err });
@@ -444,6 +502,9 @@ export function createCharacterInstance(type, modelKey, opts = {}) {
 
     const model = cloneSkinnedModel(cached.scene);
     root.add(model);
+    // Before any accessory is attached, so the list matches the LOD files' meshes.
+    root.userData.lodMeshes = collectMeshes(model);
+    root.userData.lodLevel = 0;
 
     // Attach procedural anime-style glasses matching the sketch
     addGlassesToHead(model);
@@ -471,6 +532,7 @@ export function createCharacterInstance(type, modelKey, opts = {}) {
         console.warn(`[CharacterModels] Rig empty after clone — procedural body for ${humanKey}`);
         root.remove(model);
         root.add(createProceduralBody(humanKey, type));
+        root.userData.lodMeshes = null;
         root.userData.isFallback = true;
         root.userData.isRigged = false;
         root.userData.isStaticModel = true;
@@ -503,6 +565,25 @@ export function cycleOutfitPreset(avatar, delta = 1) {
     return applyOutfitPreset(avatar, next);
 }
 
+/** Swaps in the geometry of the coarsest loaded level whose distance `distance` has reached. */
+export function updateCharacterLod(avatar, distance) {
+    const meshes = avatar.userData.lodMeshes;
+    if (!meshes) return;
+    const cached = _cache.get(`human:${avatar.userData.modelKey}`);
+    if (!cached?.lods.length) return;
+
+    let level = 0;
+    cached.lods.forEach((lod, i) => {
+        if (lod.geometries && distance >= lod.distance) level = i + 1;
+    });
+    if (level === avatar.userData.lodLevel) return;
+
+    const geometries = level ? cached.lods[level - 1].geometries : cached.geometries;
+    if (geometries.length !== meshes.length) return;
+    meshes.forEach((mesh, i) => { mesh.geometry = geometries[i]; });
+    avatar.userData.lodLevel = level;
+}
+
 export function updateCharacterAnimator(avatar, dt) {
     if (avatar.userData.mixer) avatar.userData.mixer.update(dt);
 }
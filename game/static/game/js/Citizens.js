@@ -7,7 +7,9 @@ import {
     animateCyclist,
 } from './AvatarFactory.js';
 import { isRiggedAvatar, playEmote } from './CharacterAnimator.js';
-import { getBodyKeyForCitizen, floorYForAvatar, refreshGroundLift, getGroundLift } from './CharacterModels.js';
+import {
+    getBodyKeyForCitizen, floorYForAvatar, refreshGroundLift, getGroundLift, updateCharacterLod,
+} from './CharacterModels.js';
 
 const HUMAN_NAMES = ['Alex', 'Jordan', 'Sam', 'Riley', 'Casey', 'Morgan', 'Taylor', 'Jamie', 'Quinn', 'Avery'];
 const ALIEN_NAMES = ['Zyx', 'Nara', 'Kov', 'Eli', 'Pax', 'Ryn', 'Oma', 'Dex', 'Vex', 'Luma', 'Kira', 'Zeno'];
@@ -367,6 +369,7 @@ export class CitizenManager {
                     c.mesh.visible = !veryFar;
                     if (veryFar) return;
                 }
+                updateCharacterLod(c.mesh, Math.sqrt(d2));
                 if (far && ((this._frame + idx) & 1) === 0) return;
                 if (far) stepDt = dt * 2;
             }
@@ -101,7 +101,7 @@ class Game {
         const base = this.data.staticBase || '/static/game/';
         const result = await preloadCharacterModels(base, (pct, id, label) => {
             this._setLoadProgress(pct, id, label);
-        });
+        }, this.data.characterModels);
 
         if (!hasCriticalModels()) {
             const hint = result.errors[0]?.error?.message?.includes('LFS')
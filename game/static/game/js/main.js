@@ -105,7 +105,7 @@ class Game {
         const base = this.data.staticBase || '/static/game/';
         const result = await preloadCharacterModels(base, (pct, id, label) => {
             this._setLoadProgress(pct, id, label);
-        });
+        }, this.data.characterModels);
 
         if (!hasCriticalModels()) {
             const hint = result.errors[0]?.error?.message?.includes('LFS')
@@ -478,21 +478,24 @@ class Game {
     }
 }
 
-function loadGameData() {
-    const el = document.getElementById('game-data');
-    if (!el || !el.textContent) {
-        console.error('[game] #game-data missing — using defaults');
-        return {
-            siteName: 'ALIENHOUSE', email: '', team: [], services: [], projects: [],
-            about: [], hero: {}, transitDestinations: [], welcome: {},
-        };
+async function loadGameData() {
+    // World content is served separately (/game/api/world.json) so it can be
+    // revalidated with a 304 instead of re-downloaded with every page load.
+    const src = document.getElementById('game-data-src');
+    try {
+        const res = await fetch(src.href, { credentials: 'same-origin' });
+        if (res.ok) return await res.json();
+        console.error(`[game] world data request failed (${res.status}) — using defaults`);
+    } catch (err) {
+        console.error('[game] world data request failed — using defaults', err);
     }
-    let data = JSON.parse(el.textContent);
-    if (typeof data === 'string') data = JSON.parse(data);
-    return data;
+    return {
+        siteName: 'ALIENHOUSE', email: '', team: [], services: [], projects: [],
+        about: [], hero: {}, transitDestinations: [], welcome: {},
+    };
 }
 
 addEventListener('DOMContentLoaded', async () => {
-    const game = new Game(loadGameData());
+    const game = new Game(await loadGameData());
     await game.initCharacters();
 });
\ No newline at end of file
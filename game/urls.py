@@ -4,4 +4,5 @@ from . import views
 
 urlpatterns = [
     path('', views.world, name='game_world'),
-]
\ No newline at end of file
+    path('api/world.json', views.world_data, name='game_world_data'),
+]
@@ -1,6 +1,15 @@
+import gzip
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseNotModified
 from django.shortcuts import render
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django.utils.html import strip_tags
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_safe
 
+from core.cache import cached_snapshot, content_version
 from core.models import (
     AboutUs,
     BusinessTeamMember,
@@ -10,6 +19,14 @@ from core.models import (
     SiteConfiguration,
     TacticalAdvantage,
 )
+from core.static_compression import accepted_encodings
+
+from .model_assets import character_model, model_assets_version
+
+try:
+    import brotli
+except ImportError:  # optional: payload is still served gzip/identity without it
+    brotli = None
 
 SOFTWARE_KEYS = ('software', 'develop', 'code', 'ai', 'web', 'app', 'cloud', 'data', 'tech', 'engineer', 'program')
 MARKETING_KEYS = ('market', 'brand', 'seo', 'social', 'content', 'design', 'media', 'creative', 'advert')
@@ -348,7 +365,13 @@ def _build_transit_destinations(buildings, about_us, site_name):
     return destinations
 
 
-def world(request):
+# Every model the world payload reads; a change to any of them recompiles it.
+GAME_WORLD_MODELS = (
+    Service, Project, BusinessTeamMember, AboutUs, TacticalAdvantage, HeroSection, SiteConfiguration,
+)
+
+
+def _build_game_data():
     site_config = SiteConfiguration.objects.first()
     hero = HeroSection.objects.first()
     services = Service.objects.filter(is_active=True).order_by('order')
@@ -442,14 +465,81 @@ def world(request):
         'staticBase': '/static/game/',
         'characterModels': {
             'humans': [
-                {'id': 'male', 'file': 'models/quaternius_cc0-male-character-1354.glb', 'animated': True},
-                {'id': 'female', 'file': 'models/quaternius_cc0-female-character-1350.glb', 'animated': True},
+                character_model('male', 'quaternius_cc0-male-character-1354.glb'),
+                character_model('female', 'quaternius_cc0-female-character-1350.glb'),
             ],
         },
     }
 
-    context = {
-        'config': site_config,
-        'game_data': game_data,
+    return game_data
+
+
+def _compile_world_payload():
+    """
+    Builds game_data once and keeps every representation world_data serves:
+    compact JSON, pre-compressed with gzip and brotli, so nothing is
+    serialized or compressed per request.
+    """
+    game_data = _build_game_data()
+    body = json.dumps(game_data, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+
+    return {
+        'json': body,
+        'gzip': gzip.compress(body, compresslevel=9),
+        'br': brotli.compress(body, quality=11) if brotli else None,
     }
-    return render(request, 'game/world.html', context)
\ No newline at end of file
+
+
+def get_world_payload():
+    # Rebuilding the optimized models changes the payload without touching the DB.
+    return cached_snapshot(f'game-world:{model_assets_version()}', GAME_WORLD_MODELS, _compile_world_payload)
+
+
+def _negotiate_encoding(request, payload):
+    accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    if payload['br'] is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return 'identity'
+
+
+def world(request):
+    # The page is only a bootstrap: main.js fetches world_data below, so the HTML
+    # stays the same when content changes. 'config' comes from the context processor.
+    return render(request, 'game/world.html')
+
+
+@require_safe
+def world_data(request):
+    """
+    The game world description as JSON, revalidated with a strong ETag.
+    The ETag is the content version of GAME_WORLD_MODELS and of the optimized
+    character models (plus the coding, since each coding is a different byte
+    sequence), so a revalidation is a single cache lookup and a 304 — the
+    payload itself is not even loaded.
+    """
+    version = f'{content_version(GAME_WORLD_MODELS)}-{model_assets_version()}'
+    encodings = ('br', 'gzip', 'identity')
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+
+    for encoding in encodings:
+        etag = f'"{version}-{encoding}"'
+        if etag in if_none_match or '*' in if_none_match:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            break
+    else:
+        payload = get_world_payload()
+        encoding = _negotiate_encoding(request, payload)
+        body = payload['json'] if encoding == 'identity' else payload[encoding]
+
+        response = HttpResponse(body, content_type='application/json')
+        if encoding != 'identity':
+            response['Content-Encoding'] = encoding
+        response['ETag'] = f'"{version}-{encoding}"'
+
+    # no-cache = store, but revalidate on every load (cheap thanks to the ETag)
+    patch_cache_control(response, public=True, no_cache=True)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
\ No newline at end of file
@@ -0,0 +1,165 @@
+#!/usr/bin/env node
+// Front-end build: compiles core/assets/tailwind.css against the class names
+// used in the templates, Python widget attrs and JS, minified.
+//
+// The output goes to core/static/core/dist/ (not tracked in git) and is
+// recorded in core/static/core/dist/manifest.json, which the {% asset %}
+// template tag reads. Content hashing is left to collectstatic (core.storage.
+// HashedStaticFilesStorage), so file names here stay stable.
+//
+// Run with `npm ci && python manage.py build_frontend` (deploy.sh does, before
+// collectstatic).
+import fs from 'node:fs/promises';
+import path from 'node:path';
+import { createRequire } from 'node:module';
+import { fileURLToPath } from 'node:url';
+import { compile } from 'tailwindcss';
+
+const ROOT = path.resolve(path.dirname(fileURLToPath(import.meta.url)), '..');
+const MANIFEST = path.join(ROOT, 'core', 'static', 'core', 'dist', 'manifest.json');
+
+const TAILWIND_INPUT = path.join(ROOT, 'core', 'assets', 'tailwind.css');
+// Where class names can appear.
+const CONTENT = [
+    { dir: 'core/templates', extensions: ['.html'] },
+    { dir: 'game/templates', extensions: ['.html'] },
+    { dir: 'core', extensions: ['.py'], skip: ['migrations', 'static', 'templates'] },
+    { dir: 'game', extensions: ['.py'], skip: ['migrations', 'static', 'templates'] },
+    { dir: 'core/static', extensions: ['.js', '.mjs'], skip: ['dist'] },
+    { dir: 'game/static', extensions: ['.js', '.mjs'] },
+];
+
+const require = createRequire(import.meta.url);
+
+async function* walk(dir, extensions, skip = []) {
+    let entries;
+    try {
+        entries = await fs.readdir(dir, { withFileTypes: true });
+    } catch (error) {
+        if (error.code === 'ENOENT') return;
+        throw error;
+    }
+    for (const entry of entries.sort((a, b) => a.name.localeCompare(b.name))) {
+        const full = path.join(dir, entry.name);
+        if (entry.isDirectory()) {
+            if (!skip.includes(entry.name) && !entry.name.startsWith('.')) yield* walk(full, extensions, skip);
+        } else if (extensions.includes(path.extname(entry.name))) {
+            yield full;
+        }
+    }
+}
+
+// Every token that could be a class name. Tailwind ignores the ones that are
+// not utilities, so over-matching only costs build time.
+async function scanCandidates() {
+    const candidates = new Set();
+    let files = 0;
+    for (const { dir, extensions, skip } of CONTENT) {
+        for await (const file of walk(path.join(ROOT, dir), extensions, skip)) {
+            files += 1;
+            const text = await fs.readFile(file, 'utf8');
+            for (const token of text.split(/[\s"'`<>{}\\]+/)) {
+                const candidate = token.replace(/^[(,;]+|[),;]+$/g, '');
+                if (candidate && candidate.length < 200) candidates.add(candidate);
+            }
+        }
+    }
+    return { candidates, files };
+}
+
+async function loadStylesheet(id, base) {
+    const file = id === 'tailwindcss'
+        ? path.join(path.dirname(require.resolve('tailwindcss/package.json')), 'index.css')
+        : path.resolve(base, id);
+    return { path: file, base: path.dirname(file), content: await fs.readFile(file, 'utf8') };
+}
+
+// Index of the brace closing the block opened at `open`, skipping strings and
+// comments.
+function closingBrace(css, open) {
+    let depth = 0;
+    for (let i = open; i < css.length; i++) {
+        const c = css[i];
+        if (c === '"' || c === "'") {
+            i = css.indexOf(c, i + 1);
+        } else if (c === '/' && css[i + 1] === '*') {
+            i = css.indexOf('*/', i + 2) + 1;
+        } else if (c === '{') {
+            depth += 1;
+        } else if (c === '}' && --depth === 0) {
+            return i;
+        }
+    }
+    throw new Error('Unbalanced braces in compiled CSS');
+}
+
+// Tailwind 4 puts its output in cascade layers, which lose to any unlayered
+// rule. The templates' own <style> blocks were written for the Tailwind 3 CDN,
+// whose utilities were unlayered and loaded last, so unwrap the top-level
+// layers (keeping their order) to preserve that cascade.
+function unwrapLayers(css) {
+    let out = '';
+    let i = 0;
+    const layer = /@layer\s+[\w-]+\s*\{|@layer\s+[\w\s,-]+;/g;
+    let match;
+    while ((match = layer.exec(css))) {
+        if (match.index < i) continue;
+        out += css.slice(i, match.index);
+        if (match[0].endsWith(';')) {
+            i = match.index + match[0].length;
+        } else {
+            const open = match.index + match[0].length - 1;
+            const close = closingBrace(css, open);
+            out += css.slice(open + 1, close);
+            i = close + 1;
+        }
+        layer.lastIndex = i;
+    }
+    return out + css.slice(i);
+}
+
+function minify(css) {
+    return css
+        .replace(/\/\*[\s\S]*?\*\//g, '')
+        .replace(/\s+/g, ' ')
+        .replace(/\s*([{};,>])\s*/g, '$1')
+        .replace(/;}/g, '}')
+        .trim();
+}
+
+// Writes an asset to <app>/static/<staticPath> and records it in the manifest.
+async function writeAsset(manifest, name, app, staticPath, content) {
+    const file = path.join(ROOT, app, 'static', staticPath);
+    await fs.mkdir(path.dirname(file), { recursive: true });
+    await fs.writeFile(file, content);
+    manifest[name] = staticPath;
+    return `${name}: ${staticPath} (${(Buffer.byteLength(content) / 1024).toFixed(1)} KB)`;
+}
+
+async function buildTailwind(manifest) {
+    const input = await fs.readFile(TAILWIND_INPUT, 'utf8');
+    const compiler = await compile(input, { base: path.dirname(TAILWIND_INPUT), loadStylesheet });
+    const { candidates, files } = await scanCandidates();
+    const css = minify(unwrapLayers(compiler.build([...candidates])));
+    console.log(await writeAsset(manifest, 'tailwind.css', 'core', 'core/dist/tailwind.css', css), `from ${files} files`);
+}
+
+async function readManifest() {
+    try {
+        return JSON.parse(await fs.readFile(MANIFEST, 'utf8'));
+    } catch (error) {
+        if (error.code === 'ENOENT') return {};
+        throw error;
+    }
+}
+
+try {
+    const manifest = await readManifest();
+    await buildTailwind(manifest);
+    await fs.mkdir(path.dirname(MANIFEST), { recursive: true });
+    const sorted = Object.fromEntries(Object.entries(manifest).sort(([a], [b]) => a.localeCompare(b)));
+    await fs.writeFile(MANIFEST, JSON.stringify(sorted, null, 2) + '\n');
+} catch (error) {
+    console.error(error.message);
+    process.exit(1);
+}